@@ -0,0 +1,4 @@
+"""NLGHI — Newfoundland & Labrador Geriatric Health Index.
+
+nlghi.core is the headless engine; nlghi.gui is the PyQt5 desktop app.
+"""
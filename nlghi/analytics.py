@@ -0,0 +1,437 @@
+"""Cohort analytics over every patient's visit records.
+
+All records are loaded once into columnar NumPy arrays (patient id, session
+date ordinal, 27 impairment ratings, GHI) and every statistic is computed
+on those columns. cohort() keeps the arrays until the storage engine's data
+version changes, so repeated queries cost no I/O.
+
+trajectories() derives per-patient GHI trajectory metrics from the same
+columns and keeps them in sorted lists for top-K and threshold queries.
+Writes made through DATASTORE re-score only the patients they touch.
+
+scan_symptoms() runs the symptom checker over every history and note body
+in a process pool and sets the per-patient domain votes against the latest
+ratings, flagging domains the narrative suggests but the record rates 0.
+Votes are cached per entry by a hash of its text, so a re-run only analyzes
+entries that are new or edited.
+"""
+from __future__ import annotations
+
+import hashlib, json, math, os
+from bisect import bisect_left, insort
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .core import (DATASTORE, DOMAIN_LIST, DOMAIN_VALUES, SYMPTOM_LEXICON, get_store, records_matrix,
+                   score_impairments, symptom_domain_votes)
+
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+
+class Cohort:
+    """Columnar view of all records; one row per visit.
+
+    mcps[patient[i]] is the MCP of row i, day[i] its session date as a
+    date ordinal (-1 if missing or unparsable), impairments[i] its ratings
+    and ghi[i] the GHI recomputed from them. Rows whose impairments are
+    malformed are dropped.
+    """
+
+    def __init__(self, mcps: List[str], patient: np.ndarray, day: np.ndarray, impairments: np.ndarray, ghi: np.ndarray):
+        self.mcps = mcps
+        self.patient = patient
+        self.day = day
+        self.impairments = impairments
+        self.ghi = ghi
+
+    @classmethod
+    def from_records(cls, rows) -> "Cohort":
+        """Build from an iterable of (mcp, record)."""
+        ids: Dict[str, int] = {}
+        pid, days, recs = [], [], []
+        for mcp, r in rows:
+            pid.append(ids.setdefault(mcp, len(ids)))
+            try: days.append(date.fromisoformat(r.get("session_date")).toordinal())
+            except (TypeError, ValueError): days.append(-1)
+            recs.append(r)
+        imp, ok = records_matrix(recs, "impairments")
+        ok &= (imp >= 0).all(axis=1) & (imp <= 5).all(axis=1)
+        imp = imp[ok].astype(np.uint8)
+        return cls(list(ids), np.asarray(pid, dtype=np.int32)[ok], np.asarray(days, dtype=np.int32)[ok],
+                   imp, score_impairments(imp)[1])
+
+    def __len__(self):
+        return len(self.ghi)
+
+    @property
+    def patients(self) -> int:
+        """Patients with at least one usable record."""
+        return len(np.unique(self.patient))
+
+    def latest(self) -> np.ndarray:
+        """Row index of each patient's latest visit (by session date, then entry order)."""
+        if not len(self): return np.zeros(0, dtype=np.int64)
+        order = np.lexsort((np.arange(len(self)), self.day, self.patient))
+        last = np.r_[self.patient[order][1:] != self.patient[order][:-1], True]
+        return order[last]
+
+    def _rows(self, latest_only: bool) -> np.ndarray:
+        return self.latest() if latest_only else np.arange(len(self))
+
+    def ghi_histogram(self, bins: int = 20, latest_only: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """(counts, bin edges) of GHI over the 0-max possible range."""
+        top = np.ceil(5 * sum(DOMAIN_VALUES) / len(DOMAIN_LIST) * 1e4) / 1e4  # GHI is stored rounded to 4 places
+        return np.histogram(self.ghi[self._rows(latest_only)], bins=bins, range=(0.0, top))
+
+    def ghi_percentiles(self, q: Sequence[float] = PERCENTILES, latest_only: bool = False) -> Dict[float, float]:
+        vals = self.ghi[self._rows(latest_only)]
+        if not len(vals): return {p: float("nan") for p in q}
+        return dict(zip(q, np.percentile(vals, q).round(4).tolist()))
+
+    def domain_means(self, latest_only: bool = False) -> Dict[str, float]:
+        """Mean impairment rating per domain."""
+        rows = self._rows(latest_only)
+        if not len(rows): return {d: float("nan") for d in DOMAIN_LIST}
+        return dict(zip(DOMAIN_LIST, self.impairments[rows].mean(axis=0).round(4).tolist()))
+
+    def prevalence(self, window_days: int = 365, threshold: int = 1, start: Optional[date] = None) -> List[Dict[str, object]]:
+        """Per time window: patients seen and the share of them impaired in each domain.
+
+        A patient counts as impaired in a domain for a window when any of
+        their visits in that window rates it >= threshold. Windows are
+        window_days long starting at `start` (default: the earliest visit).
+        """
+        dated = np.flatnonzero(self.day >= 0)
+        if not len(dated): return []
+        origin = start.toordinal() if start else int(self.day[dated].min())
+        dated = dated[self.day[dated] >= origin]
+        if not len(dated): return []
+        win = (self.day[dated] - origin) // window_days
+        # one row per (window, patient): max rating per domain via reduceat over the sorted keys
+        order = np.lexsort((self.patient[dated], win))
+        rows, win, pat = dated[order], win[order], self.patient[dated][order]
+        starts = np.flatnonzero(np.r_[True, (win[1:] != win[:-1]) | (pat[1:] != pat[:-1])])
+        worst = np.maximum.reduceat(self.impairments[rows], starts, axis=0) >= threshold
+        group_win = win[starts]
+        out = []
+        for w in np.unique(group_win).tolist():
+            sel = group_win == w
+            n = int(sel.sum())
+            out.append({"start": date.fromordinal(origin + w * window_days), "patients": n,
+                        "prevalence": dict(zip(DOMAIN_LIST, (worst[sel].sum(axis=0) / n).round(4).tolist()))})
+        return out
+
+    def summary(self, top_domains: int = 5) -> str:
+        """Plain-text cohort report used by the Cohort dialog and the CLI."""
+        if not len(self): return "No scorable records."
+        lines = [f"Patients: {self.patients}   Visits: {len(self)}", "", "GHI percentiles (all visits / latest visit per patient):"]
+        allp, latest = self.ghi_percentiles(), self.ghi_percentiles(latest_only=True)
+        lines += [f"  p{q:<3} {allp[q]:>8.4f} {latest[q]:>8.4f}" for q in PERCENTILES]
+        means = sorted(self.domain_means(latest_only=True).items(), key=lambda kv: -kv[1])
+        lines += ["", f"Highest mean impairment (latest visit), top {top_domains}:"]
+        lines += [f"  {d}: {v:.2f}" for d, v in means[:top_domains]]
+        lines += ["", "Patients seen per year and share impaired (>=1) in the top domains:"]
+        for w in self.prevalence():
+            shares = ", ".join(f"{d} {w['prevalence'][d]:.0%}" for d, _ in means[:3])
+            lines.append(f"  {w['start']}  n={w['patients']:<6} {shares}")
+        return "\n".join(lines)
+
+
+_CACHE: Tuple[object, Optional[Cohort]] = (None, None)
+
+def cohort(store=None) -> Cohort:
+    """The cohort for the active engine, rebuilt only when its data version changes."""
+    global _CACHE
+    if store is None:
+        DATASTORE.flush(); store = get_store()
+    version = store.version()
+    key = (id(store), version)
+    if version is None or _CACHE[0] != key or _CACHE[1] is None:
+        _CACHE = (key, Cohort.from_records(store.iter_records()))
+    return _CACHE[1]
+
+
+TRAJECTORY_METRICS = ("slope", "last_delta", "volatility", "days_since")
+_SORT_KEYS = ("slope", "last_delta", "volatility", "last_day")
+
+
+def trajectory_columns(c: Cohort) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Per-patient trajectory metrics over dated visits, in one vectorized pass.
+
+    Returns (patient ids, columns) where the columns are visits, slope (GHI
+    per year, least squares), last_delta (change at the latest visit),
+    volatility (std of visit-to-visit changes) and last_day (date ordinal of
+    the latest visit). Metrics that need two visits are NaN for patients
+    with one; slope is also NaN when all visits share a date.
+    """
+    rows = np.flatnonzero(c.day >= 0)
+    if not len(rows):
+        return np.zeros(0, dtype=np.int32), {k: np.zeros(0) for k in ("visits",) + _SORT_KEYS}
+    rows = rows[np.lexsort((rows, c.day[rows], c.patient[rows]))]
+    pat, day, y = c.patient[rows], c.day[rows], c.ghi[rows].astype(np.float64)
+    first = np.r_[True, pat[1:] != pat[:-1]]
+    starts = np.flatnonzero(first)
+    n = np.diff(np.r_[starts, len(rows)])
+    last = starts + n - 1
+    x = (day - np.repeat(day[starts], n)) / 365.25  # years since the first visit keeps the sums well conditioned
+    sx, sy, sxx, sxy = (np.add.reduceat(v, starts) for v in (x, y, x * x, x * y))
+    step = np.r_[0.0, np.diff(y)]; step[first] = 0.0
+    s1, s2 = np.add.reduceat(step, starts), np.add.reduceat(step * step, starts)
+    m = n - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        den = n * sxx - sx * sx
+        slope = np.where(den > 1e-12, (n * sxy - sx * sy) / den, np.nan)
+        vol = np.where(m > 0, np.sqrt(np.maximum(s2 / m - (s1 / m) ** 2, 0.0)), np.nan)
+    delta = np.where(m > 0, y[last] - y[np.maximum(last - 1, 0)], np.nan)
+    return pat[starts], {"visits": n, "slope": slope, "last_delta": delta, "volatility": vol, "last_day": day[last]}
+
+
+class TrajectoryIndex:
+    """Per-patient trajectory metrics with a sorted list of (value, mcp) per metric.
+
+    days_since (days since the latest visit) is answered from the sorted
+    last visit dates, so it never goes stale as the calendar moves on.
+    """
+
+    def __init__(self):
+        self._rows: Dict[str, Tuple[int, float, float, float, int]] = {}
+        self._sorted: Dict[str, List[Tuple[float, str]]] = {k: [] for k in _SORT_KEYS}
+
+    @classmethod
+    def build(cls, c: Cohort) -> "TrajectoryIndex":
+        self = cls()
+        pid, cols = trajectory_columns(c)
+        mcps = [c.mcps[i] for i in pid.tolist()]
+        lists = [cols[k].tolist() for k in ("visits",) + _SORT_KEYS]
+        self._rows = dict(zip(mcps, zip(*lists)))
+        for k in _SORT_KEYS:
+            v = cols[k]
+            keep = np.flatnonzero(~np.isnan(v)) if v.dtype.kind == "f" else np.arange(len(v))
+            keep = keep[np.argsort(v[keep], kind="stable")]
+            self._sorted[k] = sorted(zip(v[keep].tolist(), (mcps[i] for i in keep.tolist())))
+        return self
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, mcp):
+        return mcp in self._rows
+
+    def _drop(self, mcp: str):
+        row = self._rows.pop(mcp, None)
+        if row is None: return
+        for k, v in zip(_SORT_KEYS, row[1:]):
+            if v == v:  # NaN is never indexed
+                lst = self._sorted[k]; del lst[bisect_left(lst, (v, mcp))]
+
+    def update(self, mcp: str, records: Optional[List[Dict[str, Any]]]):
+        """Re-score one patient from its records (None when the patient was deleted)."""
+        self._drop(mcp)
+        if not records: return
+        pid, cols = trajectory_columns(Cohort.from_records((mcp, r) for r in records))
+        if not len(pid): return
+        row = tuple(cols[k][0].item() for k in ("visits",) + _SORT_KEYS)
+        self._rows[mcp] = row
+        for k, v in zip(_SORT_KEYS, row[1:]):
+            if v == v: insort(self._sorted[k], (v, mcp))
+
+    def get(self, mcp: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        row = self._rows.get(mcp)
+        if row is None: return None
+        visits, slope, delta, vol, last_day = row
+        today = (today or date.today()).toordinal()
+        return {"visits": visits, "slope": slope, "last_delta": delta, "volatility": vol,
+                "last_visit": date.fromordinal(last_day).isoformat(), "days_since": today - last_day}
+
+    def top(self, metric: str, k: int = 10, largest: bool = True, limit: Optional[float] = None,
+            today: Optional[date] = None) -> List[Tuple[str, float]]:
+        """The k patients with the largest (or smallest) metric as (mcp, value).
+
+        limit keeps only values >= limit when largest, <= limit otherwise,
+        e.g. top("slope", 50, limit=0.5) lists patients whose GHI rises by
+        at least 0.5 a year, steepest first.
+        """
+        if metric not in TRAJECTORY_METRICS:
+            raise ValueError(f"Unknown trajectory metric: {metric}")
+        to_value = lambda v: v
+        if metric == "days_since":  # most days since == earliest last visit
+            t = (today or date.today()).toordinal()
+            metric, largest, to_value = "last_day", not largest, (lambda v: t - v)
+            if limit is not None: limit = t - limit
+        lst = self._sorted[metric]
+        lo, hi = 0, len(lst)
+        if limit is not None:
+            if largest: lo = bisect_left(lst, (limit,))
+            else: hi = bisect_left(lst, (math.nextafter(limit, math.inf),))
+        picked = lst[max(lo, hi - k):hi][::-1] if largest else lst[lo:min(hi, lo + k)]
+        return [(mcp, to_value(v)) for v, mcp in picked]
+
+
+_TRAJECTORIES: Tuple[object, Optional[TrajectoryIndex]] = (None, None)
+
+def trajectories(store=None) -> TrajectoryIndex:
+    """Trajectory index for the active engine; built once, then kept current by DATASTORE writes."""
+    global _TRAJECTORIES
+    if store is None:
+        DATASTORE.flush(); store = get_store()
+    key = (id(store), store.version())
+    if key[1] is None or _TRAJECTORIES[0] != key or _TRAJECTORIES[1] is None:
+        _TRAJECTORIES = (key, TrajectoryIndex.build(cohort(store)))
+    return _TRAJECTORIES[1]
+
+def _on_write(mcps, token):
+    global _TRAJECTORIES
+    key, index = _TRAJECTORIES
+    if index is None or key[0] != token[0]: return
+    for mcp in mcps:
+        p = DATASTORE.get_patient(mcp, ("records",))
+        index.update(mcp, p["records"] if p else None)
+    if token[1] is not None:
+        _TRAJECTORIES = (token, index)
+
+DATASTORE.listeners.append(_on_write)
+
+
+SYMPTOM_CACHE_FILE = "nlghi_symptom_votes.npz"
+NARRATIVE_SECTIONS = ("history", "notes")
+
+
+def _lexicon_key() -> str:
+    return hashlib.blake2b(json.dumps(sorted(SYMPTOM_LEXICON.items())).encode(), digest_size=8).hexdigest()
+
+def _text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def symptom_votes(texts: Sequence[str]) -> np.ndarray:
+    """(len(texts) x 27) uint8: symptom_domain_votes() for each text, as analyze_symptoms() counts them."""
+    out = np.zeros((len(texts), len(DOMAIN_LIST)), dtype=np.uint8)
+    for i, text in enumerate(texts):
+        out[i] = symptom_domain_votes(text)[1]
+    return out
+
+
+class SymptomScan:
+    """Symptom-checker votes per patient next to the latest ratings.
+
+    votes[i, d] sums, over the history and note entries of mcps[i], the
+    votes analyze_symptoms() gives domain d for that entry's body. latest[i]
+    holds the ratings of the patient's last entered record, -1 where there
+    is no usable record.
+    """
+
+    def __init__(self, mcps: List[str], votes: np.ndarray, latest: np.ndarray):
+        self.mcps = mcps
+        self.votes = votes
+        self.latest = latest
+
+    def __len__(self):
+        return len(self.mcps)
+
+    def flags(self, min_votes: int = 1) -> np.ndarray:
+        """(N x 27) bool: the narrative has at least min_votes for a domain the latest record rates 0."""
+        return (self.votes >= min_votes) & (self.latest == 0)
+
+    def flagged(self, min_votes: int = 1) -> List[Tuple[str, List[int]]]:
+        """(mcp, flagged domain indices) for every patient with a flag, in registry order."""
+        f = self.flags(min_votes)
+        return [(self.mcps[i], np.flatnonzero(f[i]).tolist()) for i in np.flatnonzero(f.any(axis=1)).tolist()]
+
+
+_VOTE_CACHE: Tuple[Optional[str], Dict[bytes, bytes]] = (None, {})
+
+def _vote_cache() -> Dict[bytes, bytes]:
+    """text digest -> 27 vote bytes, loaded from SYMPTOM_CACHE_FILE on first use."""
+    global _VOTE_CACHE
+    path, cache = _VOTE_CACHE
+    if path != SYMPTOM_CACHE_FILE:
+        cache = {}
+        if os.path.exists(SYMPTOM_CACHE_FILE):
+            try:
+                with np.load(SYMPTOM_CACHE_FILE) as z:
+                    if str(z["lexicon"]) == _lexicon_key():
+                        keys, rows, n = z["digests"].tobytes(), z["votes"].tobytes(), len(DOMAIN_LIST)
+                        cache = {keys[16 * i:16 * i + 16]: rows[n * i:n * i + n] for i in range(len(keys) // 16)}
+            except (OSError, ValueError, KeyError):
+                cache = {}  # unreadable or from another lexicon: start over
+        _VOTE_CACHE = (SYMPTOM_CACHE_FILE, cache)
+    return cache
+
+def _save_vote_cache(cache: Dict[bytes, bytes]):
+    n = len(DOMAIN_LIST)
+    digests = np.frombuffer(b"".join(cache), dtype=np.uint8).reshape(len(cache), 16)
+    votes = np.frombuffer(b"".join(cache.values()), dtype=np.uint8).reshape(len(cache), n)
+    tmp = SYMPTOM_CACHE_FILE + ".tmp.npz"
+    np.savez(tmp, lexicon=np.array(_lexicon_key()), digests=digests, votes=votes)
+    os.replace(tmp, SYMPTOM_CACHE_FILE)
+
+def scan_symptoms(store=None, workers: Optional[int] = None, partition: int = 2000,
+                  cancel=None, progress=None) -> Optional[SymptomScan]:
+    """Symptom votes for every patient of the active engine (see SymptomScan).
+
+    Patients are streamed from the engine (iter_patients) and only entry
+    texts missing from the cache are analyzed, `partition` texts per pool
+    task with at most two tasks per worker in flight; besides the result,
+    only a 16-byte digest per entry is kept, however large the archive. A
+    run that finds fewer than `partition` new texts never starts the pool.
+    progress(done, total) is called as patients are read; setting `cancel`
+    stops the run and returns None.
+    """
+    import multiprocessing
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    if store is None:
+        DATASTORE.flush(); store = get_store()
+    cache = _vote_cache()
+    total, mcps = len(store.list_patients()), []
+    workers = workers or os.cpu_count() or 1
+    entry_digests: List[List[bytes]] = []
+    batch: Dict[bytes, str] = {}
+    pending: Dict[Any, List[bytes]] = {}
+    pool, fresh = None, 0
+
+    def collect(done):
+        for fut in done:
+            for digest, row in zip(pending.pop(fut), fut.result()):
+                cache[digest] = row.tobytes()
+
+    try:
+        for i, (mcp, p) in enumerate(store.iter_patients(NARRATIVE_SECTIONS)):
+            if cancel is not None and cancel.is_set(): return None
+            mcps.append(mcp); digests = []
+            for section in NARRATIVE_SECTIONS:
+                for e in p.get(section, []):
+                    text = e.get("body") if isinstance(e, dict) else None
+                    if not isinstance(text, str) or not text.strip(): continue
+                    d = _text_digest(text); digests.append(d)
+                    if d not in cache: batch[d] = text
+            entry_digests.append(digests)
+            if len(batch) >= partition:
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                if len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED); collect(done)
+                pending[pool.submit(symptom_votes, list(batch.values()))] = list(batch)
+                fresh += len(batch); batch = {}
+            if progress is not None and i % 500 == 0: progress(i, total)
+        for digest, row in zip(batch, symptom_votes(list(batch.values()))):
+            cache[digest] = row.tobytes()
+        fresh += len(batch)
+        collect(list(pending))
+        if progress is not None: progress(len(mcps), len(mcps))
+    finally:
+        if pool is not None: pool.shutdown(wait=False, cancel_futures=True)
+
+    n = len(DOMAIN_LIST)
+    votes = np.zeros((len(mcps), n), dtype=np.int32)
+    for i, digests in enumerate(entry_digests):
+        if digests:
+            votes[i] = np.frombuffer(b"".join(cache[d] for d in digests), dtype=np.uint8).reshape(-1, n).sum(axis=0)
+    live = {d for digests in entry_digests for d in digests}
+    if fresh or len(live) != len(cache):
+        for d in [d for d in cache if d not in live]: del cache[d]  # texts edited away or deleted
+        _save_vote_cache(cache)
+    latest_by_mcp = dict(store.iter_latest_field("impairments"))
+    latest, ok = records_matrix([{"impairments": latest_by_mcp.get(mcp)} for mcp in mcps], "impairments")
+    latest = latest.astype(np.int16); latest[~ok] = -1
+    return SymptomScan(mcps, votes, latest)
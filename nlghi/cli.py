@@ -0,0 +1,322 @@
+"""Headless command line for NLGHI batch jobs.
+
+    python -m nlghi score visits.csv [-o scored.csv] [--save]
+    python -m nlghi validate [--parallel]
+    python -m nlghi export [--mcp M ...] [--formats md,txt,csv] [--out DIR]
+    python -m nlghi cohort [--json]
+    python -m nlghi query 'tag:frailty ghi>2.5 domain:Renal>=3'
+    python -m nlghi tags ['tag:frailty AND tag:diabetes NOT tag:palliative']
+    python -m nlghi search falls delirium [--limit N] [--rebuild]
+    python -m nlghi symptoms [--min-votes N] [--workers N] [--all]
+    python -m nlghi backup [--list | --verify | --restore PATH | --recover-to TIMESTAMP]
+
+Only nlghi.core and nlghi.fulltext (so CLI writes keep the text index
+current) are imported, so this runs on servers without a display or
+PyQt5. Exit status is 0 on success and 1 when input rows were rejected or
+validation found issues.
+"""
+from __future__ import annotations
+
+import sys, os, csv, json, argparse
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import core, fulltext
+from .core import (DOMAIN_LIST, SETTINGS, audit, backup_status, close_store, current_username,
+                   get_store, lifetime_summary, load_catalog, make_backup, restore_backup, restore_to_time,
+                   score_impairments, validate_parallel, validate_store, verify_backups, visit_summary, wait_for_backups, write_records_csv)
+
+SCORE_CHUNK = 4096
+
+def _open_in(path: str):
+    return sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+
+def _open_out(path: Optional[str]):
+    return sys.stdout if path in (None, "-") else open(path, "w", newline="", encoding="utf-8")
+
+def _is_jsonl(path: str, fmt: Optional[str]) -> bool:
+    return fmt == "jsonl" if fmt else path.endswith((".jsonl", ".ndjson"))
+
+def iter_visits(path: str, fmt: Optional[str] = None) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, visit) from a CSV or JSON-lines file.
+
+    A visit has mcp, session_date and a 27-item impairments list; CSV rows
+    give the ratings either under the DOMAIN_LIST headers or as imp_0..imp_26.
+    Optional name/gender/dob/age columns are passed through for new patients.
+    JSON lines are yielded undecoded; _check_visit() parses them, so a
+    malformed line is skipped like any other bad row.
+    """
+    with _open_in(path) as f:
+        if _is_jsonl(path, fmt):
+            for n, line in enumerate(f, 1):
+                if line.strip():
+                    yield n, line
+            return
+        reader = csv.DictReader(f)
+        cols = DOMAIN_LIST if set(DOMAIN_LIST) <= set(reader.fieldnames or ()) else [f"imp_{i}" for i in range(len(DOMAIN_LIST))]
+        for n, row in enumerate(reader, 2):
+            v = {k: row[k] for k in ("mcp", "session_date", "name", "gender", "dob", "age") if row.get(k) not in (None, "")}
+            v["impairments"] = [row.get(c) for c in cols]
+            yield n, v
+
+def _check_visit(v: Any, save: bool = False) -> Tuple[Dict[str, Any], List[int]]:
+    if isinstance(v, str):
+        v = json.loads(v)
+    if not isinstance(v, dict):
+        raise ValueError(f"expected a JSON object, got {type(v).__name__}")
+    imp = v.get("impairments")
+    if not isinstance(imp, list) or len(imp) != len(DOMAIN_LIST):
+        raise ValueError(f"expected {len(DOMAIN_LIST)} impairments")
+    out = [int(x) for x in imp]
+    if any(not 0 <= x <= 5 for x in out):
+        raise ValueError("impairment ratings must be 0-5")
+    if not v.get("mcp"):
+        raise ValueError("missing mcp")
+    if save and not core._is_iso_date(v.get("session_date")):
+        # the same check validate applies, so saved records never fail it
+        raise ValueError(f"bad session_date {v.get('session_date')!r}")
+    if "age" in v:
+        v["age"] = int(v["age"])
+    return v, out
+
+def cmd_score(args) -> int:
+    import numpy as np
+    bad = 0
+    jsonl_out = _is_jsonl(args.output or "", args.output_format)
+    store = get_store() if args.save else None
+    out = _open_out(args.output)
+    writer = None
+    if not jsonl_out:
+        writer = csv.writer(out)
+        writer.writerow(["mcp", "session_date", "ghi"] + [f"dsav_{i}" for i in range(len(DOMAIN_LIST))])
+
+    def flush(chunk):
+        dsavs, ghi = score_impairments(np.asarray([imp for _, imp in chunk], dtype=np.uint8))
+        ops = []
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for (v, imp), ds, g in zip(chunk, dsavs.tolist(), ghi.tolist()):
+            if jsonl_out:
+                out.write(json.dumps({"mcp": v["mcp"], "session_date": v.get("session_date", ""), "ghi": g, "dsavs": ds}) + "\n")
+            else:
+                writer.writerow([v["mcp"], v.get("session_date", ""), g] + ds)
+            if store is not None:
+                record = {"timestamp": now, "session_date": v.get("session_date", ""), "impairments": imp, "dsavs": ds, "ghi": g}
+                op = {"op": "append", "mcp": str(v["mcp"]), "section": "records", "entry": record}
+                op.update({k: v[k] for k in ("name", "gender", "dob", "age") if k in v})
+                ops.append(op)
+        if ops:
+            store.apply_many(ops)
+
+    chunk, total = [], 0
+    try:
+        for n, v in iter_visits(args.input, args.input_format):
+            try:
+                chunk.append(_check_visit(v, store is not None))
+            except (TypeError, ValueError) as e:
+                bad += 1
+                print(f"{args.input}:{n}: skipped: {e}", file=sys.stderr)
+                continue
+            if len(chunk) >= SCORE_CHUNK:
+                flush(chunk); total += len(chunk); chunk = []
+        if chunk:
+            flush(chunk); total += len(chunk)
+    finally:
+        if out is not sys.stdout: out.close()
+    if store is not None:
+        audit(f"{current_username()} saved {total} record(s) via CLI from {args.input}")
+    print(f"Scored {total} visit(s), skipped {bad}.", file=sys.stderr)
+    return 1 if bad else 0
+
+def cmd_validate(args) -> int:
+    if args.parallel:
+        found = 0
+        for done, total, lines in validate_parallel(workers=args.workers):
+            for line in lines: print(line)
+            found += len(lines)
+            print(f"\r{done}/{total} patients checked", end="", file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+        print(f"Issues found: {found}")
+        return 1 if found else 0
+    n, issues, _ = validate_store()
+    for line in [f"Patients: {n}"] + issues + [f"Issues found: {len(issues)}"]:
+        print(line)
+    return 1 if issues else 0
+
+def cmd_export(args) -> int:
+    store = get_store()
+    mcps = args.mcp or list(store.list_patients())
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    out_dir = args.out or SETTINGS.get("export_dir", "exports")
+    os.makedirs(out_dir, exist_ok=True)
+    summarize = lifetime_summary if args.summary == "lifetime" else visit_summary
+    missing = 0
+    for mcp in mcps:
+        p = store.get_patient(mcp)
+        if p is None:
+            missing += 1
+            print(f"{mcp}: no such patient", file=sys.stderr)
+            continue
+        for ext in formats:
+            if ext == "csv":
+                write_records_csv(os.path.join(out_dir, f"records_{mcp}.csv"), p.get("records", []))
+            else:
+                with open(os.path.join(out_dir, f"report_{mcp}.{ext}"), "w", encoding="utf-8") as f:
+                    f.write(summarize(mcp, p))
+    audit(f"{current_username()} exported {len(mcps) - missing} patient(s) via CLI to {out_dir}")
+    print(f"Exported {len(mcps) - missing} patient(s) to {out_dir}", file=sys.stderr)
+    return 1 if missing else 0
+
+def cmd_cohort(args) -> int:
+    from .analytics import cohort
+    c = cohort()
+    if not args.json:
+        print(c.summary()); return 0
+    out = {"patients": c.patients, "visits": len(c),
+           "ghi_percentiles": c.ghi_percentiles(), "ghi_percentiles_latest": c.ghi_percentiles(latest_only=True),
+           "domain_means_latest": c.domain_means(latest_only=True),
+           "prevalence": [dict(w, start=w["start"].isoformat()) for w in c.prevalence(window_days=args.window_days)]}
+    print(json.dumps(out, indent=2))
+    return 0
+
+def cmd_query(args) -> int:
+    from .search import QueryError, query_patients
+    try:
+        hits = query_patients(" ".join(args.query))
+    except QueryError as e:
+        print(f"Query error: {e}", file=sys.stderr); return 1
+    registry = core.DATASTORE.list_patients()
+    rows = list(registry.items()) if hits is None else [(mcp, registry[mcp]) for mcp in sorted(hits) if mcp in registry]
+    for mcp, e in rows:
+        print("\t".join([mcp, e.get("name", ""), str(e.get("record_count", 0)), e.get("last_visit", ""), str(e.get("latest_ghi", ""))]))
+    print(f"{len(rows)} patient(s)", file=sys.stderr)
+    return 0
+
+def cmd_tags(args) -> int:
+    from .search import QueryError, tag_facets
+    try:
+        facets = tag_facets(" ".join(args.query))
+    except QueryError as e:
+        print(f"Query error: {e}", file=sys.stderr); return 1
+    for tag, n in facets.items():
+        print(f"{tag}\t{n}")
+    return 0
+
+def cmd_search(args) -> int:
+    hits = fulltext.text_index(rebuild=args.rebuild).search(" ".join(args.terms), args.limit)
+    for h in hits:
+        print("\t".join([f"{h['score']:.3f}", h["mcp"], h["section"], str(h["index"]), h["title"], h["snippet"]]))
+    print(f"{len(hits)} entr{'y' if len(hits) == 1 else 'ies'}", file=sys.stderr)
+    return 0
+
+def cmd_symptoms(args) -> int:
+    from .analytics import scan_symptoms
+    scan = scan_symptoms(workers=args.workers)
+    flags = scan.flags(args.min_votes)
+    print("\t".join(["mcp", "domain", "votes", "latest_rating", "flag"]))
+    for i, mcp in enumerate(scan.mcps):
+        for d in range(len(DOMAIN_LIST)):
+            if flags[i, d] or (args.all and scan.votes[i, d]):
+                print("\t".join([mcp, DOMAIN_LIST[d], str(scan.votes[i, d]), str(scan.latest[i, d]), "1" if flags[i, d] else "0"]))
+    print(f"{len(scan)} patient(s), {int(flags.any(axis=1).sum())} with narrative signs in domains rated 0", file=sys.stderr)
+    return 0
+
+def cmd_backup(args) -> int:
+    if args.list:
+        bdir = SETTINGS.get("backup_dir", "backups")
+        for e in load_catalog(bdir):
+            print("\t".join([os.path.join(bdir, e["file"]), e["created"], str(e.get("patients")), str(e["size"]), e["sha256"]]))
+    elif args.verify:
+        bad, first_valid = 0, None
+        for r in verify_backups(workers=args.workers):
+            if r["ok"]:
+                print(f"OK\t{r['path']}")
+                if first_valid is None:
+                    first_valid = r["path"]; print(f"Newest valid restore point: {first_valid}", file=sys.stderr)
+            else:
+                bad += 1; print(f"BAD\t{r['path']}\t" + "; ".join(r["errors"]))
+        return 1 if bad else 0
+    elif args.restore:
+        restore_backup(args.restore)
+        print(f"Restored {args.restore}")
+    elif args.recover_to:
+        try:
+            restore_to_time(datetime.fromisoformat(args.recover_to))
+        except ValueError as e:
+            print(e, file=sys.stderr); return 1
+        print(f"Recovered data to {args.recover_to}")
+    else:
+        dst = make_backup(wait=True)
+        failed = [j for j in backup_status() if j["path"] == dst and j["state"] == "failed"]
+        print(f"Backup failed: {failed[0]['error']}" if failed else dst or "No data to back up.")
+        return 1 if failed else 0
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m nlghi", description="NLGHI batch scoring, validation, export and backup.")
+    ap.add_argument("--backend", choices=core.STORAGE_BACKENDS, help="storage engine (default: from settings)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    sp = sub.add_parser("score", help="score visits from CSV/JSONL")
+    sp.add_argument("input", help="CSV or JSONL file of visits, or - for stdin")
+    sp.add_argument("-o", "--output", help="write scores here (default: stdout)")
+    sp.add_argument("--input-format", choices=("csv", "jsonl"), help="override detection by extension")
+    sp.add_argument("--output-format", choices=("csv", "jsonl"))
+    sp.add_argument("--save", action="store_true", help="append the scored visits as patient records")
+    sp.set_defaults(func=cmd_score)
+
+    sp = sub.add_parser("validate", help="run the Data Tools validation checks")
+    sp.add_argument("--parallel", action="store_true", help="check every patient across all CPU cores, streaming issues")
+    sp.add_argument("--workers", type=int, help="processes for --parallel (default: all cores)")
+    sp.set_defaults(func=cmd_validate)
+
+    sp = sub.add_parser("export", help="write Report Builder exports")
+    sp.add_argument("--mcp", action="append", help="patient MCP (repeatable; default: all)")
+    sp.add_argument("--formats", default="md,csv", help="comma separated: md, txt, csv (default: md,csv)")
+    sp.add_argument("--summary", choices=("visit", "lifetime"), default="visit")
+    sp.add_argument("--out", help="output directory (default: export_dir setting)")
+    sp.set_defaults(func=cmd_export)
+
+    sp = sub.add_parser("cohort", help="population GHI and domain statistics")
+    sp.add_argument("--json", action="store_true", help="machine-readable output")
+    sp.add_argument("--window-days", type=int, default=365, help="prevalence window for --json (default: 365)")
+    sp.set_defaults(func=cmd_cohort)
+
+    sp = sub.add_parser("query", help="list patients matching a registry query")
+    sp.add_argument("query", nargs="+", help="e.g. tag:frailty ghi>2.5 last_visit<2025-01-01 domain:Renal>=3")
+    sp.set_defaults(func=cmd_query)
+
+    sp = sub.add_parser("tags", help="count patients per tag, optionally among those matching a registry query")
+    sp.add_argument("query", nargs="*", help="e.g. tag:frailty AND tag:diabetes NOT tag:palliative")
+    sp.set_defaults(func=cmd_tags)
+
+    sp = sub.add_parser("search", help="rank history, note and symptom snapshot entries by free text")
+    sp.add_argument("terms", nargs="+", help="words; a trailing * matches a prefix, e.g. delir*")
+    sp.add_argument("--limit", type=int, default=50, help="maximum hits (default: 50)")
+    sp.add_argument("--rebuild", action="store_true", help="re-index every patient first")
+    sp.set_defaults(func=cmd_search)
+
+    sp = sub.add_parser("symptoms", help="symptom checker over all history and notes vs the latest ratings")
+    sp.add_argument("--min-votes", type=int, default=1, help="votes needed to flag a domain rated 0 (default: 1)")
+    sp.add_argument("--workers", type=int, help="processes (default: all cores)")
+    sp.add_argument("--all", action="store_true", help="list every domain with votes, not only flagged ones")
+    sp.set_defaults(func=cmd_symptoms)
+
+    sp = sub.add_parser("backup", help="create, list or restore backups")
+    g = sp.add_mutually_exclusive_group()
+    g.add_argument("--list", action="store_true")
+    g.add_argument("--verify", action="store_true", help="check every backup's checksums in parallel")
+    g.add_argument("--restore", metavar="PATH")
+    g.add_argument("--recover-to", metavar="TIMESTAMP", help="point-in-time recovery, e.g. 2025-01-31T17:00:00")
+    sp.add_argument("--workers", type=int, help="processes for --verify (default: up to 4)")
+    sp.set_defaults(func=cmd_backup)
+    return ap
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.backend:
+        SETTINGS["storage_backend"] = args.backend
+    try:
+        return args.func(args)
+    finally:
+        wait_for_backups()
+        close_store()
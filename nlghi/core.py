@@ -0,0 +1,2016 @@
+"""Headless NLGHI core: domains and weights, GHI/DSAV scoring, symptom
+analysis, storage engines and backups.
+
+Nothing here imports PyQt5 or matplotlib, and NumPy is only loaded by
+the scoring helpers that need it, so scripts, tests and batch jobs can
+import this module cheaply. The desktop app lives in nlghi.gui.
+"""
+from __future__ import annotations
+
+import os, re, json, csv, logging, shutil, sqlite3, threading, hashlib, time, queue, gzip, lzma, zlib
+from collections import OrderedDict, deque
+from urllib.parse import quote, unquote
+from datetime import datetime, date
+from typing import List, Dict, Any, Optional, Set, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DATA_FILE = "nlghi_patient_data.json"
+DB_FILE = "nlghi_patient_data.sqlite3"
+PATIENTS_DIR = "nlghi_patients"
+MUTATION_LOG = "nlghi_mutations.jsonl"
+CRED_FILE = "nlghi_credentials.json"
+SETTINGS_FILE = "nlghi_settings.json"
+AUDIT_LOG = "nlghi_audit.log"
+
+FACTORY_USER = "doctor"
+FACTORY_PASS = "1234"
+
+_audit_logger = logging.getLogger("nlghi.audit")
+
+def audit(msg: str):
+    # the log file is opened on first use rather than at import time
+    if not _audit_logger.handlers:
+        handler = logging.FileHandler(AUDIT_LOG)
+        handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(message)s"))
+        _audit_logger.addHandler(handler); _audit_logger.setLevel(logging.INFO); _audit_logger.propagate = False
+    _audit_logger.info(msg)
+
+
+DEFAULT_SETTINGS = {
+    "theme": "light",
+    "auto_backup": True,
+    "backup_dir": "backups",
+    "backups_to_keep": 10,
+    "backup_mode": "chunked",
+    "backup_compression": "gzip",
+    "backup_retention": {"hourly": 24, "daily": 7, "weekly": 4, "monthly": 12},
+    "export_dir": "exports",
+    "storage_backend": "sqlite",
+    "journal_compact_kb": 1024,
+    "journal_commit_ms": 50,
+    "write_behind_ms": 0,
+    "patient_cache_size": 64,
+    "registry_max_rows": 2000,
+    "mutation_log": True,
+    "mutation_log_max_kb": 8 * 1024
+}
+
+def load_settings() -> Dict[str, Any]:
+    if os.path.exists(SETTINGS_FILE):
+        try:
+            with open(SETTINGS_FILE, "r") as f:
+                data = json.load(f)
+            
+            for k, v in DEFAULT_SETTINGS.items():
+                data.setdefault(k, v)
+            return data
+        except Exception:
+            pass
+    return dict(DEFAULT_SETTINGS)
+
+def save_settings(data: Dict[str, Any]):
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(data, f, indent=2)
+
+SETTINGS = load_settings()
+
+
+
+
+def load_credentials():
+    if os.path.exists(CRED_FILE):
+        try:
+            with open(CRED_FILE, "r") as f:
+                data = json.load(f)
+            return {"username": data.get("username", ""), "password": data.get("password", "")}
+        except Exception:
+            pass
+    return {"username": "", "password": ""}
+
+def save_credentials(username, password):
+    with open(CRED_FILE, "w") as f:
+        json.dump({"username": username, "password": password}, f, indent=2)
+
+def current_username() -> str:
+    c = load_credentials()
+    return c["username"] or FACTORY_USER
+
+
+
+
+DOMAIN_LIST = [
+    "Cardiovascular", "Respiratory/Cardiopulmonary", "Neurological/Neurodegenerative/Brain Injury",
+    "Musculoskeletal/Physical Trauma", "Renal", "Hepatic", "Gastrointestinal", "Dermatologic",
+    "Urogenital and Reproductive", "Oncologic", "Hematologic", "Genetic/Hereditary", "Endocrinologic",
+    "Immunodeficiency", "Nutritional deficiency", "Autoimmune", "Opthalmic", "Otolaryngologic",
+    "Psychiatric/Psychological/Mental/Behavioral", "Oral/Dental",
+    "Disability - Physical/Mental/Neurodevelopmental", "Dependence on Supportive Aids", "Social well-being",
+    "Economic well-being", "Abuse/Neglect", "Risk factors", "Other"
+]
+
+
+DOMAIN_VALUES = [5,5,5,4,4,4,4,3,3,5,4,1,2,2,2,2,2,2,2,2,1,1,1,5,3,1,1]
+
+
+
+
+def score_impairments(impairments) -> Tuple[np.ndarray, np.ndarray]:
+    """Score an (N x 27) matrix of 0-5 ratings in one vectorized pass.
+
+    DSAV = rating x domain weight (weights broadcast across rows) and
+    GHI = sum(DSAV) / 27 rounded to 4 places. Returns (dsavs, ghi) with
+    shapes (N, 27) and (N,).
+    """
+    import numpy as np
+    imp = np.asarray(impairments)
+    if imp.ndim != 2 or imp.shape[1] != len(DOMAIN_LIST):
+        raise ValueError(f"expected an (N x {len(DOMAIN_LIST)}) impairment matrix, got shape {imp.shape}")
+    dsavs = imp.astype(np.int16) * np.asarray(DOMAIN_VALUES, dtype=np.int16)
+    ghi = np.round(dsavs.sum(axis=1) / 27, 4)
+    return dsavs, ghi
+
+def score_record(impairments: List[int]) -> Tuple[List[int], float]:
+    """DSAVs and GHI for a single visit, as plain Python values for storage."""
+    import numpy as np
+    dsavs, ghi = score_impairments(np.asarray([impairments], dtype=np.uint8))
+    return dsavs[0].tolist(), float(ghi[0])
+
+def records_matrix(records: List[Dict[str, Any]], key: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack records[*][key] into an (N x 27) int matrix.
+
+    Returns (matrix, ok): rows whose value is not a list of at least 27
+    integers are zero-filled and flagged False in ok.
+    """
+    import numpy as np
+    n = len(DOMAIN_LIST)
+    mat = np.zeros((len(records), n), dtype=np.int16); ok = np.zeros(len(records), dtype=bool)
+    for i, r in enumerate(records):
+        v = r.get(key, [])
+        try:
+            if len(v) >= n:
+                mat[i] = [int(x) for x in v[:n]]; ok[i] = True
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return mat, ok
+
+def dsav_matrix(records: List[Dict[str, Any]]) -> np.ndarray:
+    """(N x 27) DSAVs per record: stored values (zero-padded), or scored from the
+    impairments for records saved without DSAVs."""
+    import numpy as np
+    n = len(DOMAIN_LIST)
+    scored, ok = _scored_dsavs(records)
+    mat = np.zeros((len(records), n))
+    for j, r in enumerate(records):
+        dsav = r.get("dsavs") or (scored[j] if ok[j] else [])
+        mat[j, :min(n, len(dsav))] = dsav[:n]
+    return mat
+
+def export_rows(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """CSV rows (timestamp, session_date, ghi, dsav_0..dsav_26) for a patient's records."""
+    scored, ok = _scored_dsavs(records)
+    rows = []
+    for j, r in enumerate(records):
+        dsav = r.get("dsavs") or (scored[j].tolist() if ok[j] else [])
+        row = {"timestamp": r.get("timestamp",""), "session_date": r.get("session_date",""), "ghi": r.get("ghi","")}
+        for i in range(len(DOMAIN_LIST)):
+            row[f"dsav_{i}"] = dsav[i] if i < len(dsav) else ""
+        rows.append(row)
+    return rows
+
+def _scored_dsavs(records):
+    imp, ok = records_matrix(records, "impairments")
+    return score_impairments(imp)[0], ok
+
+def write_records_csv(path: str, records: List[Dict[str, Any]]):
+    fieldnames = ["timestamp","session_date","ghi"] + [f"dsav_{i}" for i in range(len(DOMAIN_LIST))]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fieldnames); w.writeheader()
+        for row in export_rows(records):
+            w.writerow(row)
+
+def _len_or_none(v):
+    try: return len(v)
+    except TypeError: return None
+
+def validation_issues(d: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Data Tools checks per patient: impairments/dsavs length, GHI recomputation,
+    session/birth dates and future_refs shape.
+
+    All records are rescored in one score_impairments() call and compared
+    as arrays; only flagged records are formatted into messages.
+    """
+    import numpy as np
+    n = len(DOMAIN_LIST)
+    refs = [(mcp, idx, r) for mcp, p in d.items() for idx, r in enumerate(p.get("records", []))]
+    recs = [r for _, _, r in refs]
+    imp_mat, imp_ok = records_matrix(recs, "impairments")
+    _, recomputed = score_impairments(imp_mat)
+    imp_len = [_len_or_none(r.get("impairments", [])) for r in recs]
+    dsav_len = [_len_or_none(r.get("dsavs", [])) for r in recs]
+    stored = np.full(len(recs), np.nan)
+    for k, r in enumerate(recs):
+        try: stored[k] = float(r.get("ghi", 0))
+        except (TypeError, ValueError): pass
+    with np.errstate(invalid="ignore"):
+        ghi_bad = ~imp_ok | np.isnan(stored) | (np.abs(stored - recomputed) > 1e-6)
+    len_bad = np.array([a != n or b != n for a, b in zip(imp_len, dsav_len)], dtype=bool)
+    out: Dict[str, List[str]] = {}
+    date_bad = np.array([not _is_iso_date(r.get("session_date")) for r in recs], dtype=bool)
+    for k in np.flatnonzero(ghi_bad | len_bad | date_bad).tolist():
+        mcp, idx, r = refs[k]
+        lines = out.setdefault(mcp, [])
+        if imp_len[k] != n:
+            lines.append(f"[{mcp}] record {idx}: impairments len={imp_len[k]} != {n}")
+        if dsav_len[k] != n:
+            lines.append(f"[{mcp}] record {idx}: dsavs len={dsav_len[k]} != {n}")
+        if not imp_ok[k] or np.isnan(stored[k]):
+            lines.append(f"[{mcp}] record {idx}: error recomputing GHI")
+        elif ghi_bad[k]:
+            lines.append(f"[{mcp}] record {idx}: GHI mismatch {r.get('ghi')} vs {float(recomputed[k])}")
+        if date_bad[k]:
+            lines.append(f"[{mcp}] record {idx}: bad session_date {r.get('session_date')!r}")
+    for mcp, p in d.items():
+        if p.get("dob") and not _is_iso_date(p["dob"]):
+            out.setdefault(mcp, []).append(f"[{mcp}] bad dob {p['dob']!r}")
+        for idx, fr in enumerate(p.get("future_refs", [])):
+            problem = _future_ref_problem(fr)
+            if problem: out.setdefault(mcp, []).append(f"[{mcp}] future_ref {idx}: {problem}")
+    return out
+
+def _is_iso_date(v) -> bool:
+    try: date.fromisoformat(v); return True
+    except (TypeError, ValueError): return False
+
+def _future_ref_problem(fr) -> Optional[str]:
+    if not isinstance(fr, dict): return f"not an object ({type(fr).__name__})"
+    if not isinstance(fr.get("title"), str) or not fr["title"].strip(): return "missing title"
+    if not _is_iso_date(fr.get("due")): return f"bad due date {fr.get('due')!r}"
+    if not isinstance(fr.get("done", False), bool): return f"done is not true/false ({fr['done']!r})"
+    return None
+
+def validate_dataset(d: Dict[str, Any]) -> List[str]:
+    """validation_issues() flattened to one line per issue, in dataset order."""
+    issues = validation_issues(d)
+    return [line for mcp in d for line in issues.get(mcp, ())]
+
+class ValidationCache:
+    """Validation results per patient, keyed by a hash of the patient's stored JSON.
+
+    run() hashes every patient's bytes (engine.iter_chunks(), no parse for
+    the JSON and sharded engines) and only decodes and re-checks patients
+    whose hash changed since the previous run.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, List[str]]] = {}
+
+    def run(self, store) -> Tuple[int, List[str], int]:
+        """Returns (patients, issue lines, patients re-checked)."""
+        order, changed, digests = [], {}, {}
+        for mcp, blob in store.iter_chunks():
+            h = hashlib.blake2b(blob, digest_size=16).hexdigest()
+            order.append(mcp)
+            e = self._entries.get(mcp)
+            if e is None or e[0] != h:
+                changed[mcp] = json.loads(blob); digests[mcp] = h
+        fresh = validation_issues(changed)
+        for mcp in changed:
+            self._entries[mcp] = (digests[mcp], fresh.get(mcp, []))
+        for mcp in set(self._entries) - set(order):
+            del self._entries[mcp]
+        return len(order), [line for mcp in order for line in self._entries[mcp][1]], len(changed)
+
+    def clear(self):
+        self._entries = {}
+
+    def update(self, mcp: str, digest: str, issues: List[str]):
+        self._entries[mcp] = (digest, issues)
+
+    def retain(self, mcps):
+        keep = set(mcps)
+        for mcp in [m for m in self._entries if m not in keep]: del self._entries[mcp]
+
+VALIDATION_CACHE = ValidationCache()
+
+def _validate_partition(items: List[Tuple[str, bytes]]) -> List[Tuple[str, str, List[str]]]:
+    """Pool task: (mcp, digest, issues) for a slice of patients."""
+    d = {mcp: json.loads(blob) for mcp, blob in items}
+    issues = validation_issues(d)
+    return [(mcp, hashlib.blake2b(blob, digest_size=16).hexdigest(), issues.get(mcp, [])) for mcp, blob in items]
+
+def validate_parallel(store: Optional[PatientStore] = None, workers: Optional[int] = None,
+                      partition: int = 500, cancel: Optional[threading.Event] = None):
+    """Full validation with patients partitioned across a process pool.
+
+    Yields (patients done, total, new issue lines) as each partition
+    finishes, so issues stream in before the whole run completes. Setting
+    `cancel` stops the run; queued partitions are dropped. The results
+    also warm VALIDATION_CACHE for the next incremental run.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    if store is None:
+        DATASTORE.flush(); store = get_store()
+    items = list(store.iter_chunks())
+    total = len(items); done = 0
+    yield 0, total, []
+    ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=ctx)
+    try:
+        futures = [pool.submit(_validate_partition, items[i:i + partition]) for i in range(0, total, partition)]
+        for fut in as_completed(futures):
+            if cancel is not None and cancel.is_set(): return
+            lines, results = [], fut.result()
+            for mcp, digest, issues in results:
+                VALIDATION_CACHE.update(mcp, digest, issues); lines += issues
+            done += len(results)
+            yield done, total, lines
+        VALIDATION_CACHE.retain(mcp for mcp, _ in items)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def validate_store(store: Optional[PatientStore] = None) -> Tuple[int, List[str], int]:
+    """Incremental validation of the active engine (see ValidationCache)."""
+    if store is None:
+        DATASTORE.flush(); store = get_store()
+    return VALIDATION_CACHE.run(store)
+
+def visit_summary(mcp: str, p: Dict[str, Any]) -> str:
+    """Report Builder's latest-visit summary (Markdown-flavoured text)."""
+    name = p.get("name",""); gender = p.get("gender",""); dob = p.get("dob","")
+    recs = p.get("records", [])
+    last = recs[-1] if recs else {}
+    ghi = last.get("ghi","N/A"); date_s = last.get("session_date","N/A")
+    lines = [
+        f"# Visit Summary — MCP {mcp}",
+        f"Name: {name}   Gender: {gender}   DOB: {dob}",
+        f"Session Date: {date_s}",
+        f"GHI: {ghi}",
+        "",
+        "## DSAV (per domain)",
+    ]
+    dsav = last.get("dsavs", [])
+    for i, val in enumerate(dsav):
+        lines.append(f"- {DOMAIN_LIST[i]}: {val}")
+    return "\n".join(lines)
+
+def lifetime_summary(mcp: str, p: Dict[str, Any]) -> str:
+    """Report Builder's lifetime summary: history, notes, future references and GHI by session."""
+    lines = [f"# Lifetime Summary — MCP {mcp}", f"Name: {p.get('name','')}  Gender: {p.get('gender','')}  DOB: {p.get('dob','')}", ""]
+    # notes
+    if p.get("history"):
+        lines.append("## History entries"); 
+        for h in p["history"]:
+            lines.append(f"- {h.get('timestamp','')}: {h.get('title','')}")
+    if p.get("notes"):
+        lines.append("\n## Doctor's notes")
+        for n in p["notes"]:
+            lines.append(f"- {n.get('timestamp','')}: {n.get('title','')} (attach_latest={n.get('attach_latest',False)})")
+    if p.get("future_refs"):
+        lines.append("\n## Future references")
+        for r in p["future_refs"]:
+            lines.append(f"- {r.get('due','')}: {r.get('title','')}  [{'DONE' if r.get('done') else 'PENDING'}]")
+    
+    if p.get("records"):
+        lines.append("\n## Records (GHI by session)")
+        for r in p["records"]:
+            lines.append(f"- {r.get('session_date','')}: GHI={r.get('ghi','N/A')}")
+    return "\n".join(lines)
+
+
+
+
+def _make_symptom_lexicon():
+    L = {}
+    def add(terms, idx): 
+        for t in terms: L[t] = [idx]
+
+    add([
+        "chest pain","angina","palpitations","tachycardia","bradycardia",
+        "shortness of breath on exertion","orthopnea","paroxysmal nocturnal dyspnea",
+        "edema legs","leg swelling","syncope","fainting","dyspnea on exertion",
+        "hypertension","high blood pressure","bp high","heart failure","cyanosis"
+    ], 0)
+
+    add(["cough","productive cough","dry cough","wheeze","wheezing",
+         "asthma","breathlessness","shortness of breath","dyspnea",
+         "hemoptysis","coughing blood","pneumonia","choking"], 1)
+
+    add(["headache","migraine","dizziness","vertigo","seizure","fits",
+         "weakness one side","hemiplegia","stroke","tremor","parkinsonism",
+         "confusion","memory loss","mci","dementia","numbness","tingling",
+         "loss of consciousness","blackout"], 2)
+
+    add(["joint pain","back pain","knee pain","hip pain","fracture","sprain",
+         "muscle weakness","stiffness","falls","gait problem","arthritis",
+         "osteoporosis"], 3)
+
+    add(["flank pain","hematuria","blood in urine","urine foamy","edema",
+         "reduced urine output","kidney stones","renal colic"], 4)
+
+    add(["jaundice","yellow eyes","hepatitis","liver disease","ascites",
+         "abdominal swelling","pruritus","itching","alcohol use"], 5)
+
+    add(["abdominal pain","diarrhea","constipation","vomiting","nausea",
+         "blood in stool","melena","hematemesis","acid reflux","heartburn",
+         "dysphagia","bloating","ibs"], 6)
+
+    add(["rash","itchy rash","hives","psoriasis","eczema","skin lesion",
+         "ulcer","wound","cellulitis"], 7)
+
+    add(["dysuria","painful urination","frequency urination","urgency",
+         "urinary incontinence","pelvic pain","vaginal discharge",
+         "erectile dysfunction","testicular pain"], 8)
+
+    add(["unintentional weight loss","night sweats","lymph node swelling",
+         "mass","lump","fatigue cancer","cachexia"], 9)
+
+    add(["easy bruising","bleeding gums","petechiae","anemia","pallor",
+         "thrombosis","clot"], 10)
+
+    add(["family history genetic","known mutation","consanguinity"], 11)
+
+    add(["polyuria","polydipsia","polyphagia","weight gain","weight loss",
+         "cold intolerance","heat intolerance","thyroid","diabetes",
+         "hyperglycemia","hypoglycemia"], 12)
+
+    add(["recurrent infections","opportunistic infection","low immunity"], 13)
+
+    add(["malnutrition","underweight","scurvy","vitamin deficiency",
+         "vitamin d deficiency","b12 deficiency"], 14)
+
+    add(["autoimmune","sle","lupus","sjogren","ra","rheumatoid","vasculitis"], 15)
+
+    add(["blurry vision","double vision","eye pain","red eye","conjunctivitis",
+         "glaucoma","cataract","vision loss"], 16)
+
+    add(["ear pain","tinnitus","hearing loss","sore throat","hoarseness",
+         "sinusitis","nasal discharge","epistaxis"], 17)
+
+    add(["depression","anxiety","panic attack","hallucinations","delusions",
+         "insomnia","addiction","substance use","suicidal ideation"], 18)
+
+    add(["toothache","dental pain","gum swelling","oral ulcer","bad breath"], 19)
+
+    add(["wheelchair","mobility aid","intellectual disability","autism",
+         "adhd","developmental delay"], 20)
+
+    add(["walker","cane","oxygen therapy","hearing aid","prosthesis"], 21)
+
+    add(["lonely","isolation","no caregiver","housing instability"], 22)
+
+    add(["financial stress","job loss","low income"], 23)
+
+    add(["neglect","physical abuse","emotional abuse","financial abuse"], 24)
+
+    add(["smoking","alcohol","sedentary","high salt","high sugar","obesity",
+         "family history heart","family history stroke"], 25)
+
+    add(["fever","chills","fatigue","malaise","pain","weight change"], 26)
+
+    return L
+
+_PHRASE_WORD = re.compile(r"[^\W_]+")
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over phrases, with whole words as its alphabet.
+
+    Text and phrases are split into lower-cased words, so a phrase only
+    matches whole words ("ra" never hits "rash") regardless of spacing or
+    line breaks between them, and scanning is one pass over the words
+    however many phrases there are. Overlapping phrases are all reported
+    ("chest pain" and "pain").
+    """
+
+    def __init__(self, phrases):
+        self.phrases: List[str] = []
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[int, ...]] = [()]
+        for phrase in phrases:
+            state = 0
+            for w in _PHRASE_WORD.findall(phrase.lower()):
+                if w not in goto[state]:
+                    goto[state][w] = len(goto); goto.append({}); out.append(())
+                state = goto[state][w]
+            if state:
+                out[state] += (len(self.phrases),); self.phrases.append(phrase)
+        # failure links, breadth first; each state also reports its fail state's outputs
+        fail = [0] * len(goto)
+        level = list(goto[0].values())
+        while level:
+            nxt = []
+            for state in level:
+                for w, child in goto[state].items():
+                    f = fail[state]
+                    while f and w not in goto[f]: f = fail[f]
+                    fail[child] = goto[f].get(w, 0)
+                    out[child] += out[fail[child]]
+                    nxt.append(child)
+            level = nxt
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def scan(self, text: str):
+        """Yield each phrase occurrence in text, in order of where it ends."""
+        goto, fail, out, phrases = self._goto, self._fail, self._out, self.phrases
+        root, state = goto[0], 0
+        for w in _PHRASE_WORD.findall(text.lower()):
+            if state:
+                while state and w not in goto[state]: state = fail[state]
+                state = goto[state].get(w, 0)
+            else:  # the common case: outside any phrase, one lookup per word
+                state = root.get(w, 0)
+            for i in out[state]: yield phrases[i]
+
+
+SYMPTOM_LEXICON = _make_symptom_lexicon()
+SYMPTOM_MATCHER = PhraseMatcher(SYMPTOM_LEXICON)
+
+def symptom_domain_votes(text: str) -> Tuple[Set[str], List[int]]:
+    """(lexicon phrases found, per-domain votes): each distinct phrase votes once for each of its domains."""
+    hits = set(SYMPTOM_MATCHER.scan(text))
+    votes = [0] * len(DOMAIN_LIST)
+    for phrase in hits:
+        for d in SYMPTOM_LEXICON[phrase]:
+            votes[d] += 1
+    return hits, votes
+
+def analyze_symptoms(text: str) -> Dict[str, Any]:
+    hits, votes = symptom_domain_votes(text)
+    ranked = sorted([(i, c) for i, c in enumerate(votes) if c > 0], key=lambda x: x[1], reverse=True)
+    suggestions = [{"domain_index": i, "domain_name": DOMAIN_LIST[i], "votes": c} for i, c in ranked]
+    return {"keywords_found": sorted(hits), "suggestions": suggestions}
+
+
+
+
+def read_data() -> Dict[str, Any]:
+    if os.path.exists(DATA_FILE):
+        try:
+            with open(DATA_FILE, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    return {}
+
+def write_data(d: Dict[str, Any]):
+    
+    if SETTINGS.get("auto_backup", True):
+        make_backup()
+    text, offsets = dump_patients(d)
+    atomic_write_text(DATA_FILE, text)
+    st = os.stat(DATA_FILE)
+    save_data_index((st.st_mtime_ns, st.st_size), {mcp: [a, b, registry_entry(d[mcp])] for mcp, (a, b) in offsets.items()})
+    audit(f"{current_username()} wrote data file ({len(d)} patients).")
+
+def dump_patients(d: Dict[str, Any]) -> Tuple[str, Dict[str, Tuple[int, int]]]:
+    """Serialize like json.dumps(d, indent=2) and return each patient's (start, end) offset."""
+    if not d: return "{}", {}
+    parts, offsets, pos = ["{\n"], {}, 2
+    for i, (mcp, p) in enumerate(d.items()):
+        head = ("" if i == 0 else ",\n") + "  " + json.dumps(mcp) + ": "
+        body = json.dumps(p, indent=2).replace("\n", "\n  ")
+        start = pos + len(head)
+        offsets[mcp] = (start, start + len(body))
+        parts.append(head); parts.append(body); pos = start + len(body)
+    parts.append("\n}")
+    return "".join(parts), offsets
+
+_JSON_WS = re.compile(r"[ \t\n\r]*")
+
+def index_patients(raw: bytes) -> Dict[str, List[Any]]:
+    """Scan a data file's bytes into mcp -> [start, end, registry entry] without keeping the bodies."""
+    ascii_only = raw.isascii()
+    text = raw.decode("latin-1")  # one char per byte, so string offsets are byte offsets
+    dec = json.JSONDecoder(); out = {}
+    i = _JSON_WS.match(text, 0).end()
+    if text[i:i+1] != "{": raise ValueError("data file is not a JSON object")
+    i = _JSON_WS.match(text, i + 1).end()
+    while text[i:i+1] != "}":
+        k0 = i; mcp, k1 = dec.raw_decode(text, i)
+        i = _JSON_WS.match(text, k1).end() + 1  # ':'
+        v0 = _JSON_WS.match(text, i).end(); p, v1 = dec.raw_decode(text, v0)
+        if not ascii_only:
+            mcp = json.loads(raw[k0:k1]); p = json.loads(raw[v0:v1])
+        out[mcp] = [v0, v1, registry_entry(p)]
+        i = _JSON_WS.match(text, v1).end()
+        if text[i:i+1] == ",": i = _JSON_WS.match(text, i + 1).end()
+    return out
+
+def load_data_index():
+    try:
+        with open(DATA_FILE + ".index", "r") as f:
+            idx = json.load(f)
+        if idx.get("fields") != list(SUMMARY_FIELDS): return None, {}  # written before these summaries existed
+        return tuple(idx["version"]), idx["patients"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, {}
+
+def save_data_index(version, patients: Dict[str, List[Any]]):
+    """Persist the registry index of DATA_FILE so the next start can skip the full parse."""
+    atomic_write_text(DATA_FILE + ".index", json.dumps({"version": list(version), "fields": list(SUMMARY_FIELDS), "patients": patients}, separators=(",", ":")))
+
+def atomic_write_text(path: str, text: str):
+    """Write text to path via temp file + fsync + rename, so readers never see a partial file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def ensure_patient_struct(d: Dict[str, Any], mcp: str, name="", gender="", dob="", age=0):
+    if mcp not in d:
+        d[mcp] = {"name": name, "dob": dob, "age": age, "gender": gender, "records": []}
+    p = d[mcp]
+    p.setdefault("records", [])
+    p.setdefault("tags", [])
+    p.setdefault("history", [])
+    p.setdefault("notes", [])
+    p.setdefault("future_refs", [])
+    p.setdefault("symptom_snapshots", [])
+    p.setdefault("attachments", [])
+    return p
+
+
+
+
+# codec -> (file suffix, compress, decompress); the codec is picked from the suffix on read
+BACKUP_CODECS = {
+    "none": ("", bytes, bytes),
+    "gzip": (".gz", lambda b: gzip.compress(b, compresslevel=6, mtime=0), gzip.decompress),
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+    "zlib": (".zz", zlib.compress, zlib.decompress),
+}
+BACKUP_SUFFIXES = (".manifest",) + tuple(".json" + c[0] for c in BACKUP_CODECS.values())
+
+def _codec(name: str):
+    if name not in BACKUP_CODECS: raise ValueError(f"Unknown backup compression: {name}")
+    return BACKUP_CODECS[name]
+
+def _read_compressed(path: str) -> bytes:
+    with open(path, "rb") as f:
+        raw = f.read()
+    for suffix, _, decompress in BACKUP_CODECS.values():
+        if suffix and path.endswith(suffix): return decompress(raw)
+    return raw
+
+def _write_bytes(path: str, blob: bytes):
+    with open(path + ".tmp", "wb") as f:
+        f.write(blob); f.flush(); os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+def _chunk_path(bdir: str, digest: str, compression: str = "none") -> str:
+    return os.path.join(bdir, "chunks", digest[:2], digest + ".json" + _codec(compression)[0])
+
+def write_chunked_backup(chunks, dst: str, compression: str = "none", backend: str = "", created: str = "") -> Dict[str, Any]:
+    """Store (mcp, JSON bytes) chunks content-addressed next to dst and write dst as their manifest.
+
+    Each patient's JSON is stored once under chunks/<sha256>.json[.gz|.xz|.zz];
+    a chunk already present from an earlier snapshot is not written again.
+    Returns the snapshot's catalog fields (patients, size, sha256 of the manifest).
+    """
+    bdir = os.path.dirname(dst) or "."
+    compress = _codec(compression)[1]
+    entries, added = [], 0
+    for mcp, blob in chunks:
+        digest = hashlib.sha256(blob).hexdigest()
+        path = _chunk_path(bdir, digest, compression)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            packed = compress(blob); _write_bytes(path, packed); added += len(packed)
+        entries.append([mcp, digest])
+    manifest = {"format": "nlghi-chunks/1", "created": created or datetime.now().isoformat(timespec="seconds"),
+                "backend": backend, "compression": compression, "patients": entries}
+    text = json.dumps(manifest, separators=(",", ":"))
+    atomic_write_text(dst, text)
+    return {"patients": len(entries), "size": added + len(text), "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()}
+
+def read_backup(path: str) -> Dict[str, Any]:
+    """Load any snapshot from list_backups() (full copy or chunk .manifest) as a dataset."""
+    if not path.endswith(".manifest"):
+        return json.loads(_read_compressed(path))
+    with open(path, "r") as f:
+        data = json.load(f)
+    bdir = os.path.dirname(path) or "."
+    compression = data.get("compression", "none")
+    return {mcp: json.loads(_read_compressed(_chunk_path(bdir, digest, compression))) for mcp, digest in data["patients"]}
+
+def _gc_chunks(bdir: str):
+    """Delete chunks no longer referenced by any remaining manifest."""
+    live = set()
+    for path in list_backups():
+        if path.endswith(".manifest"):
+            with open(path, "r") as f:
+                live.update(digest for _, digest in json.load(f)["patients"])
+    root = os.path.join(bdir, "chunks")
+    if not os.path.isdir(root): return
+    for sub in os.listdir(root):
+        for name in os.listdir(os.path.join(root, sub)):
+            if name.split(".", 1)[0] not in live:
+                try: os.remove(os.path.join(root, sub, name))
+                except OSError: pass
+
+# The catalog (backup_dir/catalog.json) lists finished snapshots oldest first with
+# created, size (bytes the snapshot added to the folder), sha256 and patient count,
+# so listing and pruning never scan the backup folder.
+CATALOG_FILE = "catalog.json"
+RETENTION_BUCKETS = {"hourly": "%Y-%m-%d %H", "daily": "%Y-%m-%d", "weekly": "%G-W%V", "monthly": "%Y-%m"}
+_catalog_lock = threading.RLock()
+_catalogs: Dict[str, Tuple[Optional[int], List[Dict[str, Any]]]] = {}
+
+def _catalog_path(bdir: str) -> str:
+    return os.path.join(bdir, CATALOG_FILE)
+
+def load_catalog(bdir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Catalog entries for bdir (default: backup_dir); built once from the folder if missing."""
+    bdir = bdir or SETTINGS.get("backup_dir", "backups")
+    with _catalog_lock:
+        try: mtime = os.stat(_catalog_path(bdir)).st_mtime_ns
+        except OSError: mtime = None
+        cached = _catalogs.get(bdir)
+        if cached is not None and mtime is not None and cached[0] == mtime:
+            return cached[1]
+        if mtime is None:
+            entries = _scan_backups(bdir)
+            if entries: _save_catalog(bdir, entries)
+            else: _catalogs.pop(bdir, None)
+            return entries
+        with open(_catalog_path(bdir), "r") as f:
+            entries = json.load(f)
+        _catalogs[bdir] = (mtime, entries)
+        return entries
+
+def _save_catalog(bdir: str, entries: List[Dict[str, Any]]):
+    with _catalog_lock:
+        atomic_write_text(_catalog_path(bdir), json.dumps(entries, indent=1))
+        _catalogs[bdir] = (os.stat(_catalog_path(bdir)).st_mtime_ns, entries)
+
+def _scan_backups(bdir: str) -> List[Dict[str, Any]]:
+    """Catalog entries for backups made before the catalog existed."""
+    if not os.path.isdir(bdir): return []
+    entries, seen = [], set()
+    for name in sorted(f for f in os.listdir(bdir) if f.endswith(BACKUP_SUFFIXES)):
+        path = os.path.join(bdir, name)
+        with open(path, "rb") as f:
+            raw = f.read()
+        m = re.match(r"patients_(\d{8}_\d{6})", name)
+        created = datetime.strptime(m.group(1), "%Y%m%d_%H%M%S") if m else datetime.fromtimestamp(os.path.getmtime(path))
+        e = {"file": name, "created": created.isoformat(timespec="seconds"), "size": len(raw), "sha256": hashlib.sha256(raw).hexdigest()}
+        if name.endswith(".manifest"):
+            man = json.loads(raw); e["patients"] = len(man["patients"])
+            for _, digest in man["patients"]:
+                chunk = _chunk_path(bdir, digest, man.get("compression", "none"))
+                if digest not in seen and os.path.exists(chunk): e["size"] += os.path.getsize(chunk)
+                seen.add(digest)
+        else:
+            try: e["patients"] = len(read_backup(path))
+            except Exception: e["patients"] = None
+        entries.append(e)
+    return entries
+
+def retained_backups(entries: List[Dict[str, Any]], keep_last: int, retention: Dict[str, int]) -> set:
+    """Grandfather-father-son selection over catalog entries (oldest first).
+
+    Keeps the newest keep_last snapshots plus, for each tier in retention
+    (hourly/daily/weekly/monthly -> count), the newest snapshot of each of
+    the most recent `count` periods that have one.
+    """
+    keep = {e["file"] for e in entries[-keep_last:]} if keep_last > 0 else set()
+    for tier, count in retention.items():
+        fmt, periods = RETENTION_BUCKETS[tier], set()
+        for e in reversed(entries):
+            if len(periods) >= int(count): break
+            period = datetime.fromisoformat(e["created"]).strftime(fmt)
+            if period not in periods:
+                periods.add(period); keep.add(e["file"])
+    return keep
+
+def _prune_backups(bdir: str, entries: List[Dict[str, Any]]):
+    keep = retained_backups(entries, int(SETTINGS.get("backups_to_keep", 10)), SETTINGS.get("backup_retention") or {})
+    pruned = [e for e in entries if e["file"] not in keep]
+    for e in pruned:
+        for path in (os.path.join(bdir, e["file"]), os.path.join(bdir, e["file"] + ".sums")):
+            try: os.remove(path)
+            except OSError: pass
+    entries[:] = [e for e in entries if e["file"] in keep]
+    _save_catalog(bdir, entries)
+    if any(e["file"].endswith(".manifest") for e in pruned): _gc_chunks(bdir)
+
+
+# Backups are captured synchronously (a consistent copy of the bytes) and then
+# hashed, compressed and written by one daemon worker, so saves don't wait on them.
+BACKUP_JOBS: deque = deque(maxlen=50)
+_backup_queue: "queue.Queue" = queue.Queue()
+_backup_thread = None
+
+def _backup_loop():
+    while True:
+        job = _backup_queue.get()
+        try:
+            bdir = os.path.dirname(job["path"]) or "."
+            if job["mode"] == "chunked":
+                info = write_chunked_backup(job.pop("data"), job["path"], job["compression"], job["backend"], job["created"])
+            else:
+                raw = job.pop("data"); packed = _codec(job["compression"])[1](raw)
+                _write_bytes(job["path"], packed)
+                # per-patient digests next to the copy, the way a manifest lists its chunks
+                sums = {mcp: hashlib.sha256(raw[a:b]).hexdigest() for mcp, (a, b, _) in index_patients(raw).items()}
+                atomic_write_text(job["path"] + ".sums", json.dumps({"patients": sums}, separators=(",", ":")))
+                info = {"patients": job["patients"], "size": len(packed), "sha256": hashlib.sha256(packed).hexdigest()}
+            name = os.path.basename(job["path"])
+            with _catalog_lock:
+                # a first-time scan already sees this file; a same-second backup replaced it
+                entries = [e for e in load_catalog(bdir) if e["file"] != name]
+                entries.append(dict(info, file=name, created=job["created"]))
+                _prune_backups(bdir, entries)
+                # queued snapshots are not in the catalog yet, but their markers must survive
+                _trim_mutation_log({os.path.join(bdir, e["file"]) for e in entries} |
+                                   {j["path"] for j in list(BACKUP_JOBS) if j["state"] == "pending"})
+            job["state"] = "done"
+            audit(f"{job['user']} created backup: {job['path']}")
+        except Exception as e:
+            job["state"] = "failed"; job["error"] = str(e)
+            audit(f"backup failed: {job['path']}: {e}")
+        finally:
+            job["finished"] = time.time()
+            _backup_queue.task_done()
+
+def make_backup(wait: bool = False, store: Optional[PatientStore] = None) -> Optional[str]:
+    """Queue a backup of `store` (the active one by default); returns its path (None if there is no data).
+
+    The data is read before returning, so the caller may overwrite it
+    right away; compression and writing happen on the backup worker.
+    """
+    global _backup_thread
+    bdir = SETTINGS.get("backup_dir", "backups")
+    os.makedirs(bdir, exist_ok=True)
+    now = datetime.now(); ts = now.strftime("%Y%m%d_%H%M%S")
+    if store is None: store = get_store()
+    if not store.has_data():
+        return None
+    mode = SETTINGS.get("backup_mode", "chunked")
+    compression = SETTINGS.get("backup_compression", "gzip")
+    suffix = ".manifest" if mode == "chunked" else ".json" + _codec(compression)[0]
+    # a write_all() snapshots before and after itself, often within the same second
+    taken, n, dst = {j["path"] for j in list(BACKUP_JOBS)}, 0, os.path.join(bdir, f"patients_{ts}{suffix}")
+    while dst in taken or os.path.exists(dst):
+        n += 1; dst = os.path.join(bdir, f"patients_{ts}_{n}{suffix}")
+    data = list(store.iter_chunks()) if mode == "chunked" else store.dump_bytes()
+    job = {"path": dst, "mode": mode, "patients": len(store.list_patients()), "compression": compression, "backend": store.backend, "data": data,
+           "created": now.isoformat(timespec="seconds"), "user": current_username(), "state": "pending", "queued": time.time()}
+    if SETTINGS.get("mutation_log", True):
+        with _mutation_lock, open(MUTATION_LOG, "a") as f:
+            f.write(json.dumps({"op": "backup", "path": dst, "ts": job["created"]}, separators=(",", ":")) + "\n")
+    BACKUP_JOBS.append(job)
+    if _backup_thread is None or not _backup_thread.is_alive():
+        _backup_thread = threading.Thread(target=_backup_loop, name="nlghi-backup", daemon=True)
+        _backup_thread.start()
+    _backup_queue.put(job)
+    if wait: wait_for_backups()
+    return dst
+
+def wait_for_backups():
+    """Block until every queued backup is written (call before exit)."""
+    _backup_queue.join()
+
+def backup_status() -> List[Dict[str, Any]]:
+    """Recent backup jobs, oldest first: path, state (pending/done/failed), error."""
+    return [{k: v for k, v in j.items() if k != "data"} for j in list(BACKUP_JOBS)]
+
+def list_backups() -> List[str]:
+    """Paths of finished backups, oldest first (from the catalog)."""
+    bdir = SETTINGS.get("backup_dir", "backups")
+    return [os.path.join(bdir, e["file"]) for e in load_catalog(bdir)]
+
+def _verify_full_copy(path: str, sha256: str) -> List[str]:
+    """Pool task: checksum, decompression and per-patient digests of a full backup."""
+    try:
+        with open(path, "rb") as f:
+            packed = f.read()
+    except OSError as e:
+        return [f"unreadable: {e}"]
+    if hashlib.sha256(packed).hexdigest() != sha256:
+        return ["checksum mismatch"]
+    try:
+        raw = _read_compressed(path)
+        patients = index_patients(raw)
+    except Exception as e:
+        return [f"cannot decode: {e}"]
+    try:
+        with open(path + ".sums", "r") as f:
+            sums = json.load(f)["patients"]
+    except (OSError, ValueError, KeyError):
+        return []
+    errors = [f"patient {mcp}: checksum mismatch" for mcp, (a, b, _) in patients.items()
+              if sums.get(mcp) != hashlib.sha256(raw[a:b]).hexdigest()]
+    errors += [f"patient {mcp}: missing" for mcp in sums if mcp not in patients]
+    return errors
+
+def _verify_chunks(bdir: str, chunks: List[Tuple[str, str]]) -> Dict[str, str]:
+    """Pool task: digest -> problem for every bad chunk in the batch."""
+    bad = {}
+    for digest, compression in chunks:
+        try:
+            if hashlib.sha256(_read_compressed(_chunk_path(bdir, digest, compression))).hexdigest() != digest:
+                bad[digest] = "checksum mismatch"
+        except FileNotFoundError:
+            bad[digest] = "missing chunk"
+        except Exception as e:
+            bad[digest] = f"cannot decode: {e}"
+    return bad
+
+def verify_backups(bdir: Optional[str] = None, workers: Optional[int] = None, batch: int = 256):
+    """Check every catalogued backup; yields {"path", "created", "ok", "errors"} newest first.
+
+    Full copies and batches of distinct chunks are verified in a process
+    pool; chunks shared by several snapshots are hashed once. Batches are
+    queued in newest-first order, so the most recent valid restore point
+    is reported before older snapshots finish.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    bdir = bdir or SETTINGS.get("backup_dir", "backups")
+    entries = list(reversed(load_catalog(bdir)))
+    if not entries: return
+    ctx = multiprocessing.get_context("spawn")  # the GUI process has threads; don't fork it
+    with ProcessPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1), mp_context=ctx) as pool:
+        plans, pending, queued = [], {}, {}
+        def submit_batch():
+            if pending:
+                fut = pool.submit(_verify_chunks, bdir, list(pending.items()))
+                for digest in pending: queued[digest] = fut
+                pending.clear()
+        for e in entries:
+            path = os.path.join(bdir, e["file"])
+            if not path.endswith(".manifest"):
+                plans.append((e, path, [], pool.submit(_verify_full_copy, path, e["sha256"]), [])); continue
+            errors, digests = [], []
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+                if hashlib.sha256(raw).hexdigest() != e["sha256"]: errors.append("checksum mismatch")
+                man = json.loads(raw)
+                compression = man.get("compression", "none")
+                for mcp, digest in man["patients"]:
+                    digests.append((mcp, digest))
+                    if digest not in queued and digest not in pending:
+                        pending[digest] = compression
+                        if len(pending) >= batch: submit_batch()
+            except (OSError, ValueError, KeyError) as ex:
+                errors.append(f"unreadable manifest: {ex}")
+            submit_batch()  # this snapshot's last chunks go out before the next snapshot's
+            plans.append((e, path, errors, None, digests))
+        for e, path, errors, full, digests in plans:
+            if full is not None:
+                errors = full.result()
+            else:
+                for fut in {id(queued[d]): queued[d] for _, d in digests}.values():
+                    bad = fut.result()
+                    errors += [f"patient {mcp}: {bad[d]}" for mcp, d in digests if d in bad and queued[d] is fut]
+            yield {"path": path, "created": e["created"], "ok": not errors, "errors": errors}
+
+def restore_backup(path: str):
+    """Swap the selected snapshot in as the live dataset.
+
+    Buffered writes are flushed first and the shared cache is dropped
+    afterwards, so callers only need to reload their views.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    wait_for_backups()
+    DATASTORE.flush()
+    get_store().write_all(read_backup(path))
+    DATASTORE.invalidate()
+    audit(f"{current_username()} restored backup: {path}")
+
+
+# Point-in-time recovery: every engine appends its mutations (the same op dicts
+# apply_op() takes) to MUTATION_LOG, and make_backup() drops a marker line when
+# it captures a snapshot. Recovering to T loads the last snapshot taken at or
+# before T and replays the ops logged after its marker up to T.
+_mutation_lock = threading.Lock()
+
+def _now_iso() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+def record_mutations(ops: List[Dict[str, Any]]):
+    if not SETTINGS.get("mutation_log", True) or not ops: return
+    ts = _now_iso()
+    lines = "".join(json.dumps(dict(op, ts=ts), separators=(",", ":")) + "\n" for op in ops)
+    limit = int(SETTINGS.get("mutation_log_max_kb", 8 * 1024)) * 1024
+    with _mutation_lock:
+        with open(MUTATION_LOG, "a") as f:
+            f.write(lines); size = f.tell()
+        # cut to half the limit, so a log at the limit isn't rewritten on every write
+        if size > limit: _cut_mutation_log(None, limit // 2)
+
+def iter_mutations(path: Optional[str] = None):
+    """Yield logged ops in order; a torn last line (crash mid-append) is ignored."""
+    path = path or MUTATION_LOG
+    if not os.path.exists(path): return
+    with open(path, "r") as f:
+        for line in f:
+            try: yield json.loads(line)
+            except ValueError: return
+
+def _trim_mutation_log(retained: Set[str]):
+    """Drop log lines older than the oldest marker of a snapshot in `retained`."""
+    with _mutation_lock:
+        _cut_mutation_log(retained)
+
+def _cut_mutation_log(retained: Optional[Set[str]], max_bytes: Optional[int] = None):
+    # Replay starts at a snapshot marker, so lines before the first usable one
+    # are dead. With max_bytes, keep the longest tail that starts at a marker
+    # and fits; with no such tail nothing is recoverable and the log empties.
+    # The file is streamed, never read whole. Callers hold _mutation_lock.
+    if not os.path.exists(MUTATION_LOG): return
+    size = os.path.getsize(MUTATION_LOG)
+    start = size - max_bytes if max_bytes is not None and size > max_bytes else 0
+    tmp = MUTATION_LOG + ".tmp"
+    with open(MUTATION_LOG, "rb") as f:
+        if start:
+            f.seek(start - 1); f.readline()  # to the first whole line at or after `start`
+        cut = None
+        for line in iter(f.readline, b""):
+            if b'"op":"backup"' in line and line.endswith(b"\n") and (retained is None or json.loads(line).get("path") in retained):
+                cut = f.tell() - len(line); break
+        if cut == 0: return
+        with open(tmp, "wb") as out:
+            if cut is not None:
+                f.seek(cut); shutil.copyfileobj(f, out)
+            out.flush(); os.fsync(out.fileno())
+    os.replace(tmp, MUTATION_LOG)
+
+def recover_dataset(when: datetime) -> Dict[str, Any]:
+    """The dataset as it was at `when`: nearest earlier snapshot plus replayed mutations."""
+    wait_for_backups()
+    until = when.isoformat(timespec="seconds")
+    available = set(list_backups())
+    ops = list(iter_mutations())
+    start = None
+    for i, op in enumerate(ops):
+        if op["ts"] > until: break
+        if op["op"] == "backup" and op["path"] in available: start = i
+        elif op["op"] == "replace_all" and "data" not in op: start = None  # no snapshot was taken for it
+    if start is None:
+        raise ValueError(f"No backup with recorded history at or before {until}")
+    d = read_backup(ops[start]["path"])
+    for op in ops[start + 1:]:
+        if op["ts"] > until: break
+        if op["op"] == "replace_all": d = op["data"]
+        elif op["op"] != "backup": apply_op(d, op)
+    return d
+
+def restore_to_time(when: datetime):
+    """Point-in-time recovery of the live dataset (see recover_dataset)."""
+    d = recover_dataset(when)
+    DATASTORE.flush()
+    get_store().write_all(d)
+    DATASTORE.invalidate()
+    audit(f"{current_username()} recovered data to {when.isoformat(timespec='seconds')}")
+
+
+
+
+SECTIONS = ("records", "history", "notes", "future_refs", "symptom_snapshots", "attachments")
+HEADER_FIELDS = ("name", "dob", "age", "gender")
+
+def patient_header(p: Dict[str, Any]) -> Dict[str, Any]:
+    """Registry-level fields of a patient (no record/history bodies)."""
+    h = {k: p.get(k, "" if k != "age" else 0) for k in HEADER_FIELDS}
+    h["tags"] = list(p.get("tags", []))
+    return h
+
+SUMMARY_FIELDS = ("record_count", "last_visit", "latest_ghi", "pending_refs")
+
+def _iso_day(v) -> str:
+    try: return date.fromisoformat(v).isoformat()
+    except (TypeError, ValueError): return ""
+
+def _is_pending(fr) -> bool:
+    return isinstance(fr, dict) and not fr.get("done")
+
+def patient_summary(visits, future_refs) -> Dict[str, Any]:
+    """Registry summary from (session_date, ghi) pairs in entry order and the future_refs list."""
+    visits = list(visits)
+    return {"record_count": len(visits), "last_visit": max((_iso_day(s) for s, _ in visits), default=""),
+            "latest_ghi": visits[-1][1] if visits else None, "pending_refs": sum(map(_is_pending, future_refs))}
+
+def registry_entry(p: Dict[str, Any]) -> Dict[str, Any]:
+    """What the registry shows for one patient: header fields plus the maintained summary."""
+    h = patient_header(p)
+    recs = [(r.get("session_date"), r.get("ghi")) if isinstance(r, dict) else (None, None) for r in p.get("records", [])]
+    h.update(patient_summary(recs, p.get("future_refs", [])))
+    return h
+
+def registry_after_op(entry: Optional[Dict[str, Any]], op: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A registry row moved forward by one op without the patient body.
+
+    Returns None when the op needs the body (an update or removal of a
+    record or future reference) and the row must be recomputed instead.
+    """
+    kind, section = op["op"], op.get("section")
+    if kind == "delete_patient": return None
+    if section in ("records", "future_refs") and kind != "append": return None
+    tmp = {} if entry is None else {op["mcp"]: patient_header(entry)}
+    apply_op(tmp, dict(op, op="ensure") if kind in ("append", "update", "remove") else op)
+    out = dict(registry_entry({}) if entry is None else entry, **patient_header(tmp[op["mcp"]]))
+    if kind == "append" and section == "records":
+        e = op["entry"]
+        out["record_count"] += 1; out["latest_ghi"] = e.get("ghi")
+        out["last_visit"] = max(out["last_visit"], _iso_day(e.get("session_date")))
+    elif kind == "append" and section == "future_refs":
+        out["pending_refs"] += _is_pending(op["entry"])
+    return out
+
+# fn(store, ops, replaced) runs after every engine write, including ones that
+# bypass DATASTORE (CLI, restore); replaced is the dataset a write_all() stored.
+WRITE_HOOKS: List[Any] = []
+
+
+def apply_op(d: Dict[str, Any], op: Dict[str, Any]):
+    """Apply one storage mutation (see PatientStore) to an in-memory dataset."""
+    kind, mcp = op["op"], op["mcp"]
+    if kind == "delete_patient":
+        d.pop(mcp, None); return
+    p = ensure_patient_struct(d, mcp, op.get("name", ""), op.get("gender", ""), op.get("dob", ""), op.get("age", 0))
+    if kind == "append":
+        p[op["section"]].append(op["entry"])
+    elif kind == "update":
+        L = p[op["section"]]; idx = op["index"]
+        if 0 <= idx < len(L): L[idx].update(op["fields"])
+    elif kind == "remove":
+        L = p[op["section"]]; idx = op["index"]
+        if 0 <= idx < len(L): del L[idx]
+    elif kind == "set_tags":
+        p["tags"] = list(op["tags"])
+    elif kind != "ensure":
+        raise ValueError(f"Unknown storage op: {kind}")
+
+
+class PatientStore:
+    """Storage engine for the patient dataset.
+
+    UI code talks to the active engine through get_store(); every mutation is
+    expressed as a small op dict (see apply_op) so engines can persist only
+    what changed.
+    """
+
+    backend = ""
+    live = False  # True when read_all() hands out the engine's own in-memory dataset
+    _backed_up = False
+
+    def read_all(self) -> Dict[str, Any]: raise NotImplementedError
+    def write_all(self, d: Dict[str, Any]): raise NotImplementedError
+    def apply(self, op: Dict[str, Any]): raise NotImplementedError
+
+    def apply_many(self, ops: List[Dict[str, Any]]):
+        for op in ops: self.apply(op)
+
+    def has_data(self) -> bool: return bool(self.list_patients())
+    def close(self): pass
+    def version(self): return None
+
+    def _before_write(self):
+        # A full snapshot costs O(dataset); incremental engines take one per session, not per mutation.
+        if SETTINGS.get("auto_backup", True) and not self._backed_up:
+            self._backed_up = True
+            make_backup()
+
+    def _after_write(self, ops=None, replaced=None):
+        # feeds point-in-time recovery; a write_all() is logged as a snapshot of the new
+        # data (its backup marker), or without auto_backup as a barrier replay can't cross
+        if replaced is None: record_mutations(ops)
+        elif SETTINGS.get("mutation_log", True):
+            if not (SETTINGS.get("auto_backup", True) and make_backup(store=self)):
+                record_mutations([{"op": "replace_all", "mcp": ""}])
+        for fn in WRITE_HOOKS:
+            # a derived index must never fail a write that is already committed
+            try: fn(self, ops, replaced)
+            except Exception as e: audit(f"Write hook {getattr(fn, '__qualname__', fn)} failed: {e}")
+
+    def list_patients(self) -> Dict[str, Dict[str, Any]]:
+        """mcp -> registry_entry(), which engines keep materialized alongside the data."""
+        return {mcp: registry_entry(p) for mcp, p in self.read_all().items()}
+
+    def get_patient(self, mcp: str, sections=None):
+        p = self.read_all().get(mcp)
+        if p is None: return None
+        out = patient_header(p)
+        for s in (SECTIONS if sections is None else sections):
+            out[s] = list(p.get(s, []))
+        return out
+
+    def get_section(self, mcp: str, section: str) -> List[Dict[str, Any]]:
+        p = self.get_patient(mcp, (section,))
+        return p[section] if p else []
+
+    def iter_patients(self, sections=None):
+        """Yield (mcp, get_patient(mcp, sections)) for every patient, in registry order."""
+        for mcp in self.list_patients():
+            p = self.get_patient(mcp, sections)
+            if p is not None: yield mcp, p
+
+    def snapshot(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.read_all(), f, indent=2)
+
+    def restore(self, path: str):
+        with open(path, "r") as f:
+            self.write_all(json.load(f))
+
+    def iter_records(self):
+        """Yield (mcp, record) for every visit record, patients in registry order."""
+        for mcp, p in self.read_all().items():
+            for r in p.get("records", []):
+                yield mcp, r
+
+    def iter_latest_field(self, key: str):
+        """Yield (mcp, record[key]) from each patient's last entered record (None when absent)."""
+        for mcp, p in self.read_all().items():
+            if p.get("records") and isinstance(p["records"][-1], dict):
+                yield mcp, p["records"][-1].get(key)
+
+    def dump_bytes(self) -> bytes:
+        """The whole dataset as JSON bytes, for full backups."""
+        return json.dumps(self.read_all(), indent=2).encode("utf-8")
+
+    def iter_chunks(self):
+        """Yield (mcp, JSON bytes) per patient, for chunked backups."""
+        for mcp, p in self.read_all().items():
+            yield mcp, json.dumps(p, indent=2).encode("utf-8")
+
+    
+    def ensure_patient(self, mcp, name="", gender="", dob="", age=0):
+        self.apply({"op": "ensure", "mcp": mcp, "name": name, "gender": gender, "dob": dob, "age": age})
+
+    def append_entry(self, mcp, section, entry, **patient):
+        """patient: name/gender/dob/age used if the MCP is new."""
+        self.apply(dict(patient, op="append", mcp=mcp, section=section, entry=entry))
+
+    def update_entry(self, mcp, section, index, fields):
+        self.apply({"op": "update", "mcp": mcp, "section": section, "index": index, "fields": fields})
+
+    def remove_entry(self, mcp, section, index):
+        self.apply({"op": "remove", "mcp": mcp, "section": section, "index": index})
+
+    def set_tags(self, mcp, tags):
+        self.apply({"op": "set_tags", "mcp": mcp, "tags": list(tags)})
+
+    def delete_patient(self, mcp):
+        self.apply({"op": "delete_patient", "mcp": mcp})
+
+
+class JsonPatientStore(PatientStore):
+    """Original single-file layout: every call parses/rewrites DATA_FILE."""
+
+    backend = "json"
+
+    def __init__(self):
+        self._idx = (None, {})
+
+    def read_all(self): return read_data()
+    def write_all(self, d): write_data(d); self._after_write(replaced=d)
+    def has_data(self): return os.path.exists(DATA_FILE)
+
+    def _index(self):
+        """mcp -> [start, end, registry entry] for the current DATA_FILE, from the sidecar when fresh."""
+        ver = self.version()
+        if ver is None: return {}
+        if self._idx[0] != ver:
+            self._idx = load_data_index()
+        if self._idx[0] != ver:
+            try:
+                with open(DATA_FILE, "rb") as f:
+                    patients = index_patients(f.read())
+                save_data_index(ver, patients)
+            except (OSError, ValueError):
+                patients = {}
+            self._idx = (ver, patients)
+        return self._idx[1]
+
+    def list_patients(self):
+        return {mcp: dict(e[2]) for mcp, e in self._index().items()}
+
+    def get_patient(self, mcp, sections=None):
+        e = self._index().get(mcp)
+        if e is None: return None
+        with open(DATA_FILE, "rb") as f:
+            f.seek(e[0]); p = json.loads(f.read(e[1] - e[0]))
+        out = patient_header(p)
+        for s in (SECTIONS if sections is None else sections):
+            out[s] = list(p.get(s, []))
+        return out
+
+    def version(self):
+        try:
+            st = os.stat(DATA_FILE); return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def apply(self, op):
+        self.apply_many([op])
+
+    def apply_many(self, ops):
+        d = read_data()
+        for op in ops: apply_op(d, op)
+        write_data(d)
+        self._after_write(ops)
+
+    def snapshot(self, path): shutil.copyfile(DATA_FILE, path)
+
+    def dump_bytes(self):
+        with open(DATA_FILE, "rb") as f:
+            return f.read()
+
+    def iter_chunks(self):
+        # patient bodies are sliced straight out of the data file, no parse
+        idx = self._index()
+        with open(DATA_FILE, "rb") as f:
+            raw = f.read()
+        for mcp, (a, b, _) in idx.items():
+            yield mcp, raw[a:b]
+
+
+# registry summary columns, maintained in the same transaction as the rows they summarize
+_SQL_SUMMARY_COLUMNS = (("record_count", "INTEGER NOT NULL DEFAULT 0"), ("last_visit", "TEXT NOT NULL DEFAULT ''"),
+                        ("latest_ghi", "REAL"), ("pending_refs", "INTEGER NOT NULL DEFAULT 0"))
+
+_SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    mcp TEXT PRIMARY KEY, name TEXT NOT NULL DEFAULT '', dob TEXT NOT NULL DEFAULT '',
+    age INTEGER NOT NULL DEFAULT 0, gender TEXT NOT NULL DEFAULT '', extra TEXT NOT NULL DEFAULT '{}',
+    """ + ", ".join(f"{c} {t}" for c, t in _SQL_SUMMARY_COLUMNS) + """
+);
+CREATE TABLE IF NOT EXISTS tags (
+    mcp TEXT NOT NULL REFERENCES patients(mcp) ON DELETE CASCADE, tag TEXT NOT NULL, UNIQUE (mcp, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_tags_tag ON tags(tag);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, mcp TEXT NOT NULL REFERENCES patients(mcp) ON DELETE CASCADE,
+    session_date TEXT NOT NULL DEFAULT '', ghi REAL, data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_mcp ON records(mcp, id);
+CREATE INDEX IF NOT EXISTS idx_records_session_date ON records(session_date);
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS {s} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, mcp TEXT NOT NULL REFERENCES patients(mcp) ON DELETE CASCADE, data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_{s}_mcp ON {s}(mcp, id);
+""" for s in SECTIONS[1:])
+
+
+class SqlitePatientStore(PatientStore):
+    """SQLite engine: one row per patient/record/entry, so each UI action
+    reads or writes only the rows it touches."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._writes = 0
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(_SQL_SCHEMA)
+        cols = {r[1] for r in self._conn.execute("PRAGMA table_info(patients)")}
+        if not {c for c, _ in _SQL_SUMMARY_COLUMNS} <= cols:  # database from before the registry summaries
+            with self._conn:
+                for c, t in _SQL_SUMMARY_COLUMNS:
+                    if c not in cols: self._conn.execute(f"ALTER TABLE patients ADD COLUMN {c} {t}")
+                self._refresh_summaries([mcp for (mcp,) in self._conn.execute("SELECT mcp FROM patients")])
+
+    def close(self):
+        with self._lock: self._conn.close()
+
+    @staticmethod
+    def _section_table(section: str) -> str:
+        if section not in SECTIONS: raise ValueError(f"Unknown section: {section}")
+        return section
+
+    def _insert_entry(self, mcp, section, entry):
+        if section == "records":
+            self._conn.execute("INSERT INTO records (mcp, session_date, ghi, data) VALUES (?,?,?,?)",
+                               (mcp, str(entry.get("session_date", "")), entry.get("ghi"), json.dumps(entry)))
+        else:
+            self._conn.execute(f"INSERT INTO {self._section_table(section)} (mcp, data) VALUES (?,?)", (mcp, json.dumps(entry)))
+
+    def _insert_patient(self, mcp, p):
+        extra = {k: v for k, v in p.items() if k not in HEADER_FIELDS and k != "tags" and k not in SECTIONS}
+        summary = registry_entry(p)
+        self._conn.execute("INSERT OR REPLACE INTO patients (mcp, name, dob, age, gender, extra, record_count, last_visit, latest_ghi, pending_refs)"
+                           " VALUES (?,?,?,?,?,?,?,?,?,?)", (mcp, p.get("name", ""), p.get("dob", ""), p.get("age", 0), p.get("gender", ""),
+                                                            json.dumps(extra), *[summary[k] for k in SUMMARY_FIELDS]))
+        self._conn.executemany("INSERT OR IGNORE INTO tags (mcp, tag) VALUES (?,?)", [(mcp, t) for t in p.get("tags", [])])
+        for s in SECTIONS:
+            for e in p.get(s, []):
+                self._insert_entry(mcp, s, e)
+
+    def _entry_row(self, mcp, section, index):
+        if index < 0: return None
+        return self._conn.execute(f"SELECT id, data FROM {self._section_table(section)} WHERE mcp=? ORDER BY id LIMIT 1 OFFSET ?",
+                                  (mcp, index)).fetchone()
+
+    def _refresh_summaries(self, mcps):
+        for mcp in mcps:
+            visits = self._conn.execute("SELECT session_date, ghi FROM records WHERE mcp=? ORDER BY id", (mcp,)).fetchall()
+            refs = [json.loads(x) for (x,) in self._conn.execute("SELECT data FROM future_refs WHERE mcp=? ORDER BY id", (mcp,))]
+            summary = patient_summary(visits, refs)
+            self._conn.execute("UPDATE patients SET record_count=?, last_visit=?, latest_ghi=?, pending_refs=? WHERE mcp=?",
+                               (*[summary[k] for k in SUMMARY_FIELDS], mcp))
+
+    def _replace_all(self, d):
+        with self._conn:
+            self._conn.execute("DELETE FROM patients")
+            for mcp, p in d.items():
+                self._insert_patient(mcp, p)
+
+    def _patient_from_row(self, mcp, row, sections):
+        name, dob, age, gender, extra = row
+        p = json.loads(extra)
+        p.update({"name": name, "dob": dob, "age": age, "gender": gender})
+        p["tags"] = [t for (t,) in self._conn.execute("SELECT tag FROM tags WHERE mcp=? ORDER BY rowid", (mcp,))]
+        for s in (SECTIONS if sections is None else sections):
+            p[s] = [json.loads(x) for (x,) in self._conn.execute(
+                f"SELECT data FROM {self._section_table(s)} WHERE mcp=? ORDER BY id", (mcp,))]
+        return p
+
+    
+    def has_data(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM patients LIMIT 1").fetchone() is not None
+
+    def iter_records(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT r.mcp, r.data FROM records r JOIN patients p ON p.mcp = r.mcp ORDER BY p.rowid, r.id").fetchall()
+        for mcp, data in rows:
+            yield mcp, json.loads(data)
+
+    def iter_latest_field(self, key):
+        # SQLite extracts the one field, so record bodies are never parsed here
+        path = "$." + json.dumps(key)
+        with self._lock:
+            rows = self._conn.execute("SELECT mcp, json_extract(data, ?), json_type(data, ?) FROM records"
+                                      " WHERE id IN (SELECT MAX(id) FROM records GROUP BY mcp)", (path, path)).fetchall()
+        for mcp, value, kind in rows:
+            yield mcp, json.loads(value) if kind in ("array", "object") else value
+
+    def version(self):
+        # data_version only moves for commits made by other connections
+        with self._lock:
+            return (self._writes, self._conn.execute("PRAGMA data_version").fetchone()[0])
+
+    def list_patients(self):
+        with self._lock:
+            out = {mcp: dict({"name": n, "dob": dob, "age": a, "gender": g, "tags": []}, **dict(zip(SUMMARY_FIELDS, summary)))
+                   for mcp, n, dob, a, g, *summary in self._conn.execute(
+                       f"SELECT mcp, name, dob, age, gender, {', '.join(SUMMARY_FIELDS)} FROM patients ORDER BY rowid")}
+            for mcp, tag in self._conn.execute("SELECT mcp, tag FROM tags ORDER BY rowid"):
+                if mcp in out: out[mcp]["tags"].append(tag)
+            return out
+
+    def get_patient(self, mcp, sections=None):
+        with self._lock:
+            row = self._conn.execute("SELECT name, dob, age, gender, extra FROM patients WHERE mcp=?", (mcp,)).fetchone()
+            return None if row is None else self._patient_from_row(mcp, row, sections)
+
+    def read_all(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT mcp, name, dob, age, gender, extra FROM patients ORDER BY rowid").fetchall()
+            return {r[0]: self._patient_from_row(r[0], r[1:], None) for r in rows}
+
+    def iter_patients(self, sections=None, page=500):
+        # a page of patients costs one query per table; the lock is released between pages
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute("SELECT rowid, mcp, name, dob, age, gender, extra FROM patients"
+                                          " WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, page)).fetchall()
+                if not rows: return
+                out = {}
+                for _, mcp, name, dob, age, gender, extra in rows:
+                    out[mcp] = p = json.loads(extra)
+                    p.update({"name": name, "dob": dob, "age": age, "gender": gender, "tags": []})
+                    for sec in (SECTIONS if sections is None else sections): p[sec] = []
+                marks = ",".join("?" * len(out))
+                for mcp, tag in self._conn.execute(f"SELECT mcp, tag FROM tags WHERE mcp IN ({marks}) ORDER BY rowid", list(out)):
+                    out[mcp]["tags"].append(tag)
+                for sec in (SECTIONS if sections is None else sections):
+                    for mcp, x in self._conn.execute(f"SELECT mcp, data FROM {self._section_table(sec)} WHERE mcp IN ({marks}) ORDER BY id", list(out)):
+                        out[mcp][sec].append(json.loads(x))
+            last = rows[-1][0]
+            yield from out.items()
+
+    def write_all(self, d):
+        with self._lock:
+            self._before_write()
+            self._replace_all(d)
+            self._writes += 1
+            self._after_write(replaced=d)
+        audit(f"{current_username()} wrote database ({len(d)} patients).")
+
+    def apply(self, op):
+        self.apply_many([op])
+
+    def apply_many(self, ops):
+        with self._lock:
+            self._before_write()
+            self._writes += 1
+            with self._conn:
+                for op in ops:
+                    self._apply_one(op)
+                self._refresh_summaries(dict.fromkeys(op["mcp"] for op in ops if op["op"] != "delete_patient"
+                                                      and op.get("section") in ("records", "future_refs")))
+            self._after_write(ops)
+
+    def _apply_one(self, op):
+        kind, mcp = op["op"], op["mcp"]
+        if kind == "delete_patient":
+            self._conn.execute("DELETE FROM patients WHERE mcp=?", (mcp,))
+            return
+        self._conn.execute("INSERT OR IGNORE INTO patients (mcp, name, dob, age, gender) VALUES (?,?,?,?,?)",
+                           (mcp, op.get("name", ""), op.get("dob", ""), op.get("age", 0), op.get("gender", "")))
+        if kind == "append":
+            self._insert_entry(mcp, op["section"], op["entry"])
+        elif kind == "update":
+            row = self._entry_row(mcp, op["section"], op["index"])
+            if row:
+                e = json.loads(row[1]); e.update(op["fields"])
+                table = self._section_table(op["section"])
+                if table == "records":
+                    self._conn.execute("UPDATE records SET session_date=?, ghi=?, data=? WHERE id=?",
+                                       (str(e.get("session_date", "")), e.get("ghi"), json.dumps(e), row[0]))
+                else:
+                    self._conn.execute(f"UPDATE {table} SET data=? WHERE id=?", (json.dumps(e), row[0]))
+        elif kind == "remove":
+            row = self._entry_row(mcp, op["section"], op["index"])
+            if row: self._conn.execute(f"DELETE FROM {self._section_table(op['section'])} WHERE id=?", (row[0],))
+        elif kind == "set_tags":
+            self._conn.execute("DELETE FROM tags WHERE mcp=?", (mcp,))
+            self._conn.executemany("INSERT OR IGNORE INTO tags (mcp, tag) VALUES (?,?)", [(mcp, t) for t in op["tags"]])
+        elif kind != "ensure":
+            raise ValueError(f"Unknown storage op: {kind}")
+
+
+def migrate_json_to_sqlite(json_path: str = DATA_FILE, db_path: str = DB_FILE) -> int:
+    """One-shot import of the legacy JSON data file into a SQLite database."""
+    with open(json_path, "r") as f:
+        d = json.load(f)
+    store = SqlitePatientStore(db_path)
+    try:
+        store._replace_all(d)
+    finally:
+        store.close()
+    audit(f"{current_username()} migrated {json_path} -> {db_path} ({len(d)} patients).")
+    return len(d)
+
+
+def iter_journal(path: str):
+    """Yield the ops recorded in a journal file, stopping at a torn trailing line."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+
+class JournalPatientStore(PatientStore):
+    """Base JSON file plus an append-only JSONL journal of ops.
+
+    Mutations are applied in memory and appended as one compact line; a
+    committer thread fsyncs whatever accumulated in each journal_commit_ms
+    window (group commit). Once the journal passes journal_compact_kb it is
+    rotated and folded into the base file on a background thread.
+    """
+
+    backend = "journal"
+    live = True
+
+    def __init__(self, path: str = DATA_FILE):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.rotated_path = path + ".journal.compacting"
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._compact_lock = threading.Lock()
+        self._pending = 0; self._closed = False; self._compacting = False; self._writes = 0
+        self._data = self._load()
+        self._registry = {mcp: registry_entry(p) for mcp, p in self._data.items()}
+        self._log = open(self.journal_path, "a", encoding="utf-8")
+        if os.path.exists(self.rotated_path):
+            self._checkpoint()
+        threading.Thread(target=self._commit_loop, name="nlghi-journal", daemon=True).start()
+
+    def _load(self):
+        d, base_sha = {}, None
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            d = json.loads(raw) if raw.strip() else {}
+            base_sha = hashlib.sha256(raw).hexdigest()
+        for jp in (self.rotated_path, self.journal_path):
+            if not os.path.exists(jp): continue
+            ops = []
+            for op in iter_journal(jp):
+                if op.get("op") == "checkpoint":
+                    # the rotated journal was already folded into this exact base file
+                    if op.get("sha256") == base_sha: ops = []
+                    continue
+                ops.append(op)
+            for op in ops:
+                apply_op(d, op)
+        return d
+
+    
+    def _commit_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if self._closed: return
+            time.sleep(max(0, int(SETTINGS.get("journal_commit_ms", 50))) / 1000.0)
+            with self._lock:
+                if self._closed: return
+                self._sync()
+
+    def _sync(self):
+        if self._pending:
+            self._log.flush(); os.fsync(self._log.fileno()); self._pending = 0
+        limit = int(SETTINGS.get("journal_compact_kb", 1024)) * 1024
+        if not self._compacting and self._log.tell() > limit:
+            self._compacting = True
+            threading.Thread(target=self._compact, name="nlghi-compact", daemon=True).start()
+
+    def flush(self):
+        """Force the pending group commit to disk now."""
+        with self._lock:
+            if not self._closed: self._sync()
+
+    def _compact(self):
+        try:
+            with self._compact_lock:
+                with self._lock:
+                    if self._closed: return
+                    self._log.flush(); os.fsync(self._log.fileno()); self._pending = 0
+                    self._log.close()
+                    os.replace(self.journal_path, self.rotated_path)
+                    self._log = open(self.journal_path, "a", encoding="utf-8")
+                    blob = json.dumps(self._data, indent=2)
+                sha = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+                with open(self.rotated_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"op": "checkpoint", "sha256": sha}) + "\n"); f.flush(); os.fsync(f.fileno())
+                atomic_write_text(self.path, blob)
+                os.remove(self.rotated_path)
+            audit(f"{current_username()} compacted journal into {self.path} ({len(blob)} bytes).")
+        finally:
+            self._compacting = False
+
+    def _checkpoint(self):
+        """Synchronously fold everything into the base file and empty the journal."""
+        with self._compact_lock, self._lock:
+            atomic_write_text(self.path, json.dumps(self._data, indent=2))
+            self._log.close()
+            if os.path.exists(self.rotated_path): os.remove(self.rotated_path)
+            self._log = open(self.journal_path, "w", encoding="utf-8")
+            self._pending = 0
+
+    def close(self):
+        if self._closed: return
+        self._checkpoint()
+        with self._cond:
+            self._closed = True; self._cond.notify_all()
+            self._log.close()
+
+    
+    def read_all(self): return self._data
+    def has_data(self): return bool(self._data)
+    def version(self): return self._writes
+
+    def list_patients(self):
+        with self._lock:
+            return {mcp: dict(e, tags=list(e["tags"])) for mcp, e in self._registry.items()}
+
+    def get_patient(self, mcp, sections=None):
+        with self._lock:
+            return super().get_patient(mcp, sections)
+
+    def snapshot(self, path):
+        with self._lock:
+            blob = json.dumps(self._data, indent=2)
+        with open(path, "w") as f:
+            f.write(blob)
+
+    def write_all(self, d):
+        with self._lock:
+            self._before_write()
+            self._data = d; self._writes += 1
+            self._registry = {mcp: registry_entry(p) for mcp, p in d.items()}
+            self._after_write(replaced=d)
+        self._checkpoint()
+        audit(f"{current_username()} wrote data file ({len(d)} patients).")
+
+    def apply(self, op):
+        with self._cond:
+            self._before_write()
+            apply_op(self._data, op); self._writes += 1
+            p = self._data.get(op["mcp"])
+            if p is None: self._registry.pop(op["mcp"], None)
+            else: self._registry[op["mcp"]] = registry_entry(p)
+            self._log.write(json.dumps(dict(op, ts=datetime.now().isoformat(timespec="seconds")), separators=(",", ":")) + "\n")
+            self._pending += 1
+            self._cond.notify()
+            self._after_write([op])
+
+
+class ShardedPatientStore(PatientStore):
+    """One JSON file per MCP under PATIENTS_DIR plus a small manifest.json.
+
+    The registry is served from the manifest alone and each mutation
+    rewrites only the touched patient's shard and its manifest row.
+    """
+
+    backend = "sharded"
+
+    def __init__(self, root: str = PATIENTS_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self._lock = threading.RLock()
+        self._writes = 0
+        os.makedirs(root, exist_ok=True)
+        self._manifest = self._load_manifest()
+
+    def _shard_path(self, mcp: str) -> str:
+        return os.path.join(self.root, quote(mcp, safe="") + ".json")
+
+    def _shard_mcps(self):
+        return [unquote(f[:-5]) for f in sorted(os.listdir(self.root)) if f.endswith(".json") and f != "manifest.json"]
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                m = json.load(f)
+            if all(set(SUMMARY_FIELDS) <= set(e) for e in m.values()):
+                return m
+        # manifest lost or written before the registry summaries: rebuild it from the shards
+        m = {mcp: registry_entry(self._read_shard(mcp) or {}) for mcp in self._shard_mcps()}
+        if m: atomic_write_text(self.manifest_path, json.dumps(m, separators=(",", ":")))
+        return m
+
+    def _read_shard(self, mcp):
+        try:
+            with open(self._shard_path(mcp), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    
+    def has_data(self): return bool(self._manifest)
+
+    def version(self):
+        with self._lock:
+            return self._writes
+
+    def list_patients(self):
+        with self._lock:
+            return {mcp: dict(e, tags=list(e.get("tags", []))) for mcp, e in self._manifest.items()}
+
+    def get_patient(self, mcp, sections=None):
+        with self._lock:
+            p = self._read_shard(mcp)
+        if p is None: return None
+        out = patient_header(p)
+        for s in (SECTIONS if sections is None else sections):
+            out[s] = list(p.get(s, []))
+        return out
+
+    def read_all(self):
+        with self._lock:
+            return {mcp: self._read_shard(mcp) or {} for mcp in self._manifest}
+
+    def iter_chunks(self):
+        with self._lock:
+            for mcp in self._manifest:
+                with open(self._shard_path(mcp), "rb") as f:
+                    yield mcp, f.read()
+
+    def write_all(self, d):
+        with self._lock:
+            self._before_write()
+            for mcp in set(self._manifest) - set(d):
+                if os.path.exists(self._shard_path(mcp)): os.remove(self._shard_path(mcp))
+            for mcp, p in d.items():
+                atomic_write_text(self._shard_path(mcp), json.dumps(p, indent=2))
+            self._manifest = {mcp: registry_entry(p) for mcp, p in d.items()}
+            atomic_write_text(self.manifest_path, json.dumps(self._manifest, separators=(",", ":")))
+            self._writes += 1
+            self._after_write(replaced=d)
+        audit(f"{current_username()} wrote patient shards ({len(d)} patients).")
+
+    def apply_many(self, ops):
+        with self._lock:
+            self._before_write()
+            touched = {}
+            for op in ops:
+                mcp = op["mcp"]
+                if mcp not in touched: touched[mcp] = self._read_shard(mcp)
+                tmp = {} if touched[mcp] is None else {mcp: touched[mcp]}
+                apply_op(tmp, op); touched[mcp] = tmp.get(mcp)
+            for mcp, p in touched.items():
+                if p is None:
+                    if os.path.exists(self._shard_path(mcp)): os.remove(self._shard_path(mcp))
+                    self._manifest.pop(mcp, None)
+                else:
+                    atomic_write_text(self._shard_path(mcp), json.dumps(p, indent=2))
+                    self._manifest[mcp] = registry_entry(p)
+            atomic_write_text(self.manifest_path, json.dumps(self._manifest, separators=(",", ":")))
+            self._writes += 1
+            self._after_write(ops)
+
+    def apply(self, op):
+        self.apply_many([op])
+
+
+STORAGE_BACKENDS = ("sqlite", "sharded", "journal", "json")
+_STORE = None
+
+def get_store() -> PatientStore:
+    """Return the storage engine selected by SETTINGS['storage_backend']."""
+    global _STORE
+    backend = SETTINGS.get("storage_backend", "sqlite")
+    if _STORE is None or _STORE.backend != backend:
+        close_store()
+        if backend == "sqlite":
+            if not os.path.exists(DB_FILE) and os.path.exists(DATA_FILE):
+                migrate_json_to_sqlite(DATA_FILE, DB_FILE)
+            _STORE = SqlitePatientStore(DB_FILE)
+        elif backend == "journal":
+            _STORE = JournalPatientStore(DATA_FILE)
+        elif backend == "sharded":
+            fresh = not os.path.exists(PATIENTS_DIR)
+            _STORE = ShardedPatientStore(PATIENTS_DIR)
+            if fresh and os.path.exists(DATA_FILE):
+                _STORE.write_all(read_data())
+        elif backend == "json":
+            _STORE = JsonPatientStore()
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+    return _STORE
+
+def close_store():
+    """Flush and release the active storage engine (called on exit and engine switch)."""
+    global _STORE
+    if _STORE is not None:
+        _STORE.close(); _STORE = None
+
+
+class DataStore(PatientStore):
+    """Shared in-process cache over the active storage engine.
+
+    Parsed data is kept until the engine's version() changes (file
+    mtime/size, SQLite change counters), so repeated reads from the
+    registry and dialogs cost nothing. Only the registry index is loaded
+    up front; full patient bodies are hydrated on demand into a bounded LRU
+    (SETTINGS['patient_cache_size']). Writes made through the DataStore
+    patch the cache in place instead of dropping it.
+
+    With SETTINGS['write_behind_ms'] > 0 writes are buffered instead: the
+    cache is patched, the patient is marked dirty and on_dirty() is called
+    so the GUI can schedule flush(), which hands the whole burst to the
+    engine as one write.
+
+    Derived in-memory indexes register a callable in `listeners`; it is
+    called as fn(mcps, token) after every write made through the DataStore,
+    once the cache reflects it. token is (id(engine), version) after the
+    write; version is None while the write is still buffered.
+    """
+
+    def __init__(self):
+        self._token = None
+        self._all = None       # full dataset, kept for engines that parse everything anyway
+        self._index = None     # mcp -> patient_header
+        self._patients = OrderedDict()  # LRU of mcp -> full patient, when _all is not loaded
+        self._pending = []; self._pending_store = None
+        self.dirty = set()
+        self.on_dirty = None
+        self.listeners = []
+
+    def invalidate(self):
+        self._token = None; self._all = None; self._index = None; self._patients = OrderedDict()
+
+    def _store(self) -> PatientStore:
+        if self._pending:
+            return self._pending_store  # the cache is authoritative while writes are buffered
+        store = get_store()
+        token = (id(store), store.version())
+        if store.live or token[1] is None or token != self._token:
+            self.invalidate()
+            self._token = None if store.live else token
+        return store
+
+    def _load_all(self, store):
+        if self._all is None:
+            self.flush()  # buffered writes may only live in the per-patient cache
+            self._all = store.read_all(); self._patients = OrderedDict()
+        return self._all
+
+    def read_all(self):
+        store = self._store()
+        return store.read_all() if store.live else self._load_all(store)
+
+    def list_patients(self):
+        store = self._store()
+        if store.live: return store.list_patients()
+        if self._index is None:
+            self._index = store.list_patients()
+        return self._index
+
+    def _hydrate(self, store, mcp):
+        if mcp in self._patients:
+            self._patients.move_to_end(mcp)
+        else:
+            self._patients[mcp] = store.get_patient(mcp)
+            excess = len(self._patients) - max(1, int(SETTINGS.get("patient_cache_size", 64)))
+            for old in [k for k in self._patients if k not in self.dirty][:max(0, excess)]:
+                del self._patients[old]
+        return self._patients[mcp]
+
+    def get_patient(self, mcp, sections=None):
+        store = self._store()
+        if store.live: return store.get_patient(mcp, sections)
+        p = self._all.get(mcp) if self._all is not None else self._hydrate(store, mcp)
+        if p is None: return None
+        out = patient_header(p)
+        for s in (SECTIONS if sections is None else sections):
+            out[s] = list(p.get(s, []))
+        return out
+
+    def has_data(self): return self._store().has_data()
+    def snapshot(self, path): self._store().snapshot(path)
+
+    def write_all(self, d):
+        self.flush()
+        self._store().write_all(d); self.invalidate()
+
+    def _patch(self, op):
+        mcp = op["mcp"]
+        if self._all is not None: apply_op(self._all, op)
+        if mcp in self._patients:
+            if self._patients[mcp] is None: del self._patients[mcp]
+            apply_op(self._patients, op)
+        if self._index is not None:
+            full = self._all.get(mcp) if self._all is not None else self._patients.get(mcp)
+            if op["op"] == "delete_patient":
+                self._index.pop(mcp, None)
+            elif full is not None:
+                self._index[mcp] = registry_entry(full)
+            else:
+                entry = registry_after_op(self._index.get(mcp), op)
+                if entry is None: self._index = None  # reload the engine's own summaries
+                else: self._index[mcp] = entry
+
+    def apply(self, op):
+        self.apply_many([op])
+
+    def _notify(self, ops, token):
+        mcps = list(dict.fromkeys(op["mcp"] for op in ops))
+        for fn in self.listeners: fn(mcps, token)
+
+    def apply_many(self, ops):
+        store = self._store()
+        if store.live or int(SETTINGS.get("write_behind_ms", 0)) <= 0:
+            store.apply_many(ops)
+            if not store.live and self._token is not None:
+                for op in ops: self._patch(op)
+                self._token = (id(store), store.version())
+            self._notify(ops, (id(store), store.version()))
+            return
+        
+        self.list_patients()
+        for op in ops:
+            mcp = op["mcp"]
+            if self._all is None: self._hydrate(store, mcp)
+            self._patch(op)
+            self._pending.append(op); self.dirty.add(mcp)
+        self._pending_store = store
+        self._notify(ops, (id(store), None))
+        if self.on_dirty: self.on_dirty()
+
+    def flush(self):
+        """Write all buffered mutations to the engine in one go."""
+        if not self._pending: return
+        ops, store = self._pending, self._pending_store
+        self._pending = []; self._pending_store = None
+        try:
+            store.apply_many(ops)
+        except Exception:
+            self._pending = ops + self._pending; self._pending_store = store
+            raise
+        self.dirty = set()
+        self._token = (id(store), store.version())
+        self._notify(ops, self._token)
+
+
+DATASTORE = DataStore()
@@ -0,0 +1,219 @@
+"""Full-text search over history, notes and symptom snapshots.
+
+text_index() is an inverted index persisted next to the data in its own
+SQLite file: one document per free-text entry and one posting per
+(term, document), so a query reads only the postings of its terms and
+never loads patient bodies. Hits are ranked with BM25.
+
+Importing this module registers a core.WRITE_HOOKS entry that re-indexes
+the patients a write touches, whichever path the write took. A write_all()
+(restore, import) only marks the index stale; it is rebuilt on the next
+search. Edits made by a process that never imported this module are not
+seen until the index is rebuilt.
+"""
+from __future__ import annotations
+
+import math, os, re, sqlite3, threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .core import WRITE_HOOKS, audit, current_username, get_store
+
+TEXT_INDEX_FILE = "nlghi_text_index.sqlite3"
+TEXT_SECTIONS = ("history", "notes", "symptom_snapshots")
+SNIPPET_CHARS = 160
+K1, B = 1.2, 0.75
+
+_WORD = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset("""a an and are as at be been by for from had has have he her his i in is it its of on or
+our she that the their them they this to was we were which with""".split())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, mcp TEXT NOT NULL, section TEXT NOT NULL,
+                                 idx INTEGER NOT NULL, title TEXT, snippet TEXT, length INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS docs_mcp ON docs(mcp);
+CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL, dl INTEGER NOT NULL,
+                                     PRIMARY KEY (term, doc)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc);
+"""
+
+
+_TERMS: Dict[str, Optional[str]] = {}  # word -> _stem(word), or None for a stopword
+
+def _stem(w: str) -> str:
+    # plural folding only: "falls" -> "fall", "injuries" -> "injury"; "loss", "status" stay
+    if len(w) > 4 and w.endswith("ies"): return w[:-3] + "y"
+    if len(w) > 3 and w.endswith("s") and not w.endswith(("ss", "us", "is")): return w[:-1]
+    return w
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens with stopwords dropped and plurals folded."""
+    return [_stem(w) for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+def term_counts(text: str) -> Counter:
+    """Counter(tokenize(text)), stemming each distinct word once."""
+    tf: Counter = Counter()
+    for w, n in Counter(_WORD.findall(text.lower())).items():
+        t = _TERMS.get(w, "")
+        if t == "": t = _TERMS[w] = None if w in STOPWORDS else _stem(w)
+        if t: tf[t] += n
+    return tf
+
+
+def entry_document(section: str, e: Dict[str, Any]) -> Tuple[str, str]:
+    """(title, text) indexed for one entry of a TEXT_SECTIONS section."""
+    if section == "symptom_snapshots":
+        return str(e.get("timestamp", "")), str(e.get("text", ""))
+    title = str(e.get("title", ""))
+    return title, f"{title}\n{e.get('body', '')}"
+
+def _documents(patients):
+    """Yield (docs row, term counts) for each entry of each (mcp, patient) pair; p may be None."""
+    for mcp, p in patients:
+        for section in TEXT_SECTIONS if p else ():
+            for i, e in enumerate(p.get(section) or []):
+                if not isinstance(e, dict): continue
+                title, text = entry_document(section, e)
+                tf = term_counts(text)
+                if tf:
+                    yield (mcp, section, i, title, " ".join(text.split())[:SNIPPET_CHARS], sum(tf.values())), tf
+
+
+class TextIndex:
+    """Inverted index over one engine's free-text entries (see module docstring)."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or TEXT_INDEX_FILE
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **kv):
+        self._conn.executemany("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", [(k, str(v)) for k, v in kv.items()])
+
+    def is_current(self, backend: str) -> bool:
+        """True if the index was fully built from `backend` and nothing has invalidated it since."""
+        with self._lock:
+            return self._meta("backend") == backend and self._meta("complete") == "1" and self._meta("doc_count") is not None
+
+    def mark_stale(self):
+        with self._lock, self._conn:
+            self._set_meta(complete=0)
+
+    def _insert(self, docs: Iterable, batch: int = 4096) -> Tuple[int, int]:
+        # ids are assigned here so documents and their postings go in as two executemany() batches;
+        # returns (documents, total length) for the BM25 statistics kept in meta
+        doc = first = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM docs").fetchone()[0]
+        rows, posts, total = [], [], 0
+        for row, tf in docs:
+            doc += 1; dl = row[-1]; total += dl
+            rows.append((doc,) + row); posts += [(t, doc, n, dl) for t, n in tf.items()]
+            if len(rows) >= batch:
+                self._flush(rows, posts); rows, posts = [], []
+        self._flush(rows, posts)
+        return doc - first, total
+
+    def _stats(self) -> Tuple[int, int]:
+        return int(self._meta("doc_count") or 0), int(self._meta("total_length") or 0)
+
+    def _flush(self, rows, posts):
+        self._conn.executemany("INSERT INTO docs(id, mcp, section, idx, title, snippet, length) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self._conn.executemany("INSERT INTO postings(term, doc, tf, dl) VALUES (?, ?, ?, ?)", posts)
+
+    def rebuild(self, store) -> int:
+        """Re-index every patient of `store`; returns the number of documents."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM postings"); self._conn.execute("DELETE FROM docs")
+            n, total = self._insert(_documents(store.iter_patients(TEXT_SECTIONS)))
+            self._set_meta(backend=store.backend, complete=1, doc_count=n, total_length=total)
+        audit(f"{current_username()} rebuilt the full-text index ({n} entries).")
+        return n
+
+    def reindex(self, mcp: str, p: Optional[Dict[str, Any]]):
+        """Replace one patient's documents; p holds its TEXT_SECTIONS, or None if it was deleted."""
+        with self._lock, self._conn:
+            gone, gone_len = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE mcp = ?", (mcp,)).fetchone()
+            self._conn.execute("DELETE FROM postings WHERE doc IN (SELECT id FROM docs WHERE mcp = ?)", (mcp,))
+            self._conn.execute("DELETE FROM docs WHERE mcp = ?", (mcp,))
+            added, added_len = self._insert(_documents([(mcp, p)]))
+            n, total = self._stats()
+            self._set_meta(doc_count=n - gone + added, total_length=total - gone_len + added_len)
+
+    @staticmethod
+    def _ranges(query: str) -> List[Tuple[str, str]]:
+        # each word becomes a [lo, hi] term range; a trailing * makes it a prefix ("delir*" -> delirium, delirious)
+        out = []
+        for w in query.lower().split():
+            prefix = w.endswith("*")
+            out += [(t, t + "\U0010ffff") if prefix else (_stem(t), _stem(t))
+                    for t in _WORD.findall(w) if t not in STOPWORDS]
+        return list(dict.fromkeys(out))
+
+    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """BM25-ranked hits, best first: mcp, section, index, title, snippet, score."""
+        ranges = self._ranges(query)
+        if not ranges or limit <= 0: return []
+        with self._lock:
+            n, total = self._stats()  # kept in meta, so no pass over docs per query
+            if not n: return []
+            avgdl = total / n
+            terms = []
+            for lo, hi in ranges:
+                df = self._conn.execute("SELECT COUNT(DISTINCT doc) FROM postings WHERE term BETWEEN ? AND ?", (lo, hi)).fetchone()[0]
+                if df: terms += [lo, hi, math.log(1 + (n - df + 0.5) / (df + 0.5))]
+            if not terms: return []
+            # scored and ranked inside SQLite, so only the top `limit` rows reach Python
+            rows = self._conn.execute(
+                f"WITH q(lo, hi, idf) AS (VALUES {','.join(['(?, ?, ?)'] * (len(terms) // 3))}),"
+                " top(doc, score) AS (SELECT p.doc, SUM(q.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * p.dl / ?)))"
+                "  FROM q JOIN postings p ON p.term BETWEEN q.lo AND q.hi GROUP BY p.doc ORDER BY 2 DESC LIMIT ?)"
+                " SELECT d.mcp, d.section, d.idx, d.title, d.snippet, top.score FROM top JOIN docs d ON d.id = top.doc"
+                " ORDER BY top.score DESC, d.id", terms + [K1 + 1, K1, B, B, avgdl, limit]).fetchall()
+        return [dict(zip(("mcp", "section", "index", "title", "snippet"), r[:5]), score=round(r[5], 4)) for r in rows]
+
+
+_INDEX: Optional[TextIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+def _open() -> TextIndex:
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX.path != TEXT_INDEX_FILE:
+            if _INDEX is not None: _INDEX.close()
+            _INDEX = TextIndex(TEXT_INDEX_FILE)
+        return _INDEX
+
+def text_index(rebuild: bool = False) -> TextIndex:
+    """The active engine's full-text index, (re)built first if it is missing or stale."""
+    store = get_store(); index = _open()
+    if rebuild or not index.is_current(store.backend):
+        index.rebuild(store)
+    return index
+
+def search_text(query: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """BM25-ranked free-text hits for the active engine (see TextIndex.search)."""
+    return text_index().search(query, limit)
+
+
+def _on_engine_write(store, ops, replaced):
+    # nothing to maintain until the first search has built the index
+    if not os.path.exists(TEXT_INDEX_FILE): return
+    index = _open()
+    if not index.is_current(store.backend): return
+    if replaced is not None:
+        index.mark_stale(); return
+    for mcp in dict.fromkeys(op["mcp"] for op in ops or () if op["op"] == "delete_patient" or op.get("section") in TEXT_SECTIONS):
+        index.reindex(mcp, store.get_patient(mcp, TEXT_SECTIONS))
+
+WRITE_HOOKS.append(_on_engine_write)
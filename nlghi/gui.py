@@ -0,0 +1,1276 @@
+"""PyQt5 desktop application for NLGHI, built on the headless nlghi.core."""
+import sys, os, threading
+from datetime import datetime, date
+
+
+from PyQt5.QtWidgets import (
+    QApplication, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout,
+    QComboBox, QMessageBox, QScrollArea, QDateEdit, QDialog, QListWidget, QInputDialog,
+    QTextEdit, QTabWidget, QListWidgetItem, QCheckBox, QTreeWidget, QTreeWidgetItem,
+    QSplitter, QFileDialog, QShortcut, QGroupBox, QFormLayout, QSpinBox, QDoubleSpinBox, QDateTimeEdit, QProgressBar
+)
+from PyQt5.QtCore import Qt, QTimer, QDateTime
+from PyQt5.QtGui import QKeySequence
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+import numpy as np
+
+from .core import *
+from . import analytics
+from .search import QueryError, query_patients, quote_term, split_query, tag_facets
+from . import fulltext
+
+
+
+
+TRAJECTORY_QUERIES = [
+    ("Fastest GHI rise (per year)", ("slope", True)),
+    ("Fastest GHI fall (per year)", ("slope", False)),
+    ("Largest rise at last visit", ("last_delta", True)),
+    ("Most volatile GHI", ("volatility", True)),
+    ("Longest since last visit (days)", ("days_since", True)),
+]
+
+
+REGISTRY_COLUMNS = ["MCP", "Name", "Visits", "Last visit", "Latest GHI", "Pending refs"]
+
+
+class RegistryItem(QTreeWidgetItem):
+    """Registry row built from a DATASTORE.list_patients() entry."""
+    def __init__(self, mcp, entry):
+        ghi = entry.get("latest_ghi")
+        super().__init__([mcp, entry.get("name", ""), str(entry.get("record_count", 0)), entry.get("last_visit", ""),
+                          "" if ghi is None else str(ghi), str(entry.get("pending_refs", 0))])
+
+    @staticmethod
+    def sort_key(mcp, entry, column):
+        if column == 0: return mcp.lower()
+        if column == 1: return entry.get("name", "").lower()
+        if column == 4:
+            ghi = entry.get("latest_ghi")
+            return ghi if isinstance(ghi, (int, float)) else -1.0
+        return entry.get(("", "", "record_count", "last_visit", "", "pending_refs")[column], 0)
+
+
+class LoginDialog(QDialog):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Physician Login")
+        self.setGeometry(300, 300, 320, 180)
+
+        layout = QVBoxLayout(self)
+
+        self.username_input = QLineEdit()
+        self.password_input = QLineEdit()
+        self.password_input.setEchoMode(QLineEdit.Password)
+
+        layout.addWidget(QLabel("Username:"))
+        layout.addWidget(self.username_input)
+        layout.addWidget(QLabel("Password:"))
+        layout.addWidget(self.password_input)
+
+        login_button = QPushButton("Login")
+        login_button.clicked.connect(self.check_login)
+        layout.addWidget(login_button)
+
+        creds = load_credentials()
+        if (not creds["username"] and not creds["password"]) or \
+           (creds["username"] == FACTORY_USER and creds["password"] == FACTORY_PASS):
+            hint = QLabel("First run detected — login not required.\nClick Login, then set credentials.")
+            hint.setStyleSheet("color: gray; font-size: 12px;")
+            layout.addWidget(hint)
+
+    def check_login(self):
+        entered_user = self.username_input.text()
+        entered_pass = self.password_input.text()
+        creds = load_credentials()
+
+        if (not creds["username"] and not creds["password"]) or \
+           (creds["username"] == FACTORY_USER and creds["password"] == FACTORY_PASS):
+            self.accept()
+            return
+
+        if entered_user == creds["username"] and entered_pass == creds["password"]:
+            self.accept()
+        else:
+            QMessageBox.warning(self, "Login Failed", "Invalid credentials.")
+
+
+
+
+class ChartWindow(QWidget):
+    def __init__(self, matrix, timestamps, title):
+        super().__init__()
+        self.setWindowTitle(title)
+        self.resize(1200, 600)
+
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+        scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+
+        width_px = max(1600, 140 * max(1, len(timestamps)))
+        height_px = max(800, 40 * max(1, len(DOMAIN_LIST)))
+
+        dpi = 100
+        fig_w_in = width_px / dpi
+        fig_h_in = height_px / dpi
+
+        canvas = FigureCanvas(Figure(figsize=(fig_w_in, fig_h_in), dpi=dpi))
+        canvas.setMinimumSize(width_px, height_px)
+
+        inner_layout = QVBoxLayout()
+        inner_layout.addWidget(canvas)
+
+        container = QWidget()
+        container.setLayout(inner_layout)
+        container.setMinimumSize(width_px, height_px + 40)
+
+        scroll_area.setWidget(container)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(scroll_area)
+        self.setLayout(main_layout)
+
+        ax = canvas.figure.subplots()
+        cax = ax.imshow(matrix, aspect='auto', cmap='YlOrRd', interpolation='nearest')
+        ax.set_title(title)
+        ax.set_xlabel("Session")
+        ax.set_ylabel("Domain")
+        ax.set_yticks(np.arange(len(DOMAIN_LIST)))
+        ax.set_yticklabels(DOMAIN_LIST)
+        ax.set_xticks(np.arange(len(timestamps)))
+        ax.set_xticklabels(timestamps, rotation=90)
+        canvas.figure.colorbar(cax)
+        canvas.draw()
+
+
+
+
+class SettingsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Settings")
+        self.resize(420, 280)
+        layout = QVBoxLayout(self)
+
+        form = QFormLayout()
+        
+        self.theme_combo = QComboBox(); self.theme_combo.addItems(["light", "dark"])
+        self.theme_combo.setCurrentText(SETTINGS.get("theme","light"))
+        form.addRow("Theme:", self.theme_combo)
+        
+        self.auto_backup = QCheckBox("Enable automatic backup before writing data")
+        self.auto_backup.setChecked(SETTINGS.get("auto_backup", True))
+        form.addRow(self.auto_backup)
+        
+        self.backup_dir = QLineEdit(SETTINGS.get("backup_dir","backups")); form.addRow("Backup folder:", self.backup_dir)
+        
+        self.keep_spin = QSpinBox(); self.keep_spin.setRange(1, 1000); self.keep_spin.setValue(int(SETTINGS.get("backups_to_keep",10))); form.addRow("Keep newest backups:", self.keep_spin)
+        
+        self.backup_mode = QComboBox(); self.backup_mode.addItems(["chunked", "full"])
+        self.backup_mode.setCurrentText(SETTINGS.get("backup_mode","chunked")); form.addRow("Backup mode:", self.backup_mode)
+        retention = SETTINGS.get("backup_retention") or {}
+        tiers = QHBoxLayout(); self.retention_spins = {}
+        for tier in RETENTION_BUCKETS:
+            sp = QSpinBox(); sp.setRange(0, 1000); sp.setValue(int(retention.get(tier, 0))); sp.setPrefix(f"{tier} ")
+            self.retention_spins[tier] = sp; tiers.addWidget(sp)
+        form.addRow("Also keep newest per:", tiers)
+        self.backup_compression = QComboBox(); self.backup_compression.addItems(list(BACKUP_CODECS))
+        self.backup_compression.setCurrentText(SETTINGS.get("backup_compression","gzip")); form.addRow("Backup compression:", self.backup_compression)
+        
+        self.export_dir = QLineEdit(SETTINGS.get("export_dir","exports")); form.addRow("Export folder:", self.export_dir)
+        
+        self.backend_combo = QComboBox(); self.backend_combo.addItems(list(STORAGE_BACKENDS))
+        self.backend_combo.setCurrentText(SETTINGS.get("storage_backend","sqlite"))
+        form.addRow("Storage engine:", self.backend_combo)
+        
+        self.journal_spin = QSpinBox(); self.journal_spin.setRange(64, 1024*1024); self.journal_spin.setValue(int(SETTINGS.get("journal_compact_kb",1024))); form.addRow("Compact journal after (KB):", self.journal_spin)
+        
+        self.write_behind_spin = QSpinBox(); self.write_behind_spin.setRange(0, 60000); self.write_behind_spin.setSingleStep(250); self.write_behind_spin.setValue(int(SETTINGS.get("write_behind_ms",0)))
+        self.write_behind_spin.setSuffix(" ms"); self.write_behind_spin.setSpecialValueText("off (write immediately)"); form.addRow("Write-behind delay:", self.write_behind_spin)
+        
+        self.cache_spin = QSpinBox(); self.cache_spin.setRange(1, 100000); self.cache_spin.setValue(int(SETTINGS.get("patient_cache_size",64))); form.addRow("Patients kept in memory:", self.cache_spin)
+        self.registry_rows_spin = QSpinBox(); self.registry_rows_spin.setRange(100, 1000000); self.registry_rows_spin.setSingleStep(500); self.registry_rows_spin.setValue(int(SETTINGS.get("registry_max_rows",2000))); form.addRow("Registry rows shown:", self.registry_rows_spin)
+
+        layout.addLayout(form)
+
+        btns = QHBoxLayout()
+        save_btn = QPushButton("Save"); save_btn.clicked.connect(self.save)
+        cancel_btn = QPushButton("Cancel"); cancel_btn.clicked.connect(self.reject)
+        btns.addWidget(save_btn); btns.addWidget(cancel_btn)
+        layout.addLayout(btns)
+
+    def save(self):
+        SETTINGS["theme"] = self.theme_combo.currentText()
+        SETTINGS["auto_backup"] = self.auto_backup.isChecked()
+        SETTINGS["backup_dir"] = self.backup_dir.text().strip() or "backups"
+        SETTINGS["backups_to_keep"] = int(self.keep_spin.value())
+        SETTINGS["backup_mode"] = self.backup_mode.currentText()
+        SETTINGS["backup_compression"] = self.backup_compression.currentText()
+        SETTINGS["backup_retention"] = {tier: int(sp.value()) for tier, sp in self.retention_spins.items()}
+        SETTINGS["export_dir"] = self.export_dir.text().strip() or "exports"
+        SETTINGS["journal_compact_kb"] = int(self.journal_spin.value())
+        SETTINGS["write_behind_ms"] = int(self.write_behind_spin.value())
+        SETTINGS["patient_cache_size"] = int(self.cache_spin.value())
+        SETTINGS["registry_max_rows"] = int(self.registry_rows_spin.value())
+        DATASTORE.flush()
+        backend = self.backend_combo.currentText()
+        if backend != SETTINGS.get("storage_backend", "sqlite"):
+            # carry the current dataset over so switching engines never hides data
+            current = get_store().read_all()
+            SETTINGS["storage_backend"] = backend
+            DATASTORE.write_all(current)
+        save_settings(SETTINGS)
+        QMessageBox.information(self, "Saved", "Settings saved.")
+        self.accept()
+
+
+
+
+class BackupDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Backups")
+        self.resize(600, 400)
+        layout = QVBoxLayout(self)
+
+        self.listw = QListWidget()
+        layout.addWidget(self.listw)
+
+        self.status = QLabel(""); layout.addWidget(self.status)
+
+        btns = QHBoxLayout()
+        mk = QPushButton("Make Backup"); mk.clicked.connect(self._make)
+        rs = QPushButton("Restore Selected"); rs.clicked.connect(self._restore)
+        vf = QPushButton("Verify All Backups"); vf.clicked.connect(self._verify)
+        btns.addWidget(mk); btns.addWidget(rs); btns.addWidget(vf)
+        layout.addLayout(btns)
+
+        pitr = QHBoxLayout()
+        self.recover_at = QDateTimeEdit(QDateTime.currentDateTime()); self.recover_at.setCalendarPopup(True); self.recover_at.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+        rc = QPushButton("Recover to Time"); rc.clicked.connect(self._recover)
+        pitr.addWidget(QLabel("Point in time:")); pitr.addWidget(self.recover_at); pitr.addWidget(rc)
+        layout.addLayout(pitr)
+
+        # backups are written (and verified) off the UI thread; poll for progress
+        self._seen = None; self._verified = None; self._verify_thread = None
+        self._poll = QTimer(self); self._poll.timeout.connect(self._update_status); self._poll.start(300)
+        self.refresh(); self._update_status()
+
+    def refresh(self):
+        self.listw.clear()
+        bdir = SETTINGS.get("backup_dir", "backups")
+        for e in reversed(load_catalog(bdir)):
+            it = QListWidgetItem(f"{e['created'].replace('T', ' ')}   {e['file']}   {e.get('patients', '?')} patients, {e['size'] / 1024:.1f} KB")
+            it.setData(Qt.UserRole, os.path.join(bdir, e["file"])); it.setToolTip(f"SHA-256 {e['sha256']}")
+            self.listw.addItem(it); self._mark(it)
+
+    def _mark(self, it):
+        r = {v["path"]: v for v in self._verified or []}.get(it.data(Qt.UserRole))
+        if r is None: return
+        it.setForeground(Qt.darkGreen if r["ok"] else Qt.red)
+        it.setToolTip(it.toolTip() + ("\nVerified OK" if r["ok"] else "\n" + "\n".join(r["errors"][:20])))
+
+    def _update_status(self):
+        jobs = backup_status()
+        pending = [j for j in jobs if j["state"] == "pending"]
+        finished = [j for j in jobs if j["state"] != "pending"]
+        parts = [f"{len(pending)} backup(s) pending" if pending else "No backups pending"]
+        if finished:
+            last = finished[-1]
+            parts.append(f"last {last['state']}: {os.path.basename(last['path'])}" + (f" ({last['error']})" if last.get("error") else ""))
+        if self._verified is not None:
+            bad = [r for r in self._verified if not r["ok"]]
+            good = next((r for r in self._verified if r["ok"]), None)
+            running = self._verify_thread is not None and self._verify_thread.is_alive()
+            parts.append(f"{'verifying' if running else 'verified'} {len(self._verified)}/{self.listw.count()}, {len(bad)} damaged"
+                         + (f", newest valid: {os.path.basename(good['path'])}" if good else ""))
+            for i in range(self.listw.count()): self._mark(self.listw.item(i))
+        self.status.setText(" — ".join(parts))
+        key = (len(pending), len(finished), finished[-1]["path"] if finished else None)
+        if key != self._seen:
+            self._seen = key; self.refresh()
+
+    def _verify(self):
+        if self._verify_thread is not None and self._verify_thread.is_alive(): return
+        results = self._verified = []
+        def run():
+            try:
+                for r in verify_backups(): results.append(r)
+            except Exception as e:
+                results.append({"path": "", "ok": False, "errors": [str(e)]})
+        self._verify_thread = threading.Thread(target=run, name="nlghi-verify", daemon=True); self._verify_thread.start()
+        self._update_status()
+
+    def _make(self):
+        if make_backup() is None: QMessageBox.information(self, "Backup", "No data to back up."); return
+        self._update_status()
+
+    def _restore(self):
+        item = self.listw.currentItem()
+        if not item: QMessageBox.warning(self,"Select","Choose a backup to restore."); return
+        path = item.data(Qt.UserRole)
+        ok = QMessageBox.question(self, "Confirm", f"Restore backup?\n{path}", QMessageBox.Yes|QMessageBox.No)
+        if ok == QMessageBox.Yes:
+            restore_backup(path); self._reload_parent()
+            QMessageBox.information(self, "Restored", "Backup restored.")
+
+    def _recover(self):
+        when = self.recover_at.dateTime().toPyDateTime().replace(microsecond=0)
+        ok = QMessageBox.question(self, "Confirm", f"Recover all patient data to {when}?", QMessageBox.Yes|QMessageBox.No)
+        if ok != QMessageBox.Yes: return
+        try:
+            restore_to_time(when)
+        except ValueError as e:
+            QMessageBox.warning(self, "Cannot recover", str(e)); return
+        self._reload_parent(); self.refresh()
+        QMessageBox.information(self, "Recovered", f"Data recovered to {when}.")
+
+    def _reload_parent(self):
+        if hasattr(self.parent(), "reload_data"): self.parent().reload_data()
+
+
+class DataToolsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Data Tools — Validation")
+        self.resize(800, 500)
+        layout = QVBoxLayout(self)
+
+        self.output = QTextEdit(); self.output.setReadOnly(True)
+        layout.addWidget(self.output)
+
+        self.progress = QProgressBar(); self.progress.setVisible(False); layout.addWidget(self.progress)
+
+        btns = QHBoxLayout()
+        run_btn = QPushButton("Run Validation"); run_btn.clicked.connect(self.run_validation)
+        self.full_btn = QPushButton("Full Validation (all cores)"); self.full_btn.clicked.connect(self.run_parallel)
+        self.narrative_btn = QPushButton("Narrative vs Ratings (all cores)"); self.narrative_btn.clicked.connect(self.run_narrative)
+        self.narrative_btn.setToolTip("Run the symptom checker over every history and note, and list domains it suggests\n"
+                                      "that the patient's latest record rates 0")
+        self.cancel_btn = QPushButton("Cancel"); self.cancel_btn.setEnabled(False); self.cancel_btn.clicked.connect(lambda: self._cancel.set())
+        btns.addWidget(run_btn); btns.addWidget(self.full_btn); btns.addWidget(self.narrative_btn); btns.addWidget(self.cancel_btn)
+        layout.addLayout(btns)
+
+        # the parallel run streams from a worker thread; a timer copies its progress into the UI
+        self._cancel = threading.Event(); self._run = None
+        self._poll = QTimer(self); self._poll.timeout.connect(self._poll_parallel)
+
+        self.run_validation()
+
+    def run_validation(self):
+        n, issues, rechecked = validate_store()
+        lines = [f"Patients: {n}"] + issues + [f"Issues found: {len(issues)}", f"(re-checked {rechecked} patient(s) changed since the last run)"]
+        self.output.setPlainText("\n".join(lines))
+
+    def run_parallel(self):
+        if self._run is not None: return
+        run = self._run = {"done": 0, "total": 0, "issues": [], "finished": False, "error": None}
+        self._cancel.clear(); self.output.clear()
+        DATASTORE.flush(); store = get_store()  # on this thread, so pending GUI writes cannot race the worker
+        def work():
+            try:
+                for done, total, lines in validate_parallel(store=store, cancel=self._cancel):
+                    run["done"], run["total"] = done, total; run["issues"] += lines
+            except Exception as e:
+                run["error"] = str(e)
+            finally:
+                run["finished"] = True
+        threading.Thread(target=work, name="nlghi-validate", daemon=True).start()
+        self._start_polling()
+
+    def run_narrative(self):
+        if self._run is not None: return
+        run = self._run = {"done": 0, "total": 0, "issues": [], "finished": False, "error": None, "what": "Narrative check"}
+        self._cancel.clear(); self.output.clear()
+        DATASTORE.flush(); store = get_store()  # as in run_parallel
+        registry = DATASTORE.list_patients()
+        def work():
+            try:
+                def progress(done, total): run["done"], run["total"] = done, total
+                scan = analytics.scan_symptoms(store=store, cancel=self._cancel, progress=progress)
+                if scan is None: return
+                flags = scan.flags()
+                for i in np.flatnonzero(flags.any(axis=1)).tolist():
+                    mcp = scan.mcps[i]
+                    run["issues"].append(f"{mcp} {registry.get(mcp, {}).get('name', '')}: " + ", ".join(
+                        f"{DOMAIN_LIST[d]} ({scan.votes[i, d]} vote{'' if scan.votes[i, d] == 1 else 's'}, rated 0)" for d in np.flatnonzero(flags[i]).tolist()))
+                run["summary"] = f"Patients: {len(scan)}\nPatients with narrative signs in domains rated 0: {len(run['issues'])}"
+            except Exception as e:
+                run["error"] = str(e)
+            finally:
+                run["finished"] = True
+        threading.Thread(target=work, name="nlghi-narrative", daemon=True).start()
+        self._start_polling()
+
+    def _start_polling(self):
+        self.full_btn.setEnabled(False); self.narrative_btn.setEnabled(False); self.cancel_btn.setEnabled(True)
+        self.progress.setVisible(True); self.progress.setValue(0); self._shown = 0; self._poll.start(200)
+
+    def _poll_parallel(self):
+        run = self._run
+        if run is None: return
+        new = run["issues"][self._shown:]
+        if new: self.output.append("\n".join(new)); self._shown += len(new)
+        self.progress.setMaximum(max(1, run["total"])); self.progress.setValue(run["done"])
+        if not run["finished"]: return
+        self._poll.stop(); self._run = None
+        self.full_btn.setEnabled(True); self.narrative_btn.setEnabled(True); self.cancel_btn.setEnabled(False); self.progress.setVisible(False)
+        if run["error"]: self.output.append(f"{run.get('what', 'Validation')} failed: {run['error']}")
+        elif self._cancel.is_set(): self.output.append(f"Cancelled after {run['done']}/{run['total']} patients; issues so far: {len(run['issues'])}")
+        else: self.output.append(run.get("summary") or f"Patients: {run['total']}\nIssues found: {len(run['issues'])}")
+
+    def reject(self):
+        self._cancel.set(); super().reject()
+
+
+class CohortDialog(QDialog):
+    """Population view: GHI distribution, per-domain means and the text summary."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Cohort Analytics")
+        self.resize(1100, 750)
+        layout = QVBoxLayout(self)
+        c = analytics.cohort()
+
+        canvas = FigureCanvas(Figure(figsize=(11, 4))); layout.addWidget(canvas)
+        ax1, ax2 = canvas.figure.subplots(1, 2)
+        counts, edges = c.ghi_histogram(latest_only=True)
+        ax1.bar(edges[:-1], counts, width=np.diff(edges), align="edge"); ax1.set_title("GHI at latest visit"); ax1.set_xlabel("GHI"); ax1.set_ylabel("Patients")
+        means = c.domain_means(latest_only=True)
+        ax2.barh(range(len(DOMAIN_LIST)), list(means.values())); ax2.set_yticks(range(len(DOMAIN_LIST))); ax2.set_yticklabels(DOMAIN_LIST, fontsize=7)
+        ax2.invert_yaxis(); ax2.set_xlim(0, 5); ax2.set_title("Mean impairment by domain (latest visit)")
+        canvas.figure.tight_layout(); canvas.draw()
+
+        text = QTextEdit(); text.setReadOnly(True); text.setPlainText(c.summary()); text.setStyleSheet("font-family: monospace;")
+        layout.addWidget(text)
+
+
+class TextSearchDialog(QDialog):
+    """Ranked free-text search over every patient's history, notes and symptom snapshots."""
+    COLUMNS = ["Score", "MCP", "Section", "Entry", "Title", "Snippet"]
+    SECTION_LABELS = {"history": "History", "notes": "Doctor's note", "symptom_snapshots": "Symptom snapshot"}
+
+    def __init__(self, parent_app):
+        super().__init__(parent_app)
+        self.app = parent_app
+        self.setWindowTitle("Search Notes")
+        self.resize(1000, 620)
+        layout = QVBoxLayout(self)
+
+        row = QHBoxLayout()
+        self.query = QLineEdit(); self.query.setPlaceholderText("falls delirium, delir* for a prefix")
+        self.query.returnPressed.connect(self.run)
+        go = QPushButton("Search"); go.clicked.connect(self.run)
+        rebuild = QPushButton("Rebuild Index"); rebuild.clicked.connect(lambda: self.run(rebuild=True))
+        row.addWidget(self.query); row.addWidget(go); row.addWidget(rebuild)
+        layout.addLayout(row)
+
+        self.results = QTreeWidget(); self.results.setHeaderLabels(self.COLUMNS); self.results.setRootIsDecorated(False)
+        self.results.itemDoubleClicked.connect(self._open)
+        layout.addWidget(self.results)
+        self.status = QLabel("Double-click a hit to open it in the Patient Workspace."); layout.addWidget(self.status)
+
+    def run(self, rebuild=False):
+        DATASTORE.flush()  # buffered writes reach the engine, and so the index
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            hits = fulltext.text_index(rebuild=rebuild).search(self.query.text(), 200)
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.results.clear()
+        for h in hits:
+            it = QTreeWidgetItem([f"{h['score']:.2f}", h["mcp"], self.SECTION_LABELS.get(h["section"], h["section"]),
+                                  str(h["index"] + 1), h["title"], h["snippet"]])
+            it.setData(0, Qt.UserRole, (h["mcp"], h["section"], h["index"])); it.setToolTip(5, h["snippet"])
+            self.results.addTopLevelItem(it)
+        for i in range(len(self.COLUMNS) - 1): self.results.resizeColumnToContents(i)
+        self.status.setText(f"{len(hits)} matching entr{'y' if len(hits) == 1 else 'ies'}" + (" (index rebuilt)" if rebuild else ""))
+
+    def _open(self, item, _col=0):
+        mcp, section, index = item.data(0, Qt.UserRole)
+        dlg = PatientWorkspaceDialog(self.app, mcp); dlg.show_entry(section, index); dlg.exec_()
+        self.app._apply_filter()
+        if self.query.text().strip(): self.run()
+
+
+class ReportBuilderDialog(QDialog):
+    def __init__(self, parent_app, mcp):
+        super().__init__(parent_app)
+        self.app = parent_app; self.mcp = mcp
+        self.setWindowTitle(f"Report Builder — MCP {mcp}")
+        self.resize(820, 600)
+        layout = QVBoxLayout(self)
+
+        self.summary_text = QTextEdit()
+        self.summary_text.setReadOnly(True)
+        layout.addWidget(self.summary_text)
+
+        btns = QHBoxLayout()
+        gen_visit = QPushButton("Generate Latest Visit Summary"); gen_visit.clicked.connect(self.gen_visit)
+        gen_all = QPushButton("Generate Lifetime Summary"); gen_all.clicked.connect(self.gen_all)
+        exp_txt = QPushButton("Export as .txt"); exp_txt.clicked.connect(lambda: self.export("txt"))
+        exp_md = QPushButton("Export as .md"); exp_md.clicked.connect(lambda: self.export("md"))
+        exp_csv = QPushButton("Export records as .csv"); exp_csv.clicked.connect(self.export_csv)
+        btns.addWidget(gen_visit); btns.addWidget(gen_all); btns.addWidget(exp_txt); btns.addWidget(exp_md); btns.addWidget(exp_csv)
+        layout.addLayout(btns)
+
+        self.gen_visit()
+
+    def _patient(self):
+        return DATASTORE.get_patient(self.mcp) or {}
+
+    def gen_visit(self):
+        self.summary_text.setPlainText(visit_summary(self.mcp, self._patient()))
+
+    def gen_all(self):
+        self.summary_text.setPlainText(lifetime_summary(self.mcp, self._patient()))
+
+    def export(self, ext: str):
+        os.makedirs(SETTINGS.get("export_dir","exports"), exist_ok=True)
+        path, _ = QFileDialog.getSaveFileName(self, "Save report as", os.path.join(SETTINGS.get("export_dir","exports"), f"report_{self.mcp}.{ext}"), f"*.{ext}")
+        if not path: return
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.summary_text.toPlainText())
+        QMessageBox.information(self, "Exported", f"Saved to {path}")
+
+    def export_csv(self):
+        p = self._patient()
+        recs = p.get("records", [])
+        if not recs:
+            QMessageBox.information(self, "No data", "No records to export.")
+            return
+        os.makedirs(SETTINGS.get("export_dir","exports"), exist_ok=True)
+        path, _ = QFileDialog.getSaveFileName(self, "Save records CSV", os.path.join(SETTINGS.get("export_dir","exports"), f"records_{self.mcp}.csv"), "CSV Files (*.csv)")
+        if not path: return
+        write_records_csv(path, recs)
+        QMessageBox.information(self, "Exported", f"Saved to {path}")
+
+
+
+class TimelineDialog(QDialog):
+    def __init__(self, parent_app, mcp):
+        super().__init__(parent_app)
+        self.mcp = mcp; self.setWindowTitle(f"Timeline — MCP {mcp}"); self.resize(900, 600)
+        layout = QVBoxLayout(self)
+
+        self.tree = QTreeWidget(); self.tree.setHeaderLabels(["When", "Type", "Title/Detail"])
+        layout.addWidget(self.tree)
+
+        btns = QHBoxLayout()
+        exp = QPushButton("Export Timeline (.md)"); exp.clicked.connect(self.export_md)
+        btns.addWidget(exp)
+        layout.addLayout(btns)
+
+        self.populate()
+
+    def _patient(self):
+        return DATASTORE.get_patient(self.mcp) or {}
+
+    def populate(self):
+        self.tree.clear()
+        p = self._patient()
+        events = []  
+        for r in p.get("records", []):
+            events.append((r.get("session_date",""), "Visit", f"GHI={r.get('ghi','N/A')}"))
+        for h in p.get("history", []):
+            events.append((h.get("timestamp",""), "History", h.get("title","")))
+        for n in p.get("notes", []):
+            events.append((n.get("timestamp",""), "Note", n.get("title","")))
+        for fr in p.get("future_refs", []):
+            mark = "DONE" if fr.get("done") else "PENDING"
+            events.append((fr.get("due",""), "Future", f"{mark}: {fr.get('title','')}"))
+        
+        events.sort(key=lambda x: x[0])
+        for when, typ, txt in events:
+            item = QTreeWidgetItem([when, typ, txt])
+            self.tree.addTopLevelItem(item)
+
+    def export_md(self):
+        p = self._patient()
+        os.makedirs(SETTINGS.get("export_dir","exports"), exist_ok=True)
+        path, _ = QFileDialog.getSaveFileName(self, "Save timeline", os.path.join(SETTINGS.get("export_dir","exports"), f"timeline_{self.mcp}.md"), "Markdown (*.md)")
+        if not path: return
+        lines = [f"# Timeline — MCP {self.mcp}", f"Name: {p.get('name','')}  Gender: {p.get('gender','')}  DOB: {p.get('dob','')}", ""]
+        for i in range(self.tree.topLevelItemCount()):
+            item = self.tree.topLevelItem(i)
+            lines.append(f"- {item.text(0)} — **{item.text(1)}** — {item.text(2)}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        QMessageBox.information(self, "Exported", f"Saved to {path}")
+
+
+class PatientWorkspaceDialog(QDialog):
+    def __init__(self, parent_app, mcp):
+        super().__init__(parent_app)
+        self.app = parent_app; self.mcp = mcp
+        self.setWindowTitle(f"Patient Workspace — MCP: {mcp}")
+        self.resize(980, 720)
+
+        self.tabs = QTabWidget(self)
+        self._build_history_tab()
+        self._build_symptom_tab()
+        self._build_notes_tab()
+        self._build_future_ref_tab()
+        self._build_attachments_tab()
+
+        root = QVBoxLayout(self); root.addWidget(self.tabs)
+        self._load_all_sections()
+
+    
+    def _section(self, name): return DATASTORE.get_section(self.mcp, name)
+    def show_entry(self, section, index):
+        """Switch to the tab holding `section` and open entry `index` in it."""
+        tab, lst, load = {"history": (0, self.hist_list, self._load_history_entry),
+                          "symptom_snapshots": (1, self.sym_snap_list, lambda it: self._load_symptom_snapshot()),
+                          "notes": (2, self.note_list, self._load_note)}[section]
+        self.tabs.setCurrentIndex(tab)
+        if 0 <= index < lst.count():
+            lst.setCurrentRow(index); load(lst.item(index))
+    def done(self, r):
+        DATASTORE.flush(); super().done(r)
+    def _now(self): return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    
+    def _build_history_tab(self):
+        w = QWidget(); lay = QVBoxLayout(w)
+        form = QHBoxLayout()
+        self.hist_title = QLineEdit(); self.hist_title.setPlaceholderText("History entry title")
+        form.addWidget(self.hist_title)
+        addb = QPushButton("Add Entry"); addb.clicked.connect(self._add_history_entry); form.addWidget(addb)
+        lay.addLayout(form)
+        self.hist_text = QTextEdit(); self.hist_text.setPlaceholderText("Write patient history here..."); self.hist_text.setAcceptRichText(False); lay.addWidget(self.hist_text)
+        self.hist_list = QListWidget(); self.hist_list.itemClicked.connect(self._load_history_entry)
+        lay.addWidget(QLabel("Existing history entries:")); lay.addWidget(self.hist_list)
+        btns = QHBoxLayout()
+        ub = QPushButton("Update Selected"); ub.clicked.connect(self._update_history_entry)
+        db = QPushButton("Delete Selected"); db.clicked.connect(self._delete_history_entry)
+        eb = QPushButton("Export Selected (.txt)"); eb.clicked.connect(self._export_history_txt)
+        btns.addWidget(ub); btns.addWidget(db); btns.addWidget(eb); lay.addLayout(btns)
+        self.tabs.addTab(w, "History")
+
+    def _load_all_history(self):
+        self.hist_list.clear()
+        for idx, e in enumerate(self._section("history")):
+            item = QListWidgetItem(f"{idx+1}. {e.get('title','(untitled)')} — {e.get('timestamp','')}"); item.setData(Qt.UserRole, idx); self.hist_list.addItem(item)
+
+    def _add_history_entry(self):
+        t = self.hist_title.text().strip() or "(untitled)"; b = self.hist_text.toPlainText().strip()
+        if not b: QMessageBox.warning(self,"Missing","Write some history text first."); return
+        DATASTORE.append_entry(self.mcp, "history", {"title": t, "body": b, "timestamp": self._now()})
+        QMessageBox.information(self,"Saved","History entry added."); self.hist_title.clear(); self.hist_text.clear(); self._load_all_history()
+
+    def _load_history_entry(self, item):
+        idx = item.data(Qt.UserRole); L = self._section("history")
+        if 0 <= idx < len(L): e = L[idx]; self.hist_title.setText(e.get("title","")); self.hist_text.setPlainText(e.get("body",""))
+
+    def _update_history_entry(self):
+        it = self.hist_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose an entry to update."); return
+        idx = it.data(Qt.UserRole)
+        if 0 <= idx < len(self._section("history")):
+            DATASTORE.update_entry(self.mcp, "history", idx, {"title": self.hist_title.text().strip() or "(untitled)",
+                                                                   "body": self.hist_text.toPlainText().strip(), "edited_at": self._now()})
+            QMessageBox.information(self,"Updated","History updated."); self._load_all_history()
+
+    def _delete_history_entry(self):
+        it = self.hist_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose an entry to delete."); return
+        idx = it.data(Qt.UserRole)
+        if 0 <= idx < len(self._section("history")): DATASTORE.remove_entry(self.mcp, "history", idx); QMessageBox.information(self,"Deleted","Entry removed."); self._load_all_history()
+
+    def _export_history_txt(self):
+        it = self.hist_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose an entry to export."); return
+        idx = it.data(Qt.UserRole); e = self._section("history")[idx]
+        path, _ = QFileDialog.getSaveFileName(self, "Save history", f"history_{self.mcp}_{idx+1}.txt", "Text Files (*.txt)")
+        if not path: return
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Title: {e.get('title','')}\nTimestamp: {e.get('timestamp','')}\nEdited: {e.get('edited_at','')}\n\n{e.get('body','')}")
+        QMessageBox.information(self,"Exported",f"Saved to {path}")
+
+    
+    def _build_symptom_tab(self):
+        w = QWidget(); lay = QVBoxLayout(w)
+        lay.addWidget(QLabel("Enter symptoms in natural language (advisory only)."))
+        self.sym_input = QTextEdit(); self.sym_input.setPlaceholderText("e.g., 'Shortness of breath and chest pain on exertion.'"); self.sym_input.setAcceptRichText(False); lay.addWidget(self.sym_input)
+        b = QHBoxLayout(); ab = QPushButton("Analyze"); ab.clicked.connect(self._run_symptom_check); sb = QPushButton("Save Snapshot"); sb.clicked.connect(self._save_symptom_snapshot)
+        b.addWidget(ab); b.addWidget(sb); lay.addLayout(b)
+        split = QSplitter(Qt.Horizontal)
+        left = QWidget(); ll = QVBoxLayout(left); ll.addWidget(QLabel("Matched keywords:")); self.sym_keywords = QListWidget(); ll.addWidget(self.sym_keywords)
+        right = QWidget(); rl = QVBoxLayout(right); rl.addWidget(QLabel("Suggested domains: (votes)")); self.sym_domains = QTreeWidget(); self.sym_domains.setHeaderLabels(["Domain","Votes"]); rl.addWidget(self.sym_domains)
+        split.addWidget(left); split.addWidget(right); lay.addWidget(split)
+        self.sym_snap_list = QListWidget(); lay.addWidget(QLabel("Previous symptom snapshots:")); lay.addWidget(self.sym_snap_list)
+        loadb = QPushButton("Load Selected"); loadb.clicked.connect(self._load_symptom_snapshot); lay.addWidget(loadb)
+        self.tabs.addTab(w, "Symptom Checker")
+
+    def _run_symptom_check(self):
+        tx = self.sym_input.toPlainText()
+        if not tx.strip(): QMessageBox.warning(self,"Empty","Enter symptoms first."); return
+        res = analyze_symptoms(tx); self._render_symptom_result(res)
+
+    def _render_symptom_result(self, res):
+        self.sym_keywords.clear(); [self.sym_keywords.addItem(k) for k in res["keywords_found"]]
+        self.sym_domains.clear()
+        for s in res["suggestions"]:
+            item = QTreeWidgetItem([s["domain_name"], str(s["votes"])]); item.setData(0, Qt.UserRole, s["domain_index"]); self.sym_domains.addTopLevelItem(item)
+
+    def _save_symptom_snapshot(self):
+        tx = self.sym_input.toPlainText().strip()
+        if not tx: QMessageBox.warning(self,"Empty","Nothing to save."); return
+        res = analyze_symptoms(tx); DATASTORE.append_entry(self.mcp, "symptom_snapshots", {"text": tx, "result": res, "timestamp": self._now()})
+        QMessageBox.information(self,"Saved","Snapshot saved."); self._load_symptom_snapshots()
+
+    def _load_symptom_snapshot(self):
+        it = self.sym_snap_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose a snapshot."); return
+        idx = it.data(Qt.UserRole); snaps = self._section("symptom_snapshots")
+        if 0 <= idx < len(snaps): s = snaps[idx]; self.sym_input.setPlainText(s.get("text","")); self._render_symptom_result(s.get("result", {"keywords_found":[], "suggestions":[]}))
+
+    def _load_symptom_snapshots(self):
+        self.sym_snap_list.clear()
+        for i, s in enumerate(self._section("symptom_snapshots")):
+            it = QListWidgetItem(f"{i+1}. {s.get('timestamp','')} — {len(s.get('result',{}).get('keywords_found',[]))} keywords"); it.setData(Qt.UserRole, i); self.sym_snap_list.addItem(it)
+
+    
+    def _build_notes_tab(self):
+        w = QWidget(); lay = QVBoxLayout(w)
+        form = QHBoxLayout()
+        self.note_title = QLineEdit(); self.note_title.setPlaceholderText("Note title"); form.addWidget(self.note_title)
+        self.note_attach_latest = QCheckBox("Attach to latest visit (if any)"); form.addWidget(self.note_attach_latest)
+        lay.addLayout(form)
+        self.note_text = QTextEdit(); self.note_text.setPlaceholderText("Write clinical note here (advisory only)."); self.note_text.setAcceptRichText(False); lay.addWidget(self.note_text)
+        btns = QHBoxLayout()
+        addb = QPushButton("Add Note"); addb.clicked.connect(self._add_note)
+        upb = QPushButton("Update Selected"); upb.clicked.connect(self._update_note)
+        delb = QPushButton("Delete Selected"); delb.clicked.connect(self._delete_note)
+        btns.addWidget(addb); btns.addWidget(upb); btns.addWidget(delb); lay.addLayout(btns)
+        self.note_list = QListWidget(); self.note_list.itemClicked.connect(self._load_note); lay.addWidget(QLabel("Notes:")); lay.addWidget(self.note_list)
+        self.tabs.addTab(w, "Doctor's Notes")
+
+    def _load_all_notes(self):
+        self.note_list.clear()
+        for idx, n in enumerate(self._section("notes")):
+            lbl = f"{idx+1}. {n.get('timestamp','')} — {n.get('title','(untitled)')}"
+            if n.get("attach_latest", False): lbl += "  [attached to latest visit]"
+            it = QListWidgetItem(lbl); it.setData(Qt.UserRole, idx); self.note_list.addItem(it)
+
+    def _add_note(self):
+        t = self.note_title.text().strip() or "(untitled)"; b = self.note_text.toPlainText().strip()
+        if not b: QMessageBox.warning(self,"Missing","Write note text first."); return
+        attach = self.note_attach_latest.isChecked(); context_session_date = None
+        recs = self._section("records") if attach else []
+        if attach and recs: context_session_date = recs[-1].get("session_date")
+        DATASTORE.append_entry(self.mcp, "notes", {"title": t, "body": b, "attach_latest": attach, "context_session_date": context_session_date, "timestamp": self._now()})
+        QMessageBox.information(self,"Saved","Note added."); self.note_title.clear(); self.note_text.clear(); self._load_all_notes()
+
+    def _load_note(self, item):
+        idx = item.data(Qt.UserRole); L = self._section("notes")
+        if 0 <= idx < len(L): n = L[idx]; self.note_title.setText(n.get("title","")); self.note_text.setPlainText(n.get("body","")); self.note_attach_latest.setChecked(bool(n.get("attach_latest",False)))
+
+    def _update_note(self):
+        it = self.note_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose a note to update."); return
+        idx = it.data(Qt.UserRole)
+        if 0 <= idx < len(self._section("notes")):
+            DATASTORE.update_entry(self.mcp, "notes", idx, {"title": self.note_title.text().strip() or "(untitled)", "body": self.note_text.toPlainText().strip(),
+                                                                 "attach_latest": self.note_attach_latest.isChecked(), "edited_at": self._now()})
+            QMessageBox.information(self,"Updated","Note updated."); self._load_all_notes()
+
+    def _delete_note(self):
+        it = self.note_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose a note to delete."); return
+        idx = it.data(Qt.UserRole)
+        if 0 <= idx < len(self._section("notes")): DATASTORE.remove_entry(self.mcp, "notes", idx); QMessageBox.information(self,"Deleted","Note removed."); self._load_all_notes()
+
+    
+    def _build_future_ref_tab(self):
+        w = QWidget(); lay = QVBoxLayout(w)
+        row = QHBoxLayout()
+        self.fr_title = QLineEdit(); self.fr_title.setPlaceholderText("Follow-up / reference title"); row.addWidget(self.fr_title)
+        self.fr_due = QDateEdit(); self.fr_due.setCalendarPopup(True); self.fr_due.setDisplayFormat("yyyy-MM-dd")
+        row.addWidget(QLabel("Due date:")); row.addWidget(self.fr_due); lay.addLayout(row)
+        self.fr_text = QTextEdit(); self.fr_text.setPlaceholderText("Optional details / instructions..."); self.fr_text.setAcceptRichText(False); lay.addWidget(self.fr_text)
+        btns = QHBoxLayout()
+        addb = QPushButton("Add"); addb.clicked.connect(self._add_future_ref)
+        doneb = QPushButton("Mark Selected Done"); doneb.clicked.connect(self._mark_future_ref_done)
+        delb = QPushButton("Delete Selected"); delb.clicked.connect(self._delete_future_ref)
+        btns.addWidget(addb); btns.addWidget(doneb); btns.addWidget(delb); lay.addLayout(btns)
+        self.fr_list = QListWidget(); self.fr_list.itemClicked.connect(self._load_future_ref); lay.addWidget(QLabel("Future references:")); lay.addWidget(self.fr_list)
+        self.tabs.addTab(w, "Future References")
+
+    def _load_all_future_refs(self):
+        self.fr_list.clear()
+        for idx, r in enumerate(self._section("future_refs")):
+            status = "DONE" if r.get("done", False) else "PENDING"; due = r.get("due",""); title = r.get("title","(untitled)")
+            it = QListWidgetItem(f"{idx+1}. [{status}] {due} — {title}"); it.setData(Qt.UserRole, idx); self.fr_list.addItem(it)
+
+    def _add_future_ref(self):
+        t = self.fr_title.text().strip() or "(untitled)"; details = self.fr_text.toPlainText().strip(); due = self.fr_due.date().toString("yyyy-MM-dd")
+        DATASTORE.append_entry(self.mcp, "future_refs", {"title": t, "details": details, "due": due, "done": False, "timestamp": self._now()})
+        QMessageBox.information(self,"Saved","Future reference added."); self.fr_title.clear(); self.fr_text.clear(); self._load_all_future_refs()
+
+    def _load_future_ref(self, item):
+        idx = item.data(Qt.UserRole); L = self._section("future_refs")
+        if 0 <= idx < len(L):
+            r = L[idx]; self.fr_title.setText(r.get("title","")); self.fr_text.setPlainText(r.get("details",""))
+            try:
+                y,m,d0 = map(int, r.get("due","1970-01-01").split("-")); self.fr_due.setDate(date(y,m,d0))
+            except Exception: pass
+
+    def _mark_future_ref_done(self):
+        it = self.fr_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose an item."); return
+        idx = it.data(Qt.UserRole)
+        if 0 <= idx < len(self._section("future_refs")):
+            DATASTORE.update_entry(self.mcp, "future_refs", idx, {"done": True, "done_at": self._now()})
+            QMessageBox.information(self,"Updated","Marked as done."); self._load_all_future_refs()
+
+    def _delete_future_ref(self):
+        it = self.fr_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose an item to delete."); return
+        idx = it.data(Qt.UserRole)
+        if 0 <= idx < len(self._section("future_refs")): DATASTORE.remove_entry(self.mcp, "future_refs", idx); QMessageBox.information(self,"Deleted","Removed."); self._load_all_future_refs()
+
+    
+    def _build_attachments_tab(self):
+        w = QWidget(); lay = QVBoxLayout(w)
+        btns = QHBoxLayout()
+        addb = QPushButton("Add Attachment"); addb.clicked.connect(self._add_attachment)
+        openb = QPushButton("Open Selected"); openb.clicked.connect(self._open_attachment)
+        delb = QPushButton("Delete Selected"); delb.clicked.connect(self._delete_attachment)
+        btns.addWidget(addb); btns.addWidget(openb); btns.addWidget(delb); lay.addLayout(btns)
+        self.att_list = QListWidget(); lay.addWidget(self.att_list)
+        self.tabs.addTab(w, "Attachments")
+
+    def _load_all_attachments(self):
+        self.att_list.clear()
+        for idx, a in enumerate(self._section("attachments")):
+            it = QListWidgetItem(f"{idx+1}. {a.get('path','')} — {a.get('desc','')} ({a.get('timestamp','')})"); it.setData(Qt.UserRole, idx); self.att_list.addItem(it)
+
+    def _add_attachment(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Select file to attach")
+        if not path: return
+        desc, ok = QInputDialog.getText(self, "Describe", "Short description:")
+        if not ok: return
+        DATASTORE.append_entry(self.mcp, "attachments", {"path": path, "desc": desc, "timestamp": self._now()})
+        self._load_all_attachments()
+
+    def _open_attachment(self):
+        it = self.att_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose an attachment."); return
+        idx = it.data(Qt.UserRole); L = self._section("attachments")
+        if 0 <= idx < len(L):
+            path = L[idx].get("path","")
+            if not os.path.exists(path):
+                QMessageBox.warning(self,"Missing","File not found on disk."); return
+            
+            try:
+                if sys.platform.startswith("win"): os.startfile(path)  
+                elif sys.platform == "darwin": os.system(f"open '{path}'")
+                else: os.system(f"xdg-open '{path}'")
+            except Exception as e:
+                QMessageBox.warning(self,"Error", str(e))
+
+    def _delete_attachment(self):
+        it = self.att_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose an attachment to delete."); return
+        idx = it.data(Qt.UserRole)
+        if 0 <= idx < len(self._section("attachments")): DATASTORE.remove_entry(self.mcp, "attachments", idx); self._load_all_attachments()
+
+    
+    def _load_all_sections(self):
+        self._load_all_history(); self._load_all_notes(); self._load_all_future_refs(); self._load_symptom_snapshots(); self._load_all_attachments()
+
+
+
+
+class NLGHIApp(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("NLGHI v1.0 - Newfoundland and Labrador Geriatric Health Index")
+        self.setGeometry(100, 100, 1300, 850)
+        self.setStyleSheet("font-size: 14px;")
+        self.data = {}
+        self.chart_window = None
+        self.fig_window = None
+        self._flush_timer = QTimer(self); self._flush_timer.setSingleShot(True); self._flush_timer.timeout.connect(DATASTORE.flush)
+        DATASTORE.on_dirty = lambda: self._flush_timer.start(int(SETTINGS.get("write_behind_ms", 0)))
+        self._build_ui()
+        self.maybe_first_time_setup()
+        self._install_shortcuts()
+
+    
+    def _build_ui(self):
+        layout = QVBoxLayout()
+
+        header = QLabel("NLGHI v1.0 - Newfoundland and Labrador Geriatric Health Index")
+        header.setStyleSheet("font-size: 18px; font-weight: bold;")
+        layout.addWidget(header, alignment=Qt.AlignCenter)
+
+        branding = QLabel("© 2025 Mirza Niaz Zaman Elin. All rights reserved.")
+        branding.setStyleSheet("font-style: italic; color: gray;")
+        layout.addWidget(branding, alignment=Qt.AlignCenter)
+
+        
+        self.search_input = QLineEdit(); self.search_input.setPlaceholderText("Search by MCP, name or tag, or query e.g. tag:frailty ghi>2.5 last_visit<2025-01-01 domain:Renal>=3")
+        self.search_input.setToolTip("Words match MCP, name or tags. Filters: tag:NAME, domain:NAME>=N, and ghi, visits, age, pending or\n"
+                                     "last_visit compared with > >= < <= = !=. Terms are combined with AND; put OR between alternatives, '-' or NOT negates.")
+        self._search_timer = QTimer(self); self._search_timer.setSingleShot(True); self._search_timer.setInterval(120)
+        self._search_timer.timeout.connect(self._apply_filter)
+        self.search_input.textChanged.connect(self._search_timer.start)
+        layout.addWidget(self.search_input)
+
+        top = QHBoxLayout()
+        left_col = QVBoxLayout()
+        left_col.addWidget(QLabel("Patient Registry"))
+        self.patient_list = QTreeWidget(); self.patient_list.setHeaderLabels(REGISTRY_COLUMNS); self.patient_list.setRootIsDecorated(False)
+        # sorted here over every match, not by the widget over the rows shown
+        head = self.patient_list.header(); head.setSectionsClickable(True); head.setSortIndicatorShown(True)
+        head.setSortIndicator(-1, Qt.AscendingOrder)  # storage order until a column is clicked
+        head.sortIndicatorChanged.connect(self._apply_filter)
+        self.patient_list.itemClicked.connect(self.load_patient_record)
+        left_col.addWidget(self.patient_list)
+        self.registry_count = QLabel(""); left_col.addWidget(self.registry_count)
+
+        traj_box = QGroupBox("GHI trajectories")
+        traj_lay = QHBoxLayout(traj_box)
+        self.traj_query = QComboBox()
+        for label, q in TRAJECTORY_QUERIES: self.traj_query.addItem(label, q)
+        self.traj_k = QSpinBox(); self.traj_k.setRange(1, 10000); self.traj_k.setValue(20); self.traj_k.setPrefix("top ")
+        self.traj_limit = QDoubleSpinBox(); self.traj_limit.setRange(-1000, 100000); self.traj_limit.setDecimals(2); self.traj_limit.setSingleStep(0.1)
+        self.traj_limit.setValue(-1000); self.traj_limit.setSpecialValueText("no limit"); self.traj_limit.setToolTip("Only values at or beyond this limit")
+        show = QPushButton("Show"); show.clicked.connect(self._show_trajectories)
+        for w in (self.traj_query, self.traj_k, self.traj_limit, show): traj_lay.addWidget(w)
+        left_col.addWidget(traj_box)
+
+        
+        tag_box = QGroupBox("Tags for selected patient")
+        tag_lay = QHBoxLayout(tag_box)
+        self.tag_input = QLineEdit(); self.tag_input.setPlaceholderText("Comma-separated tags, e.g., 'frailty, diabetes'")
+        save_tags = QPushButton("Save Tags"); save_tags.clicked.connect(self._save_tags)
+        tag_lay.addWidget(self.tag_input); tag_lay.addWidget(save_tags)
+        left_col.addWidget(tag_box)
+
+        facet_box = QGroupBox("Tags among matching patients")
+        facet_lay = QVBoxLayout(facet_box)
+        self.tag_facets = QListWidget(); self.tag_facets.setMaximumHeight(130)
+        self.tag_facets.setToolTip("Click a tag to add tag:NAME to the search, again to remove it.\n"
+                                   "Combine with AND, OR and NOT, e.g. tag:frailty AND tag:diabetes NOT tag:palliative")
+        self.tag_facets.itemClicked.connect(self._toggle_tag_filter)
+        facet_lay.addWidget(self.tag_facets)
+        left_col.addWidget(facet_box)
+
+        top.addLayout(left_col, stretch=1)
+
+        
+        form = QVBoxLayout()
+        r1 = QHBoxLayout()
+        r1.addWidget(QLabel("Patient Name:")); self.name_input = QLineEdit(); r1.addWidget(self.name_input)
+        r1.addWidget(QLabel("MCP:")); self.mcp_input = QLineEdit(); r1.addWidget(self.mcp_input)
+        form.addLayout(r1)
+
+        r2 = QHBoxLayout()
+        r2.addWidget(QLabel("DOB:")); self.dob_input = QDateEdit(); self.dob_input.setCalendarPopup(True); self.dob_input.setDisplayFormat("yyyy-MM-dd"); r2.addWidget(self.dob_input)
+        r2.addWidget(QLabel("Gender:")); self.gender_input = QComboBox(); self.gender_input.addItems(["Male","Female","Other"]); r2.addWidget(self.gender_input)
+        form.addLayout(r2)
+
+        r3 = QHBoxLayout()
+        r3.addWidget(QLabel("Session Date:")); self.session_date_input = QDateEdit(); self.session_date_input.setCalendarPopup(True); self.session_date_input.setDisplayFormat("yyyy-MM-dd"); r3.addWidget(self.session_date_input)
+        form.addLayout(r3)
+
+        
+        severity_items = ["0","1","2","3","4","5"]
+        self.domain_dropdowns = []
+        for dname in DOMAIN_LIST:
+            h = QHBoxLayout()
+            label = QLabel(dname + " (0=None, 1=Suspected/Undiagnosed, 2=Diagnosed but Mild, 3=Diagnosed and Moderate, 4=Diagnosed and Severe, 5=Diagnosed and Critical)")
+            combo = QComboBox(); combo.addItems(severity_items); self.domain_dropdowns.append(combo)
+            h.addWidget(label, stretch=3); h.addWidget(combo, stretch=1); form.addLayout(h)
+
+        self.save_button = QPushButton("Save Visit and Calculate GHI"); self.save_button.clicked.connect(self.save_record); form.addWidget(self.save_button)
+        self.result_label = QLabel("GHI: N/A"); form.addWidget(self.result_label, alignment=Qt.AlignCenter)
+
+        btns = QHBoxLayout()
+        b1 = QPushButton("View GHI Trend"); b1.clicked.connect(self.view_ghi_chart); btns.addWidget(b1)
+        b2 = QPushButton("View DSAV Trend"); b2.clicked.connect(self.view_dsav_chart); btns.addWidget(b2)
+        b3 = QPushButton("Change Credentials"); b3.clicked.connect(self.change_credentials); btns.addWidget(b3)
+        b4 = QPushButton("Delete Selected Patient"); b4.clicked.connect(self.delete_selected_patient); btns.addWidget(b4)
+        
+        wb = QPushButton("Open Patient Workspace"); wb.clicked.connect(self.open_patient_workspace); btns.addWidget(wb)
+        tl = QPushButton("Timeline"); tl.clicked.connect(self.open_timeline); btns.addWidget(tl)
+        rb = QPushButton("Report Builder"); rb.clicked.connect(self.open_report_builder); btns.addWidget(rb)
+        st = QPushButton("Settings"); st.clicked.connect(self.open_settings); btns.addWidget(st)
+        bk = QPushButton("Backups"); bk.clicked.connect(self.open_backups); btns.addWidget(bk)
+        dt = QPushButton("Data Tools"); dt.clicked.connect(self.open_data_tools); btns.addWidget(dt)
+        ca = QPushButton("Cohort Analytics"); ca.clicked.connect(self.open_cohort); btns.addWidget(ca)
+        sn = QPushButton("Search Notes"); sn.clicked.connect(self.open_text_search); btns.addWidget(sn)
+
+        form.addLayout(btns)
+
+        top.addLayout(form, stretch=3)
+        layout.addLayout(top)
+        
+        content = QWidget()
+        content.setLayout(layout)
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        scroll.setWidget(content)
+        outer = QVBoxLayout()
+        outer.addWidget(scroll)
+        self.setLayout(outer)
+
+        self.load_patient_registry()
+
+    
+    def _install_shortcuts(self):
+        QShortcut(QKeySequence("Ctrl+S"), self, activated=self.save_record)
+        QShortcut(QKeySequence("Ctrl+F"), self, activated=lambda: self.search_input.setFocus())
+        QShortcut(QKeySequence("F2"), self, activated=self.open_patient_workspace)
+        QShortcut(QKeySequence("F3"), self, activated=self.open_timeline)
+        QShortcut(QKeySequence("F4"), self, activated=self.open_report_builder)
+        QShortcut(QKeySequence("Ctrl+Shift+F"), self, activated=self.open_text_search)
+
+    
+    def _apply_filter(self):
+        self._search_timer.stop()
+        try:
+            hits = query_patients(self.search_input.text())
+        except QueryError as e:
+            self.registry_count.setText(f"Query error: {e}"); return
+        reg = DATASTORE.list_patients()
+        rows = list(reg.items()) if hits is None else [(m, reg[m]) for m in hits if m in reg]
+        head = self.patient_list.header(); col = head.sortIndicatorSection()
+        if 0 <= col < len(REGISTRY_COLUMNS):
+            rows.sort(key=lambda r: RegistryItem.sort_key(r[0], r[1], col), reverse=head.sortIndicatorOrder() == Qt.DescendingOrder)
+        cap = int(SETTINGS.get("registry_max_rows", 2000))
+        self._fill_registry([RegistryItem(mcp, p) for mcp, p in rows[:cap]], len(rows))
+        self.tag_facets.clear()
+        for tag, n in tag_facets(self.search_input.text()).items():
+            it = QListWidgetItem(f"{tag} ({n:,})"); it.setData(Qt.UserRole, tag); self.tag_facets.addItem(it)
+
+    def _toggle_tag_filter(self, item):
+        text, term = self.search_input.text(), f"tag:{item.data(Qt.UserRole)}"
+        words = split_query(text)
+        if term in words: self.search_input.setText(" ".join(quote_term(w) for w in words if w != term))
+        else: self.search_input.setText(f"{text.rstrip()} {quote_term(term)}".lstrip())
+
+    def _fill_registry(self, items, matched=None):
+        """Replace the registry rows; only the first registry_max_rows matches are turned into widgets."""
+        self.patient_list.clear(); self.patient_list.addTopLevelItems(items)
+        matched = len(items) if matched is None else matched
+        self.registry_count.setText(f"{matched} patients" if matched == len(items) else
+                                    f"Showing {len(items)} of {matched} patients; refine the search to see the rest")
+
+    def _show_trajectories(self):
+        metric, largest = self.traj_query.currentData()
+        limit = None if self.traj_limit.value() == self.traj_limit.minimum() else self.traj_limit.value()
+        index = analytics.trajectories()
+        registry, items = DATASTORE.list_patients(), []
+        for mcp, _ in index.top(metric, self.traj_k.value(), largest, limit):
+            m = index.get(mcp)
+            it = RegistryItem(mcp, registry.get(mcp, {}))
+            fmt = lambda v, spec: "n/a" if v != v else format(v, spec)
+            it.setToolTip(0, f"{m['visits']} dated visits, last {m['last_visit']} ({m['days_since']} days ago)\n"
+                          f"slope {fmt(m['slope'], '+.3f')}/yr, last change {fmt(m['last_delta'], '+.3f')}, volatility {fmt(m['volatility'], '.3f')}")
+            items.append(it)
+        self._fill_registry(items)
+
+    def _save_tags(self):
+        it = self.patient_list.currentItem()
+        if not it: QMessageBox.warning(self,"Select","Choose a patient first."); return
+        mcp = it.text(0)
+        tags = [t.strip() for t in self.tag_input.text().split(",") if t.strip()]
+        DATASTORE.set_tags(mcp, sorted(set(tags))); QMessageBox.information(self,"Saved","Tags updated.")
+        self._apply_filter()
+
+    
+    def maybe_first_time_setup(self):
+        creds = load_credentials()
+        first_run = (not creds["username"] and not creds["password"]) or (creds["username"] == FACTORY_USER and creds["password"] == FACTORY_PASS)
+        if first_run:
+            resp = QMessageBox.question(self, "First-time Setup", "No secure credentials are set yet.\n\nSet a username & password now?", QMessageBox.Yes | QMessageBox.No)
+            if resp == QMessageBox.Yes:
+                username, ok1 = QInputDialog.getText(self, "Set Username", "New username:")
+                if not ok1 or not username.strip():
+                    QMessageBox.warning(self, "Skipped", "Username not set. You can set credentials later from 'Change Credentials'."); return
+                password, ok2 = QInputDialog.getText(self, "Set Password", "New password:")
+                if not ok2 or not password:
+                    QMessageBox.warning(self, "Skipped", "Password not set. You can set credentials later from 'Change Credentials'."); return
+                save_credentials(username.strip(), password); QMessageBox.information(self, "Saved", "Credentials saved. Next time, login will be required.")
+        
+        if SETTINGS.get("theme") == "dark":
+            self.setStyleSheet(self.styleSheet() + "\nQWidget{background:#1e1f22;color:#e5e5e5;} QPushButton{background:#2b2d31;border:1px solid #3a3d41;}")
+
+    
+    def reload_data(self):
+        """Drop every view of the old dataset (after a restore) and redraw the registry."""
+        DATASTORE.invalidate(); self.data = {}
+        for w in (self.chart_window, self.fig_window):
+            if w is not None: w.close()
+        self.chart_window = self.fig_window = None
+        self.load_patient_registry()
+
+    def load_patient_registry(self):
+        self.data = DATASTORE.list_patients()
+        self._apply_filter()
+
+    def load_patient_record(self, item, column=0):
+        mcp = item.text(0)
+        patient = self.data.get(mcp, {})
+        if patient:
+            self.name_input.setText(patient.get("name", ""))
+            self.mcp_input.setText(mcp)
+            try:
+                self.dob_input.setDate(date.fromisoformat(patient.get("dob")))
+            except Exception:
+                pass
+            self.gender_input.setCurrentText(patient.get("gender", ""))
+            self.tag_input.setText(", ".join(patient.get("tags", [])))
+
+    def delete_selected_patient(self):
+        selected_item = self.patient_list.currentItem()
+        if selected_item:
+            mcp = selected_item.text(0)
+            confirm = QMessageBox.question(self, "Delete Patient", f"Are you sure you want to delete patient {mcp}?", QMessageBox.Yes | QMessageBox.No)
+            if confirm == QMessageBox.Yes:
+                DATASTORE.delete_patient(mcp); self.load_patient_registry()
+
+    
+    def change_credentials(self):
+        username, ok1 = QInputDialog.getText(self, "Change Username", "New username:")
+        if ok1 and username.strip():
+            password, ok2 = QInputDialog.getText(self, "Change Password", "New password:")
+            if ok2 and password:
+                save_credentials(username.strip(), password); QMessageBox.information(self, "Updated", "Credentials updated successfully.\nThey will be required next time.")
+
+    
+    def save_record(self):
+        try:
+            name = self.name_input.text().strip()
+            mcp = self.mcp_input.text().strip()
+            dob = self.dob_input.date().toPyDate()
+            gender = self.gender_input.currentText()
+            session_date = self.session_date_input.date().toPyDate()
+            today = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            age = date.today().year - dob.year - ((date.today().month, date.today().day) < (dob.month, dob.day))
+
+            impairments = [int(d.currentText()) for d in self.domain_dropdowns]
+            dsavs, ghi = score_record(impairments)
+
+            record = {"timestamp": today, "session_date": str(session_date), "impairments": impairments, "dsavs": dsavs, "ghi": ghi}
+
+            DATASTORE.append_entry(mcp, "records", record, name=name, gender=gender, dob=str(dob), age=age)
+
+            self.result_label.setText(f"GHI: {ghi}")
+            QMessageBox.information(self, "Saved", "Patient visit saved and GHI calculated.")
+            audit(f"{current_username()} saved record for MCP={mcp}")
+            self.load_patient_registry()
+
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+
+    
+    def _line_chart(self, timestamps, values, title, ylabel):
+        self.fig_window = QWidget(); self.fig_window.setWindowTitle(title)
+        scroll = QScrollArea(self.fig_window); scroll.setWidgetResizable(True)
+        scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOn); scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+        container = QWidget(); v = QVBoxLayout(container); canvas = FigureCanvas(Figure(figsize=(14, 6))); v.addWidget(canvas)
+        scroll.setWidget(container); main_layout = QVBoxLayout(); main_layout.addWidget(scroll); self.fig_window.setLayout(main_layout)
+        ax = canvas.figure.subplots(); ax.plot(timestamps, values, marker='o', linestyle='-'); ax.set_title(title); ax.set_xlabel("Session Date"); ax.set_ylabel(ylabel); ax.grid(True); canvas.draw()
+        self.fig_window.show()
+
+    def load_chart(self, key, ylabel, title, do_sum=False):
+        mcp = self.mcp_input.text().strip()
+        if not mcp:
+            QMessageBox.warning(self, "Invalid MCP", "Please enter a valid MCP number to view chart.")
+            return
+        records = DATASTORE.get_section(mcp, "records")
+        if not records:
+            QMessageBox.information(self, "No Records", "No visits found for this patient.")
+            return
+        timestamps = [r["session_date"] for r in records]
+        values = []
+        for r in records:
+            if key not in r: values.append(None)
+            elif do_sum and isinstance(r[key], list): values.append(sum(r[key]))
+            else: values.append(r[key])
+        filtered_timestamps, filtered_values = [], []
+        for t, v in zip(timestamps, values):
+            if v is not None:
+                filtered_timestamps.append(t)
+                try: filtered_values.append(float(v))
+                except Exception: filtered_values.append(np.nan)
+        if not filtered_values:
+            QMessageBox.information(self, "No Data", "No valid data points available to plot."); return
+        self._line_chart(filtered_timestamps, filtered_values, title, ylabel)
+
+    def view_ghi_chart(self):
+        self.load_chart("ghi", "GHI", "GHI Over Time")
+
+    def view_dsav_chart(self):
+        mcp = self.mcp_input.text().strip()
+        if not mcp:
+            QMessageBox.warning(self, "Invalid MCP", "Please enter a valid MCP number to view chart.")
+            return
+        records = DATASTORE.get_section(mcp, "records")
+        if not records:
+            QMessageBox.information(self, "No Records", "No visits found for this patient.")
+            return
+        timestamps = [r["session_date"] for r in records]
+        matrix = dsav_matrix(records).T
+        self.chart_window = ChartWindow(matrix, timestamps, "DSAV Heatmap by Domain and Session")
+        self.chart_window.show()
+
+    
+    def open_patient_workspace(self):
+        mcp = self.mcp_input.text().strip()
+        if not mcp: QMessageBox.warning(self, "MCP required", "Enter an MCP to open the workspace."); return
+        DATASTORE.ensure_patient(mcp, self.name_input.text().strip(), self.gender_input.currentText())
+        PatientWorkspaceDialog(self, mcp).exec_()
+        self._apply_filter()  # pending references may have changed
+
+    def open_timeline(self):
+        mcp = self.mcp_input.text().strip()
+        if not mcp: QMessageBox.warning(self, "MCP required", "Enter an MCP to open Timeline."); return
+        TimelineDialog(self, mcp).exec_()
+
+    def open_report_builder(self):
+        mcp = self.mcp_input.text().strip()
+        if not mcp: QMessageBox.warning(self, "MCP required", "Enter an MCP to open Report Builder."); return
+        ReportBuilderDialog(self, mcp).exec_()
+
+    def open_settings(self):
+        SettingsDialog(self).exec_()
+
+    def open_backups(self):
+        BackupDialog(self).exec_()
+
+    def open_data_tools(self):
+        DataToolsDialog(self).exec_()
+
+    def open_cohort(self):
+        CohortDialog(self).exec_()
+
+    def open_text_search(self):
+        TextSearchDialog(self).exec_()
+
+
+def main():
+    app = QApplication(sys.argv)
+    login = LoginDialog()
+    if login.exec_() == QDialog.Accepted:
+        window = NLGHIApp()
+        window.show()
+        rc = app.exec_()
+        DATASTORE.flush()
+        wait_for_backups()
+        close_store()
+        sys.exit(rc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""Registry search indexes and the registry query language.
+
+search_index() keeps a trigram index over each patient's MCP and name, plus
+a tag -> MCP map, built from the registry entries alone (no record bodies).
+Postings are NumPy arrays in CSR form, so 100k patients cost a few MB.
+Writes made through DATASTORE add the touched patients to a small overlay
+instead of rebuilding; the overlay is folded back in once it grows.
+
+query_patients() runs queries such as `tag:frailty ghi>2.5 domain:Renal>=3`
+or `tag:frailty AND tag:diabetes NOT tag:palliative` (see parse_query) as
+mask operations over patient_columns(), one NumPy column per registry field
+plus the latest ratings and a TagIndex bitmap per tag; tag_facets() counts
+each tag among the matches.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .core import DATASTORE, DOMAIN_LIST, get_store, records_matrix
+
+_MAX_CHAR = 1 << 21  # every code point fits in 21 bits, so a trigram packs into one int64
+
+
+def _texts(entries: Dict[str, Dict]) -> List[str]:
+    # a query never contains the newline, so "q in text" == q in the MCP or in the name
+    return [f"{mcp}\n{e.get('name', '')}".lower() for mcp, e in entries.items()]
+
+
+def _trigrams(texts: List[str], chunk: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+    """(trigram codes, text row) for every distinct trigram of every text, sorted by code then row."""
+    grams, rows = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for at in range(0, len(texts), chunk):
+        part = texts[at:at + chunk]
+        width = max(3, max(map(len, part)))
+        chars = np.array(part, dtype=f"<U{width}").view(np.uint32).reshape(len(part), width).astype(np.int64)
+        g = (chars[:, :-2] * _MAX_CHAR + chars[:, 1:-1]) * _MAX_CHAR + chars[:, 2:]
+        real = chars[:, 2:] != 0  # windows running into the padding
+        grams.append(g[real]); rows.append(np.broadcast_to(np.arange(at, at + len(part))[:, None], g.shape)[real])
+    grams, rows = np.concatenate(grams), np.concatenate(rows)
+    order = np.lexsort((rows, grams))
+    grams, rows = grams[order], rows[order]
+    keep = np.r_[True, (grams[1:] != grams[:-1]) | (rows[1:] != rows[:-1])]
+    return grams[keep], rows[keep]
+
+
+class SearchIndex:
+    """Substring search over MCP and name, and over tags, for the registry filter.
+
+    Matches what the registry filter always did: a query hits a patient
+    when it occurs in the MCP, the name, or one of the tags (case-
+    insensitive). Queries of three or more characters intersect trigram
+    postings and verify the few candidates; shorter ones scan the
+    lower-cased texts, which are kept in memory.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Dict]] = None):
+        entries = entries or {}
+        self._mcps: List[Optional[str]] = list(entries)  # row -> MCP, None once superseded
+        self._rows: Dict[str, int] = {mcp: i for i, mcp in enumerate(self._mcps)}
+        self._texts = _texts(entries)
+        grams, rows = _trigrams(self._texts)
+        self._grams, starts = np.unique(grams, return_index=True)
+        self._starts = np.r_[starts, len(rows)]
+        self._postings = rows
+        self._base = len(self._mcps)
+        self._overlay: Dict[int, Set[int]] = {}
+        self._tags: Dict[str, Set[str]] = {}
+        self._tags_of: Dict[str, List[str]] = {}
+        for mcp, e in entries.items():
+            self._set_tags(mcp, e.get("tags", []))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _set_tags(self, mcp: str, tags):
+        for t in self._tags_of.pop(mcp, ()):
+            s = self._tags[t]; s.discard(mcp)
+            if not s: del self._tags[t]
+        tags = sorted({t.lower() for t in tags})
+        if tags: self._tags_of[mcp] = tags
+        for t in tags: self._tags.setdefault(t, set()).add(mcp)
+
+    def update(self, mcp: str, entry: Optional[Dict]):
+        """Re-index one patient from its registry entry (None when deleted)."""
+        row = self._rows.pop(mcp, None)
+        if row is not None: self._mcps[row] = None
+        self._set_tags(mcp, [] if entry is None else entry.get("tags", []))
+        if entry is None: return
+        row = len(self._mcps)
+        self._mcps.append(mcp); self._rows[mcp] = row
+        self._texts.extend(_texts({mcp: entry}))
+        for g in _trigrams(self._texts[row:])[0].tolist():
+            self._overlay.setdefault(g, set()).add(row)
+
+    @property
+    def stale_rows(self) -> int:
+        """Rows added or superseded since the postings were built."""
+        return len(self._mcps) - len(self._rows) + len(self._mcps) - self._base
+
+    def _posting(self, gram: int) -> np.ndarray:
+        i = np.searchsorted(self._grams, gram)
+        base = self._postings[self._starts[i]:self._starts[i + 1]] if i < len(self._grams) and self._grams[i] == gram else self._postings[:0]
+        extra = self._overlay.get(gram)
+        return np.union1d(base, np.fromiter(extra, dtype=np.int64, count=len(extra))) if extra else base
+
+    def _text_rows(self, q: str) -> List[int]:
+        if len(q) < 3:
+            return [i for i, t in enumerate(self._texts) if q in t]
+        grams, _ = _trigrams([q])
+        rows = None
+        for p in sorted((self._posting(g) for g in grams.tolist()), key=len):
+            rows = p if rows is None else np.intersect1d(rows, p, assume_unique=True)
+            if not len(rows): return []
+        return [i for i in rows.tolist() if q in self._texts[i]]
+
+    def search(self, q: str) -> Optional[Set[str]]:
+        """MCPs matching q, or None for an empty query (everyone)."""
+        q = q.strip().lower()
+        if not q: return None
+        hits = {self._mcps[i] for i in self._text_rows(q)}
+        hits.discard(None)
+        for tag, mcps in self._tags.items():
+            if q in tag: hits |= mcps
+        return hits
+
+
+class QueryError(ValueError):
+    """A registry query that cannot be parsed."""
+
+
+# query field -> (PatientColumns attribute, value parser)
+QUERY_FIELDS = {
+    "ghi": ("ghi", float), "visits": ("visits", float), "age": ("age", float), "pending": ("pending", float),
+    "last_visit": ("last_day", lambda v: date.fromisoformat(v).toordinal()),
+}
+_OPS = {">=": np.greater_equal, "<=": np.less_equal, "!=": np.not_equal, ">": np.greater, "<": np.less, "=": np.equal}
+_KEYED = re.compile(r"^([a-z_]+):(.+?)(?:(>=|<=|!=|>|<|=)([^<>=!]+))?$", re.I)
+_COMPARE = re.compile(r"^([a-z_]+)(>=|<=|!=|>|<|=)(.+)$", re.I)
+_TOKEN = re.compile(r'(?:[^\s"]+|"[^"]*"?)+')  # double quotes group words; an unclosed one runs to the end
+
+
+def _norm(s: str) -> str:
+    return re.sub(r"[^0-9a-z]", "", s.lower())
+
+def _domain_index(name: str) -> int:
+    q = _norm(name)
+    # exact name, then name prefix, then prefix of any "/"-separated part ("Cardiopulmonary")
+    hits = [i for i, d in enumerate(DOMAIN_LIST) if _norm(d) == q] or \
+           [i for i, d in enumerate(DOMAIN_LIST) if q and _norm(d).startswith(q)] or \
+           [i for i, d in enumerate(DOMAIN_LIST) if q and any(_norm(part).startswith(q) for part in re.split(r"[/-]", d))]
+    if len(hits) != 1:
+        raise QueryError(f"domain {name!r} matches " + (", ".join(DOMAIN_LIST[i] for i in hits) if hits else "no domain"))
+    return hits[0]
+
+def _number(parse, v: str, what: str):
+    try: return parse(v)
+    except ValueError: raise QueryError(f"bad value {v!r} for {what}") from None
+
+def _term(token: str):
+    neg = token.startswith("-") and len(token) > 1
+    if neg: token = token[1:]
+    m = _KEYED.match(token)
+    if m:
+        key, arg, op, val = m.group(1).lower(), m.group(2), m.group(3), m.group(4)
+        if key == "tag":
+            if op: raise QueryError(f"tag:{arg} takes no comparison")
+            return neg, "tag", arg.lower()
+        if key == "domain":
+            return neg, "domain", (_domain_index(arg), op or ">=", _number(int, val, "domain") if op else 1)
+    m = _COMPARE.match(token)
+    if m and m.group(1).lower() in QUERY_FIELDS:
+        field, op, val = m.group(1).lower(), m.group(2), m.group(3)
+        attr, parse = QUERY_FIELDS[field]
+        return neg, "field", (attr, op, _number(parse, val, field))
+    return neg, "word", token
+
+def split_query(text: str) -> List[str]:
+    """Split a query into terms; double quotes group words and are dropped, apostrophes are kept."""
+    return [t.replace('"', "") for t in _TOKEN.findall(text)]
+
+def quote_term(term: str) -> str:
+    """`term` quoted so that split_query() reads it back as one term."""
+    return f'"{term}"' if any(c.isspace() for c in term) else term
+
+@lru_cache(maxsize=256)
+def parse_query(text: str) -> Tuple[Tuple[Tuple[bool, str, Any], ...], ...]:
+    """Parse a registry query into OR-groups of AND-ed terms.
+
+    Terms are separated by spaces and may be negated with a leading '-'
+    or a preceding NOT: tag:NAME, domain:NAME[op N] (latest rating; op
+    defaults to >=1), FIELD op VALUE for ghi, visits, age, pending (open
+    future references) and last_visit (YYYY-MM-DD), with op one of
+    > >= < <= = !=. Any other word, including one such as O'Brien or a=b,
+    is a substring search over MCP, name and tags. Terms are AND-ed (an
+    explicit AND is allowed); OR between terms separates alternatives;
+    double quotes group words with spaces.
+    """
+    groups, cur, negate = [], [], False
+    for tok in split_query(text):
+        if tok in ("OR", "AND") and negate:
+            raise QueryError(f"NOT must be followed by a term, not {tok}")
+        if tok == "OR":
+            if cur: groups.append(tuple(cur)); cur = []
+        elif tok == "NOT":
+            negate = not negate
+        elif tok != "AND":
+            neg, kind, arg = _term(tok)
+            cur.append((neg != negate, kind, arg)); negate = False
+    if negate: raise QueryError("NOT must be followed by a term")
+    if cur: groups.append(tuple(cur))
+    return tuple(groups)
+
+
+def _impairment_matrix(values: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(DOMAIN_LIST)
+    if all(isinstance(v, list) and len(v) == n for v in values):
+        try:  # the common case converts in one go
+            mat = np.array(values, dtype=np.int16).reshape(len(values), n)
+            return mat, np.ones(len(values), dtype=bool)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return records_matrix([{"impairments": v} for v in values], "impairments")
+
+
+class TagIndex:
+    """Tag -> patient bitmap over PatientColumns rows, with per-tag counts.
+
+    Each tag is a NumPy bool column, so AND/OR/NOT of tags are element-wise
+    mask operations and counting a tag within any selection is one pass.
+    `counts` is kept exact on every update; a tag is dropped when its last
+    patient loses it.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.columns: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, int] = {}
+        self._row_tags: Dict[int, Tuple[str, ...]] = {}
+
+    def grow(self, capacity: int):
+        for t, col in self.columns.items():
+            new = np.zeros(capacity, dtype=bool); new[:len(col)] = col; self.columns[t] = new
+        self.capacity = capacity
+
+    def set(self, row: int, tags) -> None:
+        """Replace the tags of one row (tags are matched case-insensitively)."""
+        for t in self._row_tags.pop(row, ()):
+            self.columns[t][row] = False; self.counts[t] -= 1
+            if not self.counts[t]: del self.columns[t], self.counts[t]
+        tags = tuple(sorted({t.lower() for t in tags}))
+        if tags: self._row_tags[row] = tags
+        for t in tags:
+            if t not in self.columns: self.columns[t] = np.zeros(self.capacity, dtype=bool); self.counts[t] = 0
+            self.columns[t][row] = True; self.counts[t] += 1
+
+    def mask(self, tag: str, n: int) -> np.ndarray:
+        """Rows [0, n) carrying `tag`, as a fresh bool array."""
+        col = self.columns.get(tag.lower())
+        return col[:n].copy() if col is not None else np.zeros(n, dtype=bool)
+
+    def facets(self, within: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """tag -> patients carrying it, optionally only among rows set in `within`; most common first."""
+        if within is None:
+            counts = self.counts
+        else:
+            n = len(within)
+            counts = {t: int(np.count_nonzero(col[:n] & within)) for t, col in self.columns.items()}
+        return _ranked(counts)
+
+
+def _ranked(counts: Dict[str, int]) -> Dict[str, int]:
+    return dict(sorted(((t, c) for t, c in counts.items() if c), key=lambda tc: (-tc[1], tc[0])))
+
+
+class PatientColumns:
+    """Registry fields and each patient's latest-record ratings as NumPy columns.
+
+    One row per patient (rows of deleted patients are masked out by
+    `alive`), with ghi, visits, age, pending (open future references),
+    last_day (ordinal of the last visit, -1 if none), impairments (latest
+    record, has_imp False when missing or malformed) and the tag bitmaps
+    in `tags`. Columns grow by doubling so updates stay amortized O(1).
+    """
+
+    def __init__(self, entries: Dict[str, Dict], latest: Dict[str, Any]):
+        """entries: list_patients(); latest: mcp -> impairments of the last entered record."""
+        n = len(entries)
+        self.mcps: List[str] = list(entries)
+        self.rows: Dict[str, int] = {mcp: i for i, mcp in enumerate(self.mcps)}
+        self.n = n
+        self.alive = np.ones(n, dtype=bool)
+        self.ghi = np.array([e.get("latest_ghi") if isinstance(e.get("latest_ghi"), (int, float)) else np.nan for e in entries.values()], dtype=np.float64)
+        self.visits = np.array([e.get("record_count", 0) for e in entries.values()], dtype=np.int32)
+        self.age = np.array([e.get("age") if isinstance(e.get("age"), (int, float)) else -1 for e in entries.values()], dtype=np.int32)
+        self.pending = np.array([e.get("pending_refs", 0) for e in entries.values()], dtype=np.int32)
+        self.last_day = np.array([date.fromisoformat(e["last_visit"]).toordinal() if e.get("last_visit") else -1 for e in entries.values()], dtype=np.int32)
+        self.impairments, self.has_imp = _impairment_matrix([latest.get(mcp) for mcp in self.mcps])
+        self.tags = TagIndex(n)
+        for i, e in enumerate(entries.values()):
+            if e.get("tags"): self.tags.set(i, e["tags"])
+
+    _ROW_COLUMNS = ("alive", "ghi", "visits", "age", "pending", "last_day", "impairments", "has_imp")
+
+    def _grow(self):
+        cap = max(16, 2 * len(self.alive))
+        for name in self._ROW_COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype); new[:len(old)] = old
+            setattr(self, name, new)
+        self.tags.grow(cap)
+
+    def update(self, mcp: str, entry: Optional[Dict], latest):
+        """Refresh one patient's row from its registry entry and latest impairments (entry None: deleted)."""
+        i = self.rows.get(mcp)
+        if i is None:
+            if entry is None: return
+            if self.n == len(self.alive): self._grow()
+            i = self.n; self.n += 1; self.rows[mcp] = i; self.mcps.append(mcp)
+        self.alive[i] = entry is not None
+        self.tags.set(i, () if entry is None else entry.get("tags", ()))
+        if entry is None: return
+        one = PatientColumns({mcp: entry}, {mcp: latest})
+        for name in self._ROW_COLUMNS[1:]:
+            getattr(self, name)[i] = getattr(one, name)[0]
+
+    def __len__(self):
+        return int(self.alive[:self.n].sum())
+
+    def _mask(self, term, words: SearchIndex) -> np.ndarray:
+        neg, kind, arg = term
+        n = self.n
+        if kind == "word":
+            m = np.zeros(n, dtype=bool)
+            m[[self.rows[mcp] for mcp in words.search(arg) or () if mcp in self.rows]] = True
+        elif kind == "tag":
+            m = self.tags.mask(arg, n)
+        elif kind == "domain":
+            j, op, v = arg
+            m = self.has_imp[:n] & _OPS[op](self.impairments[:n, j], v)
+        else:
+            attr, op, v = arg
+            col = getattr(self, attr)[:n]
+            m = _OPS[op](col, v)
+            if attr == "last_day": m &= col >= 0
+            elif attr == "age": m &= col >= 0
+        return ~m if neg else m
+
+    def match(self, groups, words: SearchIndex) -> np.ndarray:
+        """Row mask of the live patients matching a parse_query() result (everyone when groups is empty)."""
+        if not groups: return self.alive[:self.n].copy()
+        hit = np.zeros(self.n, dtype=bool)
+        for group in groups:
+            m = self.alive[:self.n].copy()
+            for term in group:
+                m &= self._mask(term, words)
+            hit |= m
+        return hit
+
+    def select(self, groups, words: SearchIndex) -> List[str]:
+        """MCPs (in registry order) matching a parse_query() result."""
+        return [self.mcps[i] for i in np.flatnonzero(self.match(groups, words)).tolist()]
+
+
+class _Derived:
+    """A derived index for the active engine.
+
+    Rebuilt when the engine's data version moves outside DATASTORE; writes
+    made through DATASTORE are applied per patient by `patch` instead.
+    """
+
+    def __init__(self, build, patch):
+        self.build, self.patch = build, patch
+        self.key, self.value = None, None
+        DATASTORE.listeners.append(self._on_write)
+
+    def get(self):
+        store = get_store()
+        key = (id(store), store.version())
+        if key[1] is None or self.key != key or self.value is None:
+            self.key, self.value = key, self.build()
+        return self.value
+
+    def _on_write(self, mcps, token):
+        if self.value is None or self.key[0] != token[0]: return
+        self.value = self.patch(self.value, mcps)
+        if token[1] is not None: self.key = token
+
+
+def _patch_search(index: SearchIndex, mcps) -> SearchIndex:
+    registry = DATASTORE.list_patients()
+    for mcp in mcps:
+        index.update(mcp, registry.get(mcp))
+    return SearchIndex(registry) if index.stale_rows > max(1024, len(index) // 8) else index
+
+def _patch_columns(cols: PatientColumns, mcps) -> PatientColumns:
+    registry = DATASTORE.list_patients()
+    for mcp in mcps:
+        recs = DATASTORE.get_section(mcp, "records") if mcp in registry else []
+        cols.update(mcp, registry.get(mcp), recs[-1].get("impairments") if recs and isinstance(recs[-1], dict) else None)
+    return cols
+
+_SEARCH = _Derived(lambda: SearchIndex(DATASTORE.list_patients()), _patch_search)
+_COLUMNS = _Derived(lambda: PatientColumns(DATASTORE.list_patients(), dict(get_store().iter_latest_field("impairments"))), _patch_columns)
+
+def search_index() -> SearchIndex:
+    """Substring index for the active engine, kept current by DATASTORE writes."""
+    return _SEARCH.get()
+
+def patient_columns() -> PatientColumns:
+    """Query columns for the active engine, kept current by DATASTORE writes."""
+    return _COLUMNS.get()
+
+def query_patients(text: str) -> Optional[Set[str]]:
+    """MCPs matching a registry query (see parse_query), or None for an empty query."""
+    groups = parse_query(text.strip())
+    if not groups: return None
+    return set(patient_columns().select(groups, search_index()))
+
+def tag_facets(text: str = "") -> Dict[str, int]:
+    """tag -> number of patients matching a registry query (everyone if empty) that carry it."""
+    groups = parse_query(text.strip())
+    if not groups and _COLUMNS.value is None:
+        # the unfiltered registry (e.g. at startup) is counted without building every column
+        return _ranked(Counter(t for e in DATASTORE.list_patients().values() for t in {t.lower() for t in e.get("tags", ())}))
+    cols = patient_columns()
+    return cols.tags.facets(cols.match(groups, search_index()) if groups else None)
@@ -0,0 +1,110 @@
+import numpy as np
+
+from nlghi import analytics
+from nlghi import core as m
+
+
+def _rec(day, imp):
+    dsavs, ghi = m.score_record(imp)
+    return {"session_date": day, "impairments": imp, "dsavs": dsavs, "ghi": ghi}
+
+
+def test_cohort_columns_and_statistics(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    mild, severe = [1] + [0] * 26, [5] * 27
+    d = {
+        "A": {"name": "", "records": [_rec("2024-01-10", mild), _rec("2024-06-01", severe)]},
+        "B": {"name": "", "records": [_rec("2025-02-01", [0] * 27), _rec("bad", mild), {"impairments": [9] * 27}]},
+    }
+    store = m.SqlitePatientStore(str(tmp_path / "c.sqlite3")); store.write_all(d)
+
+    c = analytics.cohort(store)
+    assert len(c) == 4 and c.patients == 2 and c.mcps == ["A", "B"]  # the out-of-range row is dropped
+    assert c.ghi.tolist() == [m.score_record(mild)[1], m.score_record(severe)[1], 0.0, m.score_record(mild)[1]]
+    assert sorted(c.mcps[p] for p in c.patient[c.latest()]) == ["A", "B"]
+    assert c.ghi[c.latest()].tolist() == [m.score_record(severe)[1], 0.0]  # undated rows sort first
+    assert c.ghi_percentiles((50,), latest_only=True)[50] == round(m.score_record(severe)[1] / 2, 4)
+    assert c.domain_means()[m.DOMAIN_LIST[0]] == 1.75
+    assert c.ghi_histogram(bins=5)[0].sum() == 4
+
+    windows = c.prevalence(window_days=365)
+    assert [(w["start"].isoformat(), w["patients"]) for w in windows] == [("2024-01-10", 1), ("2025-01-09", 1)]
+    assert windows[0]["prevalence"][m.DOMAIN_LIST[0]] == 1.0 and windows[1]["prevalence"][m.DOMAIN_LIST[0]] == 0.0
+
+    assert analytics.cohort(store) is c  # cached until the data version moves
+    store.append_entry("B", "records", _rec("2025-03-01", severe))
+    assert len(analytics.cohort(store)) == 5
+    assert np.isfinite(c.ghi).all() and "Patients: 2" in c.summary()
+    store.close()
+
+
+def test_trajectory_index_top_k_and_incremental_updates(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "t.sqlite3"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    monkeypatch.setattr(analytics, "_TRAJECTORIES", (None, None))
+    low, mid, high = [0] * 27, [2] * 27, [4] * 27
+    g = {k: m.score_record(v)[1] for k, v in (("low", low), ("mid", mid), ("high", high))}
+    m.get_store().write_all({
+        "UP": {"name": "", "records": [_rec("2023-01-01", low), _rec("2024-01-01", mid), _rec("2025-01-01", high)]},
+        "DOWN": {"name": "", "records": [_rec("2024-01-01", high), _rec("2024-07-01", low)]},
+        "ONE": {"name": "", "records": [_rec("2020-05-05", mid), _rec("undated", high)]},
+    })
+    m.DATASTORE.invalidate()
+
+    t = analytics.trajectories()
+    up = t.get("UP", today=m.date(2025, 1, 11))
+    assert up["visits"] == 3 and abs(up["slope"] - g["high"] / 2 * 365.25 / 365.5) < 1e-3
+    assert up["last_delta"] == round(g["high"] - g["mid"], 4) and up["volatility"] < 1e-3 and up["days_since"] == 10
+    assert [mcp for mcp, _ in t.top("slope", 5)] == ["UP", "DOWN"]  # ONE has a single dated visit
+    assert [mcp for mcp, _ in t.top("slope", 5, largest=False)] == ["DOWN", "UP"]
+    assert [mcp for mcp, _ in t.top("slope", 5, limit=0.0)] == ["UP"]
+    assert t.top("days_since", 1, today=m.date(2025, 1, 11)) == [("ONE", m.date(2025, 1, 11).toordinal() - m.date(2020, 5, 5).toordinal())]
+    assert [mcp for mcp, _ in t.top("days_since", 5, limit=150, today=m.date(2025, 1, 11))] == ["ONE", "DOWN"]
+
+    m.DATASTORE.append_entry("ONE", "records", _rec("2021-05-05", high))  # re-scored in place, no rebuild
+    m.DATASTORE.delete_patient("DOWN")
+    assert analytics.trajectories() is t
+    assert [mcp for mcp, _ in t.top("slope", 5)] == ["ONE", "UP"] and "DOWN" not in t
+    m.get_store().append_entry("UP", "records", _rec("2025-06-01", low))  # outside the DataStore: rebuilt
+    assert analytics.trajectories() is not t and analytics.trajectories().get("UP")["visits"] == 4
+    m.close_store()
+
+
+def test_symptom_scan_flags_narrative_domains_rated_zero(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(analytics, "SYMPTOM_CACHE_FILE", str(tmp_path / "votes.npz"))
+    monkeypatch.setattr(analytics, "_VOTE_CACHE", (None, {}))
+    cough, renal = 1, 4  # lexicon domains of "cough"/"wheeze" and "flank pain"/"hematuria"
+    rated = [0] * 27; rated[renal] = 2
+    d = {
+        "A": {"name": "", "records": [_rec("2024-01-10", [3] * 27), _rec("2024-06-01", rated)],
+              "history": [{"title": "t", "body": "Dry cough and wheeze."}, {"title": "t", "body": "cough again; flank pain"}],
+              "notes": [{"title": "n", "body": "Hematuria noted."}]},
+        "B": {"name": "", "records": [], "notes": [{"title": "n", "body": "Dry cough and wheeze."}]},
+        "C": {"name": "", "records": [_rec("2025-01-01", [0] * 27)], "history": [{"title": "t", "body": "Brain MRI clear, drain site dry."}]},
+    }
+    for store in (m.SqlitePatientStore(str(tmp_path / "s.sqlite3")), m.ShardedPatientStore(str(tmp_path / "shards"))):
+        store.write_all(d)
+        scan = analytics.scan_symptoms(store, workers=2, partition=2)  # two pool tasks, one inline remainder
+        assert scan.mcps == ["A", "B", "C"]
+        assert scan.votes[0, cough] == 4 and scan.votes[0, renal] == 2 and scan.votes[2].sum() == 0
+        assert scan.votes.tolist() == [[sum(s["votes"] for body in bodies for s in m.analyze_symptoms(body)["suggestions"] if s["domain_index"] == k)
+                                        for k in range(27)] for bodies in (["Dry cough and wheeze.", "cough again; flank pain", "Hematuria noted."],
+                                                                           ["Dry cough and wheeze."], ["Brain MRI clear, drain site dry."])]
+        assert scan.latest[1].tolist() == [-1] * 27 and scan.latest[0].tolist() == rated
+        # renal is rated 2; "pain" (in "flank pain") votes for the general domain; B has no record to compare with
+        assert scan.flagged() == [("A", [cough, 26])]
+        assert scan.flagged(min_votes=2) == [("A", [cough])] and scan.flagged(min_votes=5) == []
+        store.close()
+
+    # a second run analyzes nothing new: every text comes from the cache file
+    monkeypatch.setattr(analytics, "_VOTE_CACHE", (None, {}))
+    monkeypatch.setattr(analytics, "symptom_votes", lambda texts: (_ for _ in ()).throw(AssertionError(texts)) if texts else np.zeros((0, 27), np.uint8))
+    store = m.SqlitePatientStore(str(tmp_path / "s.sqlite3"))
+    assert analytics.scan_symptoms(store).flagged() == [("A", [cough, 26])]
+    store.close()
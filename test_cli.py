@@ -0,0 +1,56 @@
+import csv
+import json
+
+from nlghi import core as m
+from nlghi import cli
+
+
+def test_cli_score_validate_export(tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "AUDIT_LOG", str(tmp_path / "audit.log"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    visits = tmp_path / "visits.csv"
+    with open(visits, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["mcp", "session_date", "name"] + m.DOMAIN_LIST)
+        w.writerow(["A1", "2025-01-01", "Ann"] + [1] * 27)
+        w.writerow(["A1", "2025-02-01", "Ann"] + [5] + [0] * 26)
+        w.writerow(["B2", "2025-02-01", "Bo"] + [9] * 27)  # out of range, skipped
+
+    out = tmp_path / "scores.jsonl"
+    assert cli.main(["score", str(visits), "-o", str(out), "--save"]) == 1
+    scored = [json.loads(l) for l in out.read_text().splitlines()]
+    assert [s["ghi"] for s in scored] == [m.score_record([1] * 27)[1], m.score_record([5] + [0] * 26)[1]]
+    assert "skipped" in capsys.readouterr().err
+
+    assert cli.main(["validate"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["Patients: 1", "Issues found: 0"]
+
+    assert cli.main(["export", "--formats", "md,csv", "--out", str(tmp_path / "exp")]) == 0
+    report = (tmp_path / "exp" / "report_A1.md").read_text()
+    assert report.startswith("# Visit Summary — MCP A1") and "Session Date: 2025-02-01" in report
+    assert len((tmp_path / "exp" / "records_A1.csv").read_text().splitlines()) == 3
+
+
+def test_cli_score_skips_malformed_json_lines(tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "AUDIT_LOG", str(tmp_path / "audit.log"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    visits = tmp_path / "visits.jsonl"
+    good = {"mcp": "A1", "session_date": "2025-01-01", "impairments": [1] * 27}
+    visits.write_text("\n".join([json.dumps(good), "not json", "[1, 2]",
+                                 json.dumps(dict(good, session_date="01/02/2025")),
+                                 json.dumps(dict(good, session_date="2025-03-01"))]) + "\n")
+
+    assert cli.main(["score", str(visits), "-o", str(tmp_path / "out.csv"), "--save"]) == 1
+    err = capsys.readouterr().err
+    assert [line.split(":")[1] for line in err.splitlines() if "skipped:" in line] == ["2", "3", "4"]
+    assert "Scored 2 visit(s), skipped 3." in err
+    assert [r["session_date"] for r in m.DATASTORE.get_section("A1", "records")] == ["2025-01-01", "2025-03-01"]
+    assert cli.main(["validate"]) == 0
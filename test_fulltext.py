@@ -0,0 +1,55 @@
+from nlghi import core as m
+from nlghi import fulltext
+
+
+def test_text_index_ranks_entries_and_follows_writes(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "s.sqlite3"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    monkeypatch.setattr(fulltext, "TEXT_INDEX_FILE", str(tmp_path / "text.sqlite3"))
+    filler = " ".join(["reviewed"] * 30)
+    d = {
+        "A1": {"name": "Ann", "records": [], "history": [{"title": "Falls", "body": "Two falls this month, then delirium."}],
+               "notes": [{"title": "Plan", "body": "Physio referral."}]},
+        "B2": {"name": "Bob", "records": [], "history": [{"title": "Review", "body": f"One fall at home. {filler}"}],
+               "symptom_snapshots": [{"text": "Confused and delirious overnight", "result": {}, "timestamp": "2025-01-01"}]},
+        "C3": {"name": "Cas", "records": [], "notes": [{"title": "Renal", "body": "Stable creatinine."}]},
+    }
+    m.get_store().write_all(d)
+    m.DATASTORE.invalidate()
+
+    hits = fulltext.search_text("falls")
+    assert [(h["mcp"], h["section"], h["index"]) for h in hits] == [("A1", "history", 0), ("B2", "history", 0)]
+    assert hits[0]["score"] > hits[1]["score"] and hits[0]["title"] == "Falls"
+    assert {h["mcp"] for h in fulltext.search_text("delir*")} == {"A1", "B2"}
+    assert fulltext.search_text("the of") == [] and fulltext.search_text("zebra") == []
+
+    # saves re-index only the touched patient; the index is not rebuilt
+    index = fulltext.text_index()
+    monkeypatch.setattr(index, "rebuild", lambda store: (_ for _ in ()).throw(AssertionError("rebuilt")))
+    m.DATASTORE.append_entry("C3", "notes", {"title": "Fall", "body": "Fell in the ward.", "timestamp": "x"})
+    m.DATASTORE.update_entry("A1", "history", 0, {"title": "Walking", "body": "Steady gait."})
+    m.DATASTORE.flush()
+    assert [(h["mcp"], h["section"], h["index"]) for h in fulltext.search_text("fall")] == [("C3", "notes", 1), ("B2", "history", 0)]
+    m.DATASTORE.delete_patient("B2")
+    assert {h["mcp"] for h in fulltext.search_text("fall delirious")} == {"C3"}
+    # BM25 statistics are maintained in meta rather than counted per query
+    assert index._stats() == index._conn.execute("SELECT COUNT(*), SUM(length) FROM docs").fetchone()
+    m.close_store()
+
+
+def test_text_index_is_rebuilt_after_write_all(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "journal")
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "d.json"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    monkeypatch.setattr(fulltext, "TEXT_INDEX_FILE", str(tmp_path / "text.sqlite3"))
+    store = m.get_store()
+    store.write_all({"A1": {"name": "Ann", "records": [], "notes": [{"title": "x", "body": "cough"}]}})
+    assert [h["mcp"] for h in fulltext.search_text("cough")] == ["A1"]
+    store.write_all({"B2": {"name": "Bob", "records": [], "notes": [{"title": "x", "body": "cough"}]}})
+    assert [h["mcp"] for h in fulltext.search_text("cough")] == ["B2"]
+    m.close_store()
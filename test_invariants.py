@@ -19,3 +19,26 @@ def test_constants_and_ghi():
     dsav = [impairments[i]*m.DOMAIN_VALUES[i] for i in range(27)]
     ghi = round(sum(dsav)/27, 4)
     assert isinstance(ghi, float)
+
+def test_vectorized_scoring_matches_formula():
+    m = _import_any()
+    import numpy as np
+    rng = np.random.default_rng(0)
+    imp = rng.integers(0, 6, size=(200, 27), dtype=np.uint8)
+    dsavs, ghi = m.score_impairments(imp)
+    assert dsavs.shape == (200, 27) and ghi.shape == (200,)
+    for row, d, g in zip(imp.tolist(), dsavs.tolist(), ghi.tolist()):
+        expected = [row[i]*m.DOMAIN_VALUES[i] for i in range(27)]
+        assert d == expected
+        assert g == round(sum(expected)/27, 4)
+    assert m.score_record([5]*27) == ([5*v for v in m.DOMAIN_VALUES], round(5*sum(m.DOMAIN_VALUES)/27, 4))
+
+def test_symptom_matcher_matches_whole_words():
+    m = _import_any()
+    res = m.analyze_symptoms("Rash on both arms;\nchest\npain and shortness of breath on exertion. Painful? No. RA flare.")
+    assert res["keywords_found"] == ["chest pain", "pain", "ra", "rash", "shortness of breath", "shortness of breath on exertion"]
+    votes = {s["domain_index"]: s["votes"] for s in res["suggestions"]}
+    assert votes == {0: 2, 1: 1, 7: 1, 15: 1, 26: 1}
+    assert m.analyze_symptoms("Sprained ankle, brain MRI, drain site clean")["keywords_found"] == []
+    matcher = m.PhraseMatcher(["a b c", "b", "b c d", "c"])
+    assert list(matcher.scan("A B C D x b")) == ["b", "a b c", "c", "b c d", "b"]
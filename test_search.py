@@ -0,0 +1,128 @@
+import pytest
+
+from nlghi import core as m
+from nlghi import search
+
+
+def _linear(entries, q):
+    q = q.lower()
+    return {mcp for mcp, e in entries.items()
+            if q in mcp.lower() or q in e["name"].lower() or any(q in t.lower() for t in e.get("tags", []))}
+
+
+def test_search_index_matches_linear_scan_and_follows_writes(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "s.sqlite3"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    monkeypatch.setattr(search._SEARCH, "value", None)
+    names = ["Ann Walsh", "Émile O'Brien", "Zoë Power", "Li Ryan", "Mary Ann Kelly"]
+    d = {f"NL{i:05d}": {"name": f"{names[i % 5]} {i}", "records": [], "tags": [["Frailty"], ["renal", "falls"], []][i % 3]} for i in range(300)}
+    m.get_store().write_all(d)
+    m.DATASTORE.invalidate()
+
+    ix = search.search_index()
+    assert ix.search("  ") is None
+    for q in ["ann", "ANN W", "o'b", "zoë", "nl0012", "7", "an", "frail", "ll", "xyz", "s 1"]:
+        assert ix.search(q) == _linear(d, q), q
+
+    m.DATASTORE.append_entry("NEW1", "records", {"session_date": "2025-01-01", "ghi": 0.0}, name="Quentin Quux")
+    m.DATASTORE.set_tags("NL00001", ["diabetes"])
+    m.DATASTORE.delete_patient("NL00002")
+    assert search.search_index() is ix  # updated in place, not rebuilt
+    assert ix.search("quux") == {"NEW1"} and ix.search("diab") == {"NL00001"}
+    assert "NL00001" not in ix.search("renal") and ix.search("nl00002") == set()
+    m.close_store()
+
+
+def _visit(day, imp):
+    dsavs, ghi = m.score_record(imp)
+    return {"session_date": day, "impairments": imp, "dsavs": dsavs, "ghi": ghi}
+
+
+def test_structured_queries_over_columns(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "q.sqlite3"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    monkeypatch.setattr(search._SEARCH, "value", None)
+    monkeypatch.setattr(search._COLUMNS, "value", None)
+    renal = m.DOMAIN_LIST.index("Renal")
+    severe_renal = [0] * 27; severe_renal[renal] = 4
+    m.get_store().write_all({
+        "A": {"name": "Ann", "age": 81, "tags": ["Frailty"], "records": [_visit("2024-03-01", [1] * 27), _visit("2024-09-01", severe_renal)]},
+        "B": {"name": "Bob", "age": 70, "tags": ["frailty", "falls"], "records": [_visit("2025-02-01", [3] * 27)],
+              "future_refs": [{"title": "x", "due": "2025-03-01", "done": False}]},
+        "C": {"name": "Cy", "age": 90, "tags": [], "records": []},
+    })
+    m.DATASTORE.invalidate()
+    q = search.query_patients
+    ghi_a, ghi_b = m.score_record(severe_renal)[1], m.score_record([3] * 27)[1]
+
+    assert q("") is None
+    assert q("tag:frailty") == {"A", "B"} and q("-tag:frailty") == {"C"} and q("tag:falls") == {"B"}
+    assert q(f"ghi>{ghi_a}") == {"B"} and q(f"ghi<={ghi_a}") == {"A"}  # C has no GHI
+    assert q("last_visit<2025-01-01") == {"A"} and q("visits=0") == {"C"} and q("pending>0") == {"B"}
+    assert q("domain:Renal>=3") == {"A", "B"} and q("domain:renal>3") == {"A"} and q("domain:Cardio") == {"B"}
+    assert q('domain:"Social well-being">=3') == {"B"}
+    assert q("tag:frailty age>=80 domain:Renal>=3") == {"A"}
+    assert q(f"ghi>={ghi_b}") == {"B"}
+    assert q("age>85 OR bo") == {"B", "C"} and q("ann -tag:falls") == {"A"}
+    for bad in ("domain:Mental>=2", "ghi>high", "last_visit<soon", "tag:x>2"):
+        with pytest.raises(search.QueryError):
+            q(bad)
+
+    m.DATASTORE.append_entry("E", "records", _visit("2024-04-01", [0] * 27), name="Seán O'Brien")
+    assert q("O'Brien") == q("o'brien") == q("o'b") == {"E"} and q("sean OR o'brien") == {"E"}
+    assert q("colour:red") == q("a=b") == q('name:"open') == set()  # unknown filters are plain words
+    assert q("colour:red OR ann") == {"A"}
+
+    cols = search.patient_columns()
+    m.DATASTORE.append_entry("C", "records", _visit("2025-05-01", severe_renal))
+    m.DATASTORE.set_tags("C", ["frailty"])
+    m.DATASTORE.append_entry("D", "records", _visit("2025-06-01", [5] * 27), name="Di")
+    m.DATASTORE.delete_patient("B")
+    assert search.patient_columns() is cols  # patched per patient, not rebuilt
+    assert q("tag:frailty domain:Renal>3") == {"A", "C"} and q("domain:Renal=5") == {"D"} and q("pending>0") == set()
+    assert q("last_visit>=2025-01-01") == {"C", "D"}
+    m.close_store()
+
+
+def test_tag_algebra_and_facets(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "t.sqlite3"))
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+    monkeypatch.setattr(m, "_STORE", None)
+    monkeypatch.setattr(search._SEARCH, "value", None)
+    monkeypatch.setattr(search._COLUMNS, "value", None)
+    pool = ["Frailty", "diabetes", "palliative", "falls"]
+    tags = {f"P{i:03d}": [t for j, t in enumerate(pool) if i >> j & 1] for i in range(40)}
+    m.get_store().write_all({mcp: {"name": f"N {mcp}", "records": [], "tags": t} for mcp, t in tags.items()})
+    m.DATASTORE.invalidate()
+
+    def has(t): return {mcp for mcp, ts in tags.items() if t in (x.lower() for x in ts)}
+    def facets(mcps): return {t: len(has(t) & mcps) for t in ("frailty", "diabetes", "palliative", "falls", "hospice") if has(t) & mcps}
+    q = search.query_patients
+
+    def check():
+        assert q("tag:frailty AND tag:diabetes NOT tag:palliative") == (has("frailty") & has("diabetes")) - has("palliative")
+        assert q("tag:falls OR NOT tag:diabetes") == has("falls") | (set(tags) - has("diabetes"))
+        assert q("NOT NOT tag:falls") == has("falls")
+        assert search.tag_facets() == facets(set(tags))
+        assert search.tag_facets("tag:falls -tag:frailty") == facets(has("falls") - has("frailty"))
+        assert list(search.tag_facets()) == sorted(facets(set(tags)), key=lambda t: (-facets(set(tags))[t], t))
+
+    assert search.tag_facets() == facets(set(tags))  # counted from the registry, columns not built yet
+    check()
+    for bad in ("tag:falls NOT", "NOT OR tag:falls"):
+        with pytest.raises(search.QueryError):
+            q(bad)
+    for mcp, new in [("P001", ["Palliative"]), ("P002", []), ("P003", ["hospice"]), ("P015", ["hospice"])]:
+        m.DATASTORE.set_tags(mcp, new); tags[mcp] = new
+    check()
+    m.DATASTORE.set_tags("P003", []); m.DATASTORE.set_tags("P015", []); tags["P003"] = tags["P015"] = []
+    assert "hospice" not in search.tag_facets()
+    m.close_store()
@@ -0,0 +1,426 @@
+import json
+import shutil
+
+import pytest
+
+from nlghi import core as m
+
+
+@pytest.fixture(autouse=True)
+def _own_mutation_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(m, "MUTATION_LOG", str(tmp_path / "mutations.jsonl"))
+
+
+def _sample():
+    return {
+        "A1": {"name": "Ann", "dob": "1940-01-01", "age": 85, "gender": "Female",
+               "records": [{"session_date": "2025-01-01", "impairments": [0]*27, "dsavs": [0]*27, "ghi": 0.0}],
+               "tags": ["frailty"], "history": [{"title": "h", "body": "falls", "timestamp": "t"}],
+               "notes": [], "future_refs": [], "symptom_snapshots": [], "attachments": []},
+    }
+
+
+def test_sqlite_migrate_and_row_ops(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    src = tmp_path / "data.json"; src.write_text(json.dumps(_sample()))
+    db = str(tmp_path / "data.sqlite3")
+    assert m.migrate_json_to_sqlite(str(src), db) == 1
+
+    store = m.SqlitePatientStore(db)
+    assert store.read_all() == _sample()
+    assert store.list_patients()["A1"]["tags"] == ["frailty"]
+
+    store.append_entry("A1", "notes", {"title": "n", "body": "x"})
+    store.update_entry("A1", "notes", 0, {"body": "y"})
+    store.set_tags("A1", ["diabetes", "frailty"])
+    store.append_entry("B2", "history", {"title": "new", "body": "b"})
+    assert store.get_section("A1", "notes") == [{"title": "n", "body": "y"}]
+    assert store.get_patient("A1", sections=())["tags"] == ["diabetes", "frailty"]
+
+    store.remove_entry("A1", "history", 0)
+    store.delete_patient("B2")
+    d = store.read_all()
+    assert list(d) == ["A1"] and d["A1"]["history"] == []
+    store.close()
+
+
+def test_apply_op_matches_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    ops = [
+        {"op": "ensure", "mcp": "X", "name": "Xe", "gender": "Male", "dob": "1950-02-02", "age": 75},
+        {"op": "append", "mcp": "X", "section": "future_refs", "entry": {"title": "f", "done": False}},
+        {"op": "update", "mcp": "X", "section": "future_refs", "index": 0, "fields": {"done": True}},
+        {"op": "set_tags", "mcp": "X", "tags": ["a"]},
+    ]
+    d = {}
+    store = m.SqlitePatientStore(str(tmp_path / "ops.sqlite3"))
+    for op in ops:
+        m.apply_op(d, op); store.apply(op)
+    assert store.read_all() == d
+    store.close()
+
+
+def test_journal_replay_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    base = tmp_path / "data.json"; base.write_text(json.dumps(_sample()))
+    store = m.JournalPatientStore(str(base))
+    store.append_entry("A1", "notes", {"title": "n", "body": "x"})
+    store.set_tags("A1", ["frailty", "renal"])
+    store.flush()
+    assert json.loads(base.read_text()) == _sample()  # base untouched until compaction
+
+    expected = json.loads(json.dumps(store.read_all()))
+    crash = tmp_path / "crash"; crash.mkdir()  # simulate a crash: copy files without closing
+    shutil.copy(base, crash / "data.json"); shutil.copy(str(base) + ".journal", crash / "data.json.journal")
+    reopened = m.JournalPatientStore(str(crash / "data.json"))
+    assert reopened.read_all() == expected
+    reopened.close()
+
+    store._compact()
+    assert json.loads(base.read_text()) == expected
+    assert not (tmp_path / "data.json.journal").read_text()
+    store.close()
+
+
+def test_datastore_caches_until_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    (tmp_path / "data.json").write_text(json.dumps(_sample()))
+    parses = []
+    real_read = m.read_data
+    monkeypatch.setattr(m, "read_data", lambda: parses.append(1) or real_read())
+
+    ds = m.DataStore()
+    for _ in range(5):
+        assert ds.get_section("A1", "history")[0]["body"] == "falls"
+    assert list(ds.list_patients()) == ["A1"] and len(parses) == 0  # served from the offset index
+
+    ds.set_tags("A1", ["renal"])  # own writes patch the cache
+    assert ds.list_patients()["A1"]["tags"] == ["renal"] and len(parses) == 1
+
+    changed = _sample(); changed["B2"] = {"name": "Bo", "records": []}
+    (tmp_path / "data.json").write_text(json.dumps(changed))  # external edit
+    assert sorted(ds.list_patients()) == ["A1", "B2"]
+
+
+def test_write_behind_coalesces_into_one_write(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setitem(m.SETTINGS, "write_behind_ms", 500)
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    (tmp_path / "data.json").write_text(json.dumps(_sample()))
+    writes = []
+    real_write = m.atomic_write_text
+    monkeypatch.setattr(m, "atomic_write_text", lambda p, t: p.endswith("data.json") and writes.append(p) or real_write(p, t))
+
+    ds = m.DataStore(); scheduled = []
+    ds.on_dirty = lambda: scheduled.append(1)
+    for i in range(10):
+        ds.append_entry("A1", "notes", {"title": str(i), "body": "x"})
+    ds.set_tags("N9", ["new"])
+    assert ds.dirty == {"A1", "N9"} and len(scheduled) == 11 and not writes
+    assert len(ds.get_section("A1", "notes")) == 10  # reads see buffered writes
+    assert ds.list_patients()["N9"]["tags"] == ["new"]
+
+    ds.flush()
+    assert len(writes) == 1 and not ds.dirty
+    on_disk = json.loads((tmp_path / "data.json").read_text())
+    assert len(on_disk["A1"]["notes"]) == 10 and on_disk["N9"]["tags"] == ["new"]
+
+
+def test_sharded_store_touches_one_shard(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    root = tmp_path / "patients"
+    store = m.ShardedPatientStore(str(root))
+    data = _sample(); data["B/2"] = {"name": "Bo", "records": [], "tags": []}
+    store.write_all(data)
+    assert sorted(p.name for p in root.iterdir()) == ["A1.json", "B%2F2.json", "manifest.json"]
+
+    before = (root / "B%2F2.json").stat().st_mtime_ns
+    store.append_entry("A1", "records", {"session_date": "2025-02-01", "ghi": 1.5})
+    assert (root / "B%2F2.json").stat().st_mtime_ns == before
+    assert store.list_patients()["A1"]["record_count"] == 2
+    assert store.list_patients()["A1"]["latest_ghi"] == 1.5
+
+    (root / "manifest.json").unlink()  # manifest is rebuilt from the shards
+    reopened = m.ShardedPatientStore(str(root))
+    assert reopened.list_patients() == store.list_patients()
+    store.delete_patient("B/2")
+    assert store.read_all().keys() == {"A1"} and not (root / "B%2F2.json").exists()
+
+
+def test_json_registry_index_and_bounded_lru(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setitem(m.SETTINGS, "patient_cache_size", 2)
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    d = {f"P{i}": {"name": f"n{i}", "records": [{"ghi": i}], "tags": []} for i in range(5)}
+    m.write_data(d)
+    monkeypatch.setattr(m, "read_data", lambda: (_ for _ in ()).throw(AssertionError("full parse")))
+
+    ds = m.DataStore()
+    assert list(ds.list_patients()) == list(d)
+    for i in range(5):
+        assert ds.get_section(f"P{i}", "records") == [{"ghi": i}]
+    assert list(ds._patients) == ["P3", "P4"]
+
+
+def test_chunked_backups_dedupe_and_restore(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setitem(m.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    monkeypatch.setitem(m.SETTINGS, "backups_to_keep", 2)
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    clock = iter(range(10, 60))
+    monkeypatch.setattr(m, "datetime", type("dt", (m.datetime,), {"now": classmethod(lambda cls: m.datetime(2025, 1, 1, 0, 0, next(clock)))}))
+    d = {f"P{i}": {"name": f"n{i}", "records": [{"ghi": i}], "tags": []} for i in range(5)}
+    m.write_data(d)
+    chunks = lambda: len(list((tmp_path / "backups" / "chunks").rglob("*.json.gz")))
+
+    first = m.make_backup(wait=True)
+    assert first.endswith(".manifest") and chunks() == 5
+    m.get_store().set_tags("P0", ["renal"])
+    second = m.make_backup(wait=True)
+    assert chunks() == 6  # only the changed patient is stored again
+    assert m.read_backup(first) == d and m.read_backup(second)["P0"]["tags"] == ["renal"]
+
+    m.restore_backup(first)
+    assert m.get_store().read_all() == d
+    m.make_backup(wait=True)  # prunes the first manifest; its orphaned P0 chunk goes too
+    assert m.list_backups()[0] == second and chunks() == 6
+    m.get_store().set_tags("P1", ["x"]); m.make_backup(wait=True)
+    assert chunks() == 6
+
+
+def test_compressed_full_backup_written_in_background(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setitem(m.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    monkeypatch.setitem(m.SETTINGS, "backup_mode", "full")
+    monkeypatch.setitem(m.SETTINGS, "backup_compression", "lzma")
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    m.write_data(_sample())
+
+    path = m.make_backup()
+    m.get_store().delete_patient("A1")  # safe: the snapshot was captured before returning
+    m.wait_for_backups()
+    assert path.endswith(".json.xz") and m.backup_status()[-1]["state"] == "done"
+    m.restore_backup(path)
+    assert m.get_store().read_all() == _sample()
+
+
+def test_point_in_time_recovery_replays_mutations(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setitem(m.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "data.sqlite3"))
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    now = [m.datetime(2025, 1, 1, 9, 0, 0)]
+    monkeypatch.setattr(m, "datetime", type("dt", (m.datetime,), {"now": classmethod(lambda cls: now[0])}))
+    at = lambda minute: m.datetime(2025, 1, 1, 9, minute, 0)
+
+    m.get_store().write_all(_sample())
+    now[0] = at(1); m.make_backup(wait=True)
+    now[0] = at(2); m.DATASTORE.append_entry("A1", "notes", {"title": "a"})
+    now[0] = at(3); m.DATASTORE.append_entry("A1", "notes", {"title": "b"})
+    now[0] = at(4); m.DATASTORE.delete_patient("A1")
+
+    assert [n["title"] for n in m.recover_dataset(at(3))["A1"]["notes"]] == ["a", "b"]
+    m.restore_to_time(at(2))
+    assert m.DATASTORE.get_section("A1", "notes") == [{"title": "a"}]
+    with pytest.raises(ValueError):
+        m.recover_dataset(at(0))  # nothing was backed up yet
+    m.close_store()
+
+
+def test_backup_catalog_and_gfs_retention(tmp_path, monkeypatch):
+    entries = [{"file": f"b{h}", "created": m.datetime(2025, 1, 1, 0, 30).replace(day=1 + h // 24, hour=h % 24).isoformat()} for h in range(24 * 10)]
+    keep = m.retained_backups(entries, 2, {"hourly": 3, "daily": 4})
+    assert keep == {"b239", "b238", "b237", "b215", "b191", "b167"}
+
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setitem(m.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    m.write_data(_sample())
+    path = m.make_backup(wait=True)
+    monkeypatch.setattr(m.os, "listdir", lambda p: (_ for _ in ()).throw(AssertionError("scan")))
+    (entry,) = m.load_catalog()
+    assert m.list_backups() == [path] and entry["patients"] == 1
+    assert entry["sha256"] == m.hashlib.sha256(open(path, "rb").read()).hexdigest()
+
+
+def test_verify_backups_flags_corruption(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setitem(m.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    clock = iter(range(10, 60))
+    monkeypatch.setattr(m, "datetime", type("dt", (m.datetime,), {"now": classmethod(lambda cls: m.datetime(2025, 1, 1, 0, 0, next(clock)))}))
+    d = _sample(); d["B2"] = {"name": "Bo", "records": [], "tags": []}
+    m.write_data(d)
+    full = (monkeypatch.setitem(m.SETTINGS, "backup_mode", "full"), m.make_backup(wait=True))[1]
+    monkeypatch.setitem(m.SETTINGS, "backup_mode", "chunked")
+    older = m.make_backup(wait=True)
+    m.get_store().set_tags("A1", ["renal"])
+    newest = m.make_backup(wait=True)
+
+    (digest,) = [dg for mcp, dg in json.load(open(newest))["patients"] if mcp == "A1"]
+    chunk = next((tmp_path / "backups" / "chunks").rglob(digest + ".*"))
+    chunk.write_bytes(m.gzip.compress(b'{"tampered": true}'))
+
+    results = list(m.verify_backups(workers=2))
+    assert [r["path"] for r in results] == [newest, older, full]
+    assert results[0]["errors"] == ["patient A1: checksum mismatch"]
+    assert results[1]["ok"] and results[2]["ok"]
+
+
+def test_validation_cache_rechecks_only_changed_patients(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "json")
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "_STORE", None)
+    d = {f"P{i}": {"name": "", "records": [{"session_date": "2025-01-01", "impairments": [1] * 27, "dsavs": [0] * 27, "ghi": m.score_record([1] * 27)[1]}]} for i in range(50)}
+    d["P7"]["records"].append({"session_date": "2025-02-01", "impairments": [1] * 26, "dsavs": [], "ghi": "x"})
+    m.write_data(d)
+    cache = m.ValidationCache()
+
+    n, issues, rechecked = cache.run(m.get_store())
+    assert (n, rechecked) == (50, 50)
+    assert issues == ["[P7] record 1: impairments len=26 != 27", "[P7] record 1: dsavs len=0 != 27", "[P7] record 1: error recomputing GHI"]
+    assert issues == m.validate_dataset(d)
+
+    m.get_store().update_entry("P3", "records", 0, {"ghi": 9.0})
+    n, issues, rechecked = cache.run(m.get_store())
+    assert rechecked == 1 and issues[0] == f"[P3] record 0: GHI mismatch 9.0 vs {m.score_record([1] * 27)[1]}"
+    assert len(issues) == 4
+
+
+def test_parallel_validation_streams_extended_checks(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    d = {f"P{i}": {"name": "", "dob": "1940-01-01", "records": [{"session_date": "2025-01-01", "impairments": [0] * 27, "dsavs": [0] * 27, "ghi": 0.0}],
+                   "future_refs": [{"title": "t", "due": "2025-03-01", "done": False}]} for i in range(30)}
+    d["P4"]["dob"] = "01/02/1940"
+    d["P9"]["records"][0]["session_date"] = "2025-13-01"
+    d["P20"]["future_refs"] += ["call back", {"title": "", "due": "2025-01-01"}, {"title": "x", "due": None}, {"title": "x", "due": "2025-01-01", "done": "no"}]
+    store = m.SqlitePatientStore(str(tmp_path / "v.sqlite3")); store.write_all(d)
+
+    progress, issues = [], []
+    for done, total, lines in m.validate_parallel(store, workers=2, partition=8):
+        progress.append((done, total)); issues += lines
+    assert progress[0] == (0, 30) and progress[-1] == (30, 30) and len(progress) == 5
+    assert sorted(issues) == sorted(m.validate_dataset(d)) == sorted([
+        "[P4] bad dob '01/02/1940'",
+        "[P9] record 0: bad session_date '2025-13-01'",
+        "[P20] future_ref 1: not an object (str)",
+        "[P20] future_ref 2: missing title",
+        "[P20] future_ref 3: bad due date None",
+        "[P20] future_ref 4: done is not true/false ('no')",
+    ])
+    assert m.VALIDATION_CACHE.run(store)[2] == 0  # the parallel pass warmed the cache
+
+    cancel = m.threading.Event(); cancel.set()
+    assert [p for p, _, _ in m.validate_parallel(store, workers=2, partition=8, cancel=cancel)] == [0]
+    store.close()
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "sharded", "journal", "json"])
+def test_registry_summaries_maintained_by_every_engine(tmp_path, monkeypatch, backend):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", backend)
+    monkeypatch.setattr(m, "DATA_FILE", str(tmp_path / "data.json"))
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "data.sqlite3"))
+    monkeypatch.setattr(m, "PATIENTS_DIR", str(tmp_path / "patients"))
+    monkeypatch.setattr(m, "_STORE", None)
+    m.get_store().write_all(_sample())
+    ds = m.DataStore()
+    assert ds.list_patients()["A1"] == dict(m.patient_header(_sample()["A1"]), record_count=1, last_visit="2025-01-01", latest_ghi=0.0, pending_refs=0)
+
+    ds.append_entry("A1", "records", {"session_date": "2024-06-01", "ghi": 2.5})  # entered late, dated earlier
+    ds.append_entry("A1", "future_refs", {"title": "eye clinic", "due": "2025-09-01", "done": False})
+    ds.append_entry("A1", "future_refs", {"title": "labs", "due": "2025-10-01", "done": False})
+    ds.append_entry("N1", "records", {"session_date": "not a date", "ghi": 1.0}, name="Ned")
+    assert ds.list_patients()["A1"]["record_count"] == 2 and ds.list_patients()["A1"]["pending_refs"] == 2
+    ds.update_entry("A1", "future_refs", 0, {"done": True})
+    ds.remove_entry("A1", "records", 0)
+
+    fresh = m.DataStore()  # straight from the engine's materialized registry
+    for reg in (ds.list_patients(), fresh.list_patients(), m.get_store().list_patients()):
+        assert {k: reg["A1"][k] for k in m.SUMMARY_FIELDS} == {"record_count": 1, "last_visit": "2024-06-01", "latest_ghi": 2.5, "pending_refs": 1}
+        assert {k: reg["N1"][k] for k in m.SUMMARY_FIELDS} == {"record_count": 1, "last_visit": "", "latest_ghi": 1.0, "pending_refs": 0}
+    assert fresh.list_patients() == {mcp: m.registry_entry(p) for mcp, p in m.get_store().read_all().items()}
+    m.close_store()
+
+
+def test_sqlite_summary_columns_backfilled_on_open(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    import sqlite3
+    path = str(tmp_path / "old.sqlite3")
+    store = m.SqlitePatientStore(path); store.write_all(_sample()); store.close()
+    conn = sqlite3.connect(path)
+    for col, _ in m._SQL_SUMMARY_COLUMNS: conn.execute(f"ALTER TABLE patients DROP COLUMN {col}")
+    conn.commit(); conn.close()
+    store = m.SqlitePatientStore(path)
+    assert store.list_patients()["A1"]["last_visit"] == "2025-01-01" and store.list_patients()["A1"]["record_count"] == 1
+    store.close()
+
+
+def test_mutation_log_is_bounded_without_auto_backup(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setitem(m.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    monkeypatch.setitem(m.SETTINGS, "mutation_log_max_kb", 8)
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "data.sqlite3"))
+    monkeypatch.setattr(m, "_STORE", None)
+    log = tmp_path / "mutations.jsonl"
+
+    for i in range(200):  # no snapshot to replay from: nothing is worth keeping
+        m.DATASTORE.append_entry("A1", "notes", {"title": f"note {i}", "body": "x" * 40})
+    assert log.stat().st_size <= 8 * 1024
+
+    m.DATASTORE.append_entry("A1", "notes", {"title": "before"})
+    path = m.make_backup(wait=True)
+    ops = list(m.iter_mutations())
+    assert ops[0]["op"] == "backup" and ops[0]["path"] == path  # trimmed on backup, not only on prune
+    for i in range(200):
+        m.DATASTORE.append_entry("A1", "notes", {"title": f"after {i}", "body": "x" * 40})
+        assert log.stat().st_size <= 8 * 1024
+    m.close_store()
+
+
+def test_write_all_is_logged_as_a_snapshot_not_a_copy(tmp_path, monkeypatch):
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", True)
+    monkeypatch.setitem(m.SETTINGS, "storage_backend", "sqlite")
+    monkeypatch.setitem(m.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    monkeypatch.setattr(m, "DB_FILE", str(tmp_path / "data.sqlite3"))
+    monkeypatch.setattr(m, "_STORE", None)
+    now = [m.datetime(2025, 1, 1, 9, 0, 0)]
+    monkeypatch.setattr(m, "datetime", type("dt", (m.datetime,), {"now": classmethod(lambda cls: now[0])}))
+    at = lambda minute: m.datetime(2025, 1, 1, 9, minute, 0)
+
+    m.get_store().write_all(_sample()); m.wait_for_backups()
+    now[0] = at(1); m.DATASTORE.append_entry("A1", "notes", {"title": "a"})
+    m.get_store()._backed_up = False  # as in a new session: snapshot before and after the same write
+    now[0] = at(2); m.get_store().write_all({"B2": dict(_sample()["A1"], name="Bo")}); m.wait_for_backups()
+    now[0] = at(3); m.DATASTORE.append_entry("B2", "notes", {"title": "b"})
+    ops = list(m.iter_mutations())
+    assert "replace_all" not in {op["op"] for op in ops} and all("data" not in op for op in ops)
+    assert set(m.recover_dataset(at(3))) == {"B2"} and m.recover_dataset(at(3))["B2"]["notes"] == [{"title": "b"}]
+    assert m.recover_dataset(at(1))["A1"]["notes"] == [{"title": "a"}]
+    assert len(m.list_backups()) == 3 and m.read_backup(m.list_backups()[1])["A1"]["notes"] == [{"title": "a"}]
+
+    monkeypatch.setitem(m.SETTINGS, "auto_backup", False)
+    now[0] = at(4); m.get_store().write_all(_sample())
+    assert list(m.iter_mutations())[-1] == {"op": "replace_all", "mcp": "", "ts": at(4).isoformat()}
+    with pytest.raises(ValueError):
+        m.recover_dataset(at(5))  # no snapshot of what write_all() stored
+    m.close_store()